@@ -0,0 +1,3 @@
+"""
+Benchmarks e teste de carga do bot (servidores falsos + gerador de carga)
+"""
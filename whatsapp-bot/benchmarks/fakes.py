@@ -0,0 +1,334 @@
+"""
+Servidores HTTP falsos para benchmarks: API Astra, Evolution API, Twilio e
+coletor de spans
+
+Uso standalone (para apontar um bot já em execução):
+
+    python -m benchmarks.fakes --api-port 8081 --evolution-port 8082 --twilio-port 8083
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+Route = Tuple[str, 're.Pattern', Callable]
+
+
+def digits(number: str) -> str:
+    """Normaliza 'whatsapp:+55...', '55...@s.whatsapp.net' etc. para só dígitos"""
+    return re.sub(r'\D', '', number.split('@')[0])
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class FakeServer:
+    """Servidor HTTP em thread própria com rotas (método, regex) e latência simulada"""
+
+    def __init__(self, port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.routes: List[Route] = []
+        self.requests = 0
+        self.traced_requests = 0
+        self._lock = threading.Lock()
+        self.httpd = _Server(('127.0.0.1', port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def route(self, method: str, pattern: str, func: Callable):
+        self.routes.append((method, re.compile(f'^{pattern}$'), func))
+
+    def start(self) -> 'FakeServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True,
+                                        name=f'{type(self).__name__}')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _delay(self):
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, como os serviços reais
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                with server._lock:
+                    server.requests += 1
+                    if self.headers.get('traceparent'):
+                        server.traced_requests += 1
+                for method, pattern, func in server.routes:
+                    match = pattern.match(parsed.path)
+                    if method == self.command and match:
+                        server._delay()
+                        status, body = func(match, parse_qs(parsed.query), raw, self.headers)
+                        break
+                else:
+                    status, body = 404, {'error': 'not found'}
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+        return Handler
+
+
+class FakeAstraAPI(FakeServer):
+    """
+    API backend em memória com as rotas usadas pelo APIClient
+
+    Horários livres: de hora em hora entre `open_hour` e `close_hour`, menos
+    os já agendados.
+    """
+
+    def __init__(self, port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 open_hour: int = 8, close_hour: int = 18):
+        super().__init__(port, latency_ms, jitter_ms)
+        self.open_hour = open_hour
+        self.close_hour = close_hour
+        self.customers: Dict[str, Dict] = {}
+        self.customers_by_phone: Dict[str, Dict] = {}
+        self.appointments: Dict[str, Dict] = {}
+        self.booked = set()
+        self._data_lock = threading.Lock()
+
+        self.route('GET', r'/health', lambda *a: (200, {'status': 'healthy'}))
+        self.route('GET', r'/customers/phone/(?P<phone>[^/]+)', self._get_customer_by_phone)
+        self.route('GET', r'/customers/(?P<id>[^/]+)', self._get_customer)
+        self.route('POST', r'/customers', self._create_customer)
+        self.route('GET', r'/appointments/available', self._available)
+        self.route('GET', r'/appointments/customer/(?P<id>[^/]+)', self._customer_appointments)
+        self.route('GET', r'/appointments', self._window)
+        self.route('POST', r'/appointments', self._create_appointment)
+        self.route('DELETE', r'/appointments/(?P<id>[^/]+)', self._cancel)
+        self.route('PATCH', r'/appointments/(?P<id>[^/]+)/status', self._update_status)
+
+    def seed_customer(self, name: str, phone: str) -> Dict:
+        customer = {'id': str(uuid.uuid4()), 'name': name, 'phone': phone, 'email': None}
+        with self._data_lock:
+            self.customers[customer['id']] = customer
+            self.customers_by_phone[digits(phone)] = customer
+        return customer
+
+    def _get_customer_by_phone(self, match, query, raw, headers):
+        customer = self.customers_by_phone.get(digits(match['phone']))
+        return (200, customer) if customer else (404, {'error': 'not found'})
+
+    def _get_customer(self, match, query, raw, headers):
+        customer = self.customers.get(match['id'])
+        return (200, customer) if customer else (404, {'error': 'not found'})
+
+    def _create_customer(self, match, query, raw, headers):
+        data = json.loads(raw or b'{}')
+        return 201, self.seed_customer(data.get('name', ''), data.get('phone', ''))
+
+    def _available(self, match, query, raw, headers):
+        day = date.fromisoformat(query['date'][0])
+        slots = []
+        for hour in range(self.open_hour, self.close_hour):
+            start = datetime(day.year, day.month, day.day, hour).isoformat()
+            if start not in self.booked:
+                end = datetime(day.year, day.month, day.day, hour, 59).isoformat()
+                slots.append({'startTime': start, 'endTime': end})
+        return 200, slots
+
+    def _window(self, match, query, raw, headers):
+        """
+        GET /appointments como o backend: intervalo só com startDate e
+        endDate (ignora os demais filtros), senão customerId; sem paginação
+        """
+        start = query.get('startDate', [None])[0]
+        end = query.get('endDate', [None])[0]
+        customer_id = query.get('customerId', [None])[0]
+        appointments = list(self.appointments.values())
+        if start and end:
+            return 200, [a for a in appointments if start <= a['scheduledAt'] < end]
+        if customer_id:
+            return 200, [a for a in appointments if a['customerId'] == customer_id]
+        return 200, appointments
+
+    def _customer_appointments(self, match, query, raw, headers):
+        return 200, [a for a in list(self.appointments.values())
+                     if a['customerId'] == match['id']]
+
+    def _create_appointment(self, match, query, raw, headers):
+        data = json.loads(raw or b'{}')
+        # Resposta no formato do AppointmentDto
+        appointment = {'id': str(uuid.uuid4()), 'customerId': data.get('customerId'),
+                       'resourceId': data.get('resourceId'), 'title': data.get('service'),
+                       'scheduledAt': data.get('startTime'), 'endsAt': data.get('endTime'),
+                       'status': 'Scheduled'}
+        with self._data_lock:
+            self.appointments[appointment['id']] = appointment
+            self.booked.add(data.get('startTime'))
+        return 201, appointment
+
+    def _cancel(self, match, query, raw, headers):
+        with self._data_lock:
+            appointment = self.appointments.pop(match['id'], None)
+            if appointment is None:
+                return 404, {'error': 'not found'}
+            self.booked.discard(appointment['scheduledAt'])
+        return 200, dict(appointment, status='Cancelled')
+
+    def _update_status(self, match, query, raw, headers):
+        appointment = self.appointments.get(match['id'])
+        if appointment is None:
+            return 404, {'error': 'not found'}
+        appointment['status'] = json.loads(raw or b'{}').get('status')
+        return 200, appointment
+
+
+class _Inbox:
+    """Mensagens enviadas pelo bot, por destinatário, com espera bloqueante"""
+
+    def __init__(self):
+        self._messages: Dict[str, Deque[Tuple[float, str]]] = defaultdict(deque)
+        self._cond = threading.Condition()
+        self.total = 0
+
+    def put(self, number: str, text: str):
+        with self._cond:
+            self._messages[digits(number)].append((time.perf_counter(), text))
+            self.total += 1
+            self._cond.notify_all()
+
+    def wait_for(self, number: str, timeout: float) -> Optional[Tuple[float, str]]:
+        """Próxima mensagem para o número: (instante de recebimento, texto) ou None"""
+        key = digits(number)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._messages[key]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._messages[key].popleft()
+
+
+class FakeEvolutionAPI(FakeServer):
+    """Evolution API: /message/sendText e /message/sendMedia"""
+
+    def __init__(self, port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 api_key: str = 'bench-key'):
+        super().__init__(port, latency_ms, jitter_ms)
+        self.api_key = api_key
+        self.inbox = _Inbox()
+        self.route('GET', r'/instance/connectionState/(?P<instance>[^/]+)',
+                   lambda match, *a: (200, {'instance': {'instanceName': match['instance'], 'state': 'open'}}))
+        self.route('POST', r'/message/sendText/(?P<instance>[^/]+)', self._send_text)
+        self.route('POST', r'/message/sendMedia/(?P<instance>[^/]+)', self._send_media)
+
+    def _sent(self, headers, number: str, text: str):
+        if headers.get('apikey') != self.api_key:
+            return 401, {'error': 'Unauthorized'}
+        self.inbox.put(number, text)
+        return 201, {'key': {'id': uuid.uuid4().hex.upper(), 'remoteJid': number}, 'status': 'PENDING'}
+
+    def _send_text(self, match, query, raw, headers):
+        data = json.loads(raw or b'{}')
+        return self._sent(headers, data.get('number', ''), data.get('text', ''))
+
+    def _send_media(self, match, query, raw, headers):
+        data = json.loads(raw or b'{}')
+        return self._sent(headers, data.get('number', ''), data.get('caption', ''))
+
+
+class FakeTwilioAPI(FakeServer):
+    """API REST do Twilio: POST /2010-04-01/Accounts/<sid>/Messages.json"""
+
+    def __init__(self, port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        super().__init__(port, latency_ms, jitter_ms)
+        self.inbox = _Inbox()
+        self.route('GET', r'/2010-04-01/Accounts/(?P<sid>[^/.]+)\.json',
+                   lambda match, *a: (200, {'sid': match['sid'], 'status': 'active'}))
+        self.route('POST', r'/2010-04-01/Accounts/(?P<sid>[^/]+)/Messages\.json', self._create)
+
+    def _create(self, match, query, raw, headers):
+        form = {k: v[0] for k, v in parse_qs(raw.decode('utf-8')).items()}
+        self.inbox.put(form.get('To', ''), form.get('Body', ''))
+        return 201, {
+            'sid': 'SM' + uuid.uuid4().hex,
+            'account_sid': match['sid'],
+            'to': form.get('To'),
+            'from': form.get('From'),
+            'body': form.get('Body'),
+            'status': 'queued'
+        }
+
+
+class FakeCollector(FakeServer):
+    """Coletor de spans: POST /v1/spans com {"spans": [...]} (TRACING_EXPORTER=http)"""
+
+    def __init__(self, port: int = 0):
+        super().__init__(port)
+        self.spans: List[Dict] = []
+        self.route('POST', r'/v1/spans', self._collect)
+
+    def _collect(self, match, query, raw, headers):
+        spans = json.loads(raw or b'{}').get('spans', [])
+        with self._lock:
+            self.spans.extend(spans)
+        return 200, {'accepted': len(spans)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidores falsos para benchmarks do bot')
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--evolution-port', type=int, default=8082)
+    parser.add_argument('--twilio-port', type=int, default=8083)
+    parser.add_argument('--api-latency-ms', type=float, default=20.0)
+    parser.add_argument('--api-jitter-ms', type=float, default=10.0)
+    parser.add_argument('--provider-latency-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    servers = [
+        FakeAstraAPI(args.api_port, args.api_latency_ms, args.api_jitter_ms),
+        FakeEvolutionAPI(args.evolution_port, args.provider_latency_ms),
+        FakeTwilioAPI(args.twilio_port, args.provider_latency_ms),
+    ]
+    for server in servers:
+        server.start()
+        print(f"{type(server).__name__}: {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+"""
+Teste de carga do /webhook com conversas de agendamento completas
+
+Sobe a API Astra e o provedor falsos, inicia o bot com gunicorn apontando
+para eles e simula clientes conversando em paralelo (menu -> agendar ->
+nome -> data -> horário -> serviço -> meus agendamentos). Cada etapa espera
+a resposta do bot antes da próxima: no modo inline a resposta vem no
+próprio webhook; no modo background, quando o provedor falso recebe o envio.
+
+    python -m benchmarks.load_test --provider evolution --mode background \\
+        --conversations 200 --concurrency 20 --output results.json
+
+Com --baseline, compara com um resultado anterior e sai com código 1 se o
+p95 ou o throughput piorarem além de --max-regression. Com --trace-rate, o
+bot exporta spans para um coletor falso e o relatório inclui a latência por
+span (api.*, provider.send, session.*...).
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from html import unescape
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from benchmarks.fakes import FakeAstraAPI, FakeCollector, FakeEvolutionAPI, FakeTwilioAPI
+
+BOT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_KEY = 'bench-api-key'
+EVOLUTION_KEY = 'bench-key'
+EVOLUTION_INSTANCE = 'bench'
+TWILIO_SID = 'AC' + '0' * 32
+TWILIO_NUMBER = 'whatsapp:+14155238886'
+
+CONFIRMED = 'Agendamento confirmado'
+NOISE_EVENTS = ('presence.update', 'messages.update', 'chats.update', 'contacts.update')
+
+
+# Estatísticas
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Percentil por nearest-rank (lista já ordenada)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2)  # noqa: E731
+    return {
+        'count': len(values),
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else 0.0,
+        'mean_ms': ms(sum(values) / len(values)) if values else 0.0,
+    }
+
+
+# Bot
+class BotProcess:
+    """
+    Bot apontando para os fakes: gunicorn + Flask (mesmo comando do
+    Dockerfile) ou uvicorn + src.asgi
+    """
+
+    def __init__(self, port: int, workers: int, threads: int, env: Dict[str, str],
+                 server: str = 'wsgi'):
+        self.port = port
+        self.url = f'http://127.0.0.1:{port}'
+        if server == 'asgi':
+            command = [sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(port),
+                       '--workers', str(workers), '--log-level', 'warning', 'src.asgi:app']
+        else:
+            command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+                       '--workers', str(workers), '--timeout', '120']
+            if threads > 1:
+                command += ['--threads', str(threads)]
+            command.append('src.bot:app')
+        self.launched_at = time.perf_counter()
+        self.process = subprocess.Popen(
+            command, cwd=BOT_ROOT, env=dict(os.environ, **env),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+
+    def wait_ready(self, timeout: float = 30.0) -> float:
+        """Aguarda o /health; retorna o tempo desde o lançamento do processo"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Bot encerrou ao iniciar:\n{self.process.stderr.read().decode()}")
+            try:
+                if requests.get(f'{self.url}/health', timeout=1).status_code == 200:
+                    return time.perf_counter() - self.launched_at
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("Bot não respondeu ao /health")
+
+    def startup(self) -> Optional[Dict]:
+        """Fases de inicialização reportadas pelo worker que atender o /stats"""
+        try:
+            return requests.get(f'{self.url}/stats', timeout=5).json().get('startup')
+        except (requests.RequestException, ValueError):
+            return None
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Conversas
+def conversation_script(index: int, returning: bool) -> List[Tuple[str, str]]:
+    """Etapas (nome, texto) de uma conversa de agendamento"""
+    day = date.today() + timedelta(days=1 + index % 14)
+    steps = [('menu', 'oi'), ('agendar', 'agendar')]
+    if not returning:
+        steps.append(('nome', f'Cliente Bench {index}'))
+    steps += [
+        ('data', day.strftime('%d/%m/%Y')),
+        ('horario', str(random.randint(1, 3))),
+        ('servico', 'corte'),
+        ('listar', 'meus agendamentos'),
+    ]
+    return steps
+
+
+class WebhookClient:
+    """Monta e envia webhooks no formato de cada provedor"""
+
+    def __init__(self, bot_url: str, provider: str, mode: str, inbox, reply_timeout: float):
+        self.url = f'{bot_url}/webhook'
+        self.provider = provider
+        self.mode = mode
+        self.inbox = inbox
+        self.reply_timeout = reply_timeout
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, phone: str, text: str) -> requests.Response:
+        message_id = uuid.uuid4().hex.upper()
+        if self.provider == 'evolution':
+            return self.session.post(self.url, headers={'apikey': EVOLUTION_KEY}, json={
+                'event': 'messages.upsert',
+                'instance': EVOLUTION_INSTANCE,
+                'data': {
+                    'key': {'remoteJid': f'{phone}@s.whatsapp.net', 'fromMe': False, 'id': message_id},
+                    'pushName': 'Bench',
+                    'message': {'conversation': text},
+                }
+            }, timeout=60)
+        return self.session.post(self.url, data={
+            'From': f'whatsapp:+{phone}',
+            'To': TWILIO_NUMBER,
+            'Body': text,
+            'MessageSid': 'SM' + message_id.lower(),
+            'ProfileName': 'Bench',
+        }, timeout=60)
+
+    def noise(self, phone: str) -> Tuple[float, int]:
+        """Evento Evolution que não é mensagem (presence/status); (latência, status HTTP)"""
+        event = random.choice(NOISE_EVENTS)
+        started = time.perf_counter()
+        response = self.session.post(self.url, headers={'apikey': EVOLUTION_KEY}, json={
+            'event': event,
+            'instance': EVOLUTION_INSTANCE,
+            'data': {'id': f'{phone}@s.whatsapp.net', 'presences': {}, 'status': 'READ',
+                     'keyId': uuid.uuid4().hex.upper()}
+        }, timeout=60)
+        return time.perf_counter() - started, response.status_code
+
+    def _inline_reply(self, response: requests.Response) -> Optional[str]:
+        if self.provider == 'evolution':
+            return (response.json() or {}).get('reply')
+        match = re.search(r'<Message>(.*?)</Message>', response.text, re.S)
+        return unescape(match.group(1)) if match else None
+
+    def step(self, phone: str, text: str) -> Tuple[float, float, Optional[str], int]:
+        """
+        Envia uma mensagem e espera a resposta
+
+        Returns:
+            (latência do ack HTTP, latência até a resposta, resposta, status HTTP)
+        """
+        started = time.perf_counter()
+        response = self._post(phone, text)
+        acked = time.perf_counter() - started
+        if response.status_code != 200:
+            return acked, acked, None, response.status_code
+        if self.mode == 'inline':
+            return acked, acked, self._inline_reply(response), 200
+        received = self.inbox.wait_for(phone, self.reply_timeout)
+        if received is None:
+            return acked, time.perf_counter() - started, None, 200
+        return acked, received[0] - started, received[1], 200
+
+
+def run_conversation(client: WebhookClient, index: int, returning: bool,
+                     think_time: float, results: Dict, noise: int = 0):
+    phone = f'55119{index:08d}'
+    booked = False
+    for step_name, text in conversation_script(index, returning):
+        try:
+            acked, latency, reply, status = client.step(phone, text)
+        except requests.RequestException as e:
+            results['errors'].append(f'{step_name}: {type(e).__name__}')
+            return
+        with results['lock']:
+            results['steps'].setdefault(step_name, []).append(latency)
+            results['all'].append(latency)
+            results['acks'].append(acked)
+        if status != 200:
+            results['errors'].append(f'{step_name}: HTTP {status}')
+            return
+        if reply is None:
+            results['errors'].append(f'{step_name}: sem resposta')
+            return
+        if step_name == 'servico':
+            booked = CONFIRMED in reply
+            if not booked and len(results['unexpected']) < 5:
+                results['unexpected'].append(reply[:200])
+        for _ in range(noise):
+            try:
+                noise_latency, noise_status = client.noise(phone)
+            except requests.RequestException as e:
+                results['errors'].append(f'evento: {type(e).__name__}')
+                continue
+            with results['lock']:
+                results['noise'].append(noise_latency)
+            if noise_status != 200:
+                results['errors'].append(f'evento: HTTP {noise_status}')
+        if think_time:
+            time.sleep(random.uniform(0, think_time))
+    with results['lock']:
+        results['booked' if booked else 'not_booked'] += 1
+
+
+# Comparação com baseline
+def compare(current: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Regressões de p95 e throughput acima do limite (fração)"""
+    problems = []
+    p95, base_p95 = current['latency']['p95_ms'], baseline['latency']['p95_ms']
+    if base_p95 and p95 > base_p95 * (1 + max_regression):
+        problems.append(f"p95 {p95:.1f} ms > baseline {base_p95:.1f} ms (+{max_regression:.0%})")
+    rps, base_rps = current['throughput']['messages_per_second'], baseline['throughput']['messages_per_second']
+    if base_rps and rps < base_rps * (1 - max_regression):
+        problems.append(f"throughput {rps:.1f} msg/s < baseline {base_rps:.1f} msg/s (-{max_regression:.0%})")
+    if current['errors'] > baseline.get('errors', 0):
+        problems.append(f"erros {current['errors']} > baseline {baseline.get('errors', 0)}")
+    return problems
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BOT_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Teste de carga do webhook do bot')
+    parser.add_argument('--provider', choices=('twilio', 'evolution'), default='evolution')
+    parser.add_argument('--mode', choices=('inline', 'background'), default='inline',
+                        help='WEBHOOK_MODE do bot')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi',
+                        help='gunicorn + src.bot:app ou uvicorn + src.asgi:app')
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--returning-ratio', type=float, default=0.5,
+                        help='Fração de clientes já cadastrados')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='Pausa máxima (s) entre mensagens de uma conversa')
+    parser.add_argument('--workers', type=int, default=2, help='Workers gunicorn')
+    parser.add_argument('--threads', type=int, default=1, help='Threads por worker gunicorn (wsgi)')
+    parser.add_argument('--api-latency-ms', type=float, default=20.0)
+    parser.add_argument('--api-jitter-ms', type=float, default=10.0)
+    parser.add_argument('--provider-latency-ms', type=float, default=50.0)
+    parser.add_argument('--reply-timeout', type=float, default=30.0)
+    parser.add_argument('--event-noise', type=int, default=0,
+                        help='Eventos não-mensagem (presence/status) por etapa, só Evolution')
+    parser.add_argument('--trace-rate', type=float, default=0.0,
+                        help='TRACING_SAMPLE_RATE do bot; spans vão para um coletor falso')
+    parser.add_argument('--bot-env', action='append', default=[], metavar='NOME=VALOR',
+                        help='Variável extra para o bot (pode repetir)')
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    parser.add_argument('--baseline', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    api = FakeAstraAPI(latency_ms=args.api_latency_ms, jitter_ms=args.api_jitter_ms).start()
+    if args.provider == 'evolution':
+        provider = FakeEvolutionAPI(latency_ms=args.provider_latency_ms, api_key=EVOLUTION_KEY).start()
+    else:
+        provider = FakeTwilioAPI(latency_ms=args.provider_latency_ms).start()
+
+    returning = [random.random() < args.returning_ratio for _ in range(args.conversations)]
+    for index, is_returning in enumerate(returning):
+        if is_returning:
+            api.seed_customer(f'Cliente Bench {index}', f'+55119{index:08d}')
+
+    env = {
+        'API_BASE_URL': api.url,
+        'API_KEY': API_KEY,
+        'WHATSAPP_PROVIDER': args.provider,
+        'EVOLUTION_API_URL': provider.url,
+        'EVOLUTION_API_KEY': EVOLUTION_KEY,
+        'EVOLUTION_INSTANCE_NAME': EVOLUTION_INSTANCE,
+        'TWILIO_ACCOUNT_SID': TWILIO_SID,
+        'TWILIO_AUTH_TOKEN': 'bench-token',
+        'TWILIO_WHATSAPP_NUMBER': TWILIO_NUMBER,
+        'TWILIO_API_BASE_URL': provider.url,
+        'WEBHOOK_MODE': args.mode,
+        'PROMETHEUS_MULTIPROC_DIR': tempfile.mkdtemp(prefix='bench-metrics-'),
+        'LOG_LEVEL': 'WARNING',
+        # Os limites de envio (10/s ao provedor, 1/s por destinatário) seguram as
+        # respostas do modo background em ~1 s: o benchmark mediria só o rate limit
+        'OUTBOUND_RATE_PER_SECOND': '0',
+        'OUTBOUND_DESTINATION_RATE_PER_SECOND': '0',
+    }
+    collector = None
+    if args.trace_rate > 0:
+        collector = FakeCollector().start()
+        env.update({'TRACING_SAMPLE_RATE': str(args.trace_rate), 'TRACING_EXPORTER': 'http',
+                    'TRACING_COLLECTOR_URL': f'{collector.url}/v1/spans'})
+    for item in args.bot_env:
+        name, _, value = item.partition('=')
+        env[name] = value
+
+    if args.workers > 1 and env.get('SESSION_BACKEND', 'memory') != 'redis':
+        # Sessões em memória não são compartilhadas: etapas caem em workers diferentes
+        print("Aviso: mais de um worker com sessões em memória; use "
+              "--bot-env SESSION_BACKEND=redis --bot-env REDIS_URL=... para conversas consistentes")
+
+    bot = BotProcess(free_port(), args.workers, args.threads, env, args.server)
+    try:
+        ready_seconds = bot.wait_ready()
+        startup = dict(bot.startup() or {}, ready_seconds=round(ready_seconds, 3))
+        client = WebhookClient(bot.url, args.provider, args.mode, provider.inbox, args.reply_timeout)
+        results = {'lock': threading.Lock(), 'steps': {}, 'all': [], 'acks': [], 'errors': [],
+                   'unexpected': [], 'booked': 0, 'not_booked': 0, 'noise': []}
+        noise = args.event_noise if args.provider == 'evolution' else 0
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_conversation, client, index, is_returning, args.think_time,
+                            results, noise)
+                for index, is_returning in enumerate(returning)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+        if collector is not None:
+            time.sleep(2)  # último lote do exportador (flush a cada 1s)
+    finally:
+        bot.stop()
+        api.stop()
+        provider.stop()
+        if collector is not None:
+            collector.stop()
+
+    spans: Dict[str, List[float]] = {}
+    for span in collector.spans if collector is not None else []:
+        spans.setdefault(span['name'], []).append(span['duration_ms'] / 1000.0)
+
+    messages = len(results['all'])
+    report = {
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'baseline')},
+        'environment': {
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'startup': startup,
+        'duration_seconds': round(elapsed, 3),
+        'throughput': {
+            'messages_per_second': round(messages / elapsed, 2) if elapsed else 0.0,
+            'conversations_per_second': round(args.conversations / elapsed, 2) if elapsed else 0.0,
+        },
+        'latency': summarize(results['all']),
+        'ack_latency': summarize(results['acks']),
+        'steps': {name: summarize(values) for name, values in results['steps'].items()},
+        'noise_events': summarize(results['noise']),
+        'conversations': {'booked': results['booked'], 'not_booked': results['not_booked'],
+                          'not_booked_samples': results['unexpected']},
+        'errors': len(results['errors']),
+        'error_samples': results['errors'][:20],
+        'backend_requests': api.requests,
+        'traces': {
+            'count': len({span['trace_id'] for span in collector.spans}),
+            'backend_requests_with_traceparent': api.traced_requests,
+            'spans': {name: summarize(values) for name, values in sorted(spans.items())},
+        } if collector is not None else None,
+    }
+
+    print(f"\n{args.server}/{args.provider}/{args.mode}: {messages} mensagens em {elapsed:.1f}s "
+          f"({report['throughput']['messages_per_second']} msg/s), "
+          f"{report['errors']} erros, {results['booked']} agendamentos confirmados")
+    phases = ', '.join(f"{name} {seconds * 1000:.0f}ms"
+                       for name, seconds in startup.get('phases', {}).items())
+    print(f"inicialização: pronto em {startup['ready_seconds']:.2f}s ({phases})")
+    print(f"{'etapa':<10} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    rows = list(report['steps'].items()) + [('total', report['latency'])]
+    if results['noise']:
+        rows.append(('eventos', report['noise_events']))
+    for name, stats in rows:
+        print(f"{name:<10} {stats['count']:>6} {stats['p50_ms']:>8.1f}ms {stats['p95_ms']:>8.1f}ms "
+              f"{stats['p99_ms']:>8.1f}ms {stats['max_ms']:>8.1f}ms")
+    if report['traces'] is not None:
+        traces = report['traces']
+        print(f"\n{traces['count']} traces, {traces['backend_requests_with_traceparent']} "
+              f"requisições ao backend com traceparent")
+        print(f"{'span':<32} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+        for name, stats in traces['spans'].items():
+            print(f"{name:<32} {stats['count']:>6} {stats['p50_ms']:>8.1f}ms {stats['p95_ms']:>8.1f}ms "
+                  f"{stats['p99_ms']:>8.1f}ms {stats['max_ms']:>8.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.max_regression)
+        for problem in problems:
+            print(f"REGRESSÃO: {problem}")
+        if problems:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
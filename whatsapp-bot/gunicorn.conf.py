@@ -0,0 +1,22 @@
+"""
+Hooks do gunicorn (carregado automaticamente do diretório de trabalho)
+
+Métricas em modo multiprocess do prometheus_client: o diretório começa vazio
+a cada execução do servidor e os gauges de um worker que sai deixam a soma.
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid, directory)
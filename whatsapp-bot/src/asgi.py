@@ -0,0 +1,227 @@
+"""
+Entrada ASGI do bot: webhook, envio e health check em um event loop
+
+    uvicorn src.asgi:app --host 0.0.0.0 --port 5000 --workers 2
+
+Usa o AsyncAPIClient e os métodos async dos provedores diretamente, então
+um processo mantém milhares de conversas em voo (limitadas pelo pool de
+conexões e pelo WORKER_QUEUE_SIZE no modo background), em vez de uma por
+worker síncrono.
+"""
+import time
+
+_started_at = time.perf_counter()
+
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from twilio.twiml.messaging_response import MessagingResponse
+
+from src.config import settings
+from src.container import ServiceContainer
+from src.pipeline import BotPipeline, Reply
+from src.utils import json_codec
+from src.utils.async_runner import background_loop
+from src.utils.logging_setup import configure_logging, get_logger
+from src.utils.startup import StartupTimer
+from src.utils.profiler import configure_profiler
+from src.utils.tracing import configure_tracing
+
+configure_logging(
+    level=settings.log_level,
+    log_format=settings.log_format,
+    info_sample_rate=settings.log_info_sample_rate,
+    queue_size=settings.log_queue_size
+)
+configure_tracing(
+    settings.tracing_sample_rate,
+    exporter=settings.tracing_exporter,
+    file_path=settings.tracing_file,
+    collector_url=settings.tracing_collector_url,
+    queue_size=settings.tracing_queue_size
+)
+configure_profiler(
+    settings.profiler_dir,
+    sample_rate=settings.profiler_sample_rate,
+    seconds=settings.profiler_seconds,
+    interval_ms=settings.profiler_interval_ms
+)
+log = get_logger(__name__)
+
+startup = StartupTimer(_started_at)
+startup.mark('imports')
+
+MAX_BODY_BYTES = 1024 * 1024
+
+# (status, content-type, corpo)
+Result = Tuple[int, str, bytes]
+
+
+def _json(payload, status: int = 200) -> Result:
+    return status, 'application/json', json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+def _twiml(message: Optional[str] = None, status: int = 200) -> Result:
+    resp = MessagingResponse()
+    if message:
+        resp.message(message)
+    return status, 'application/xml', str(resp).encode('utf-8')
+
+
+def _result(reply: Reply) -> Result:
+    """Resposta ASGI para o resultado do pipeline"""
+    if reply.twiml:
+        return _twiml(reply.body, reply.status)
+    return _json(reply.body, reply.status)
+
+
+class Request:
+    """Dados da requisição HTTP já lidos do scope/receive"""
+
+    __slots__ = ('method', 'path', 'headers', 'body')
+
+    def __init__(self, scope: Dict, body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        # Nomes de header chegam em minúsculas no ASGI
+        self.headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']}
+        self.body = body
+
+    def json(self) -> Dict:
+        return json_codec.loads(self.body or b'{}') or {}
+
+    def form(self) -> Dict[str, str]:
+        return dict(parse_qsl(self.body.decode('utf-8'), keep_blank_values=True))
+
+
+class BotASGIApp:
+    """Aplicação ASGI (sem framework) sobre o ServiceContainer assíncrono"""
+
+    def __init__(self, services: ServiceContainer, startup: StartupTimer):
+        self.services = services
+        self.pipeline = BotPipeline(services)
+        self.startup = startup
+        self.routes: Dict[Tuple[str, str], Callable[[Request], Awaitable[Result]]] = {
+            ('GET', '/health'): self.health,
+            ('GET', '/ready'): self.ready,
+            ('GET', '/stats'): self.stats,
+            ('GET', '/metrics'): self.metrics,
+            ('POST', '/webhook'): self.webhook,
+            ('POST', '/send'): self.send,
+            ('GET', '/admin/profiler'): self.admin_profiler,
+            ('POST', '/admin/profiler'): self.admin_profiler,
+        }
+        self._started = False
+
+    async def __call__(self, scope: Dict, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        self._start()
+        route = self.routes.get((scope['method'], scope['path']))
+        if route is None:
+            methods = [m for m, path in self.routes if path == scope['path']]
+            status, content_type, body = _json({'error': 'Not found'}, 405 if methods else 404)
+        else:
+            body = await self._read_body(receive)
+            if body is None:
+                status, content_type, body = _json({'error': 'Payload too large'}, 413)
+            else:
+                status, content_type, body = await route(Request(scope, body))
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type.encode('latin-1')),
+                        (b'content-length', str(len(body)).encode('latin-1'))]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        chunks: List[bytes] = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    # Ciclo de vida
+    def _start(self):
+        """Prende o loop compartilhado ao loop do servidor e inicia os serviços"""
+        if self._started:
+            return
+        self._started = True
+        background_loop.attach(asyncio.get_running_loop())
+        self.services.start()
+        self.startup.mark('start')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start()
+                # Conexões abertas no loop do servidor, antes do primeiro webhook
+                if settings.startup_mode == 'warm':
+                    await self.services.warm_up_async()
+                    self.startup.mark('warmup')
+                self.startup.register_gauge()
+                log.info("startup_complete", startup_mode=settings.startup_mode, **self.startup.report())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.services.stop()
+                await self.services.close_async()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Rotas
+    async def health(self, request: Request) -> Result:
+        return _json({'status': 'healthy', 'service': 'whatsapp-bot', 'version': '1.0.0'})
+
+    async def ready(self, request: Request) -> Result:
+        report = self.services.ready()
+        return _json(dict(report, status='ready' if report['ready'] else 'not_ready'),
+                     200 if report['ready'] else 503)
+
+    async def stats(self, request: Request) -> Result:
+        # Contagens do outbox/sessões podem consultar SQLite ou Redis
+        stats = await asyncio.to_thread(self.services.stats)
+        return _json(dict(stats,
+                          startup=dict(self.startup.report(), mode=settings.startup_mode)))
+
+    async def metrics(self, request: Request) -> Result:
+        # Lê os snapshots dos outros workers (arquivos) fora do event loop
+        body = (await asyncio.to_thread(self.services.metrics_exporter.render)).encode('utf-8')
+        return 200, 'text/plain; version=0.0.4', body
+
+    async def webhook(self, request: Request) -> Result:
+        """Webhook universal (Twilio form data ou Evolution JSON; fluxo em src/pipeline.py)"""
+        return _result(await self.pipeline.webhook(
+            request.body, request.headers, request.form, traceparent=request.headers.get('traceparent')))
+
+    async def admin_profiler(self, request: Request) -> Result:
+        """Profiler sob demanda (mesmo contrato do Flask)"""
+        return _result(await self.pipeline.admin_profiler(
+            request.method, request.headers.get('authorization', ''), request.body))
+
+    async def send(self, request: Request) -> Result:
+        """Envio proativo: {"to", "message"} ou {"messages": [...]} (mesmo contrato do Flask)"""
+        return _result(await self.pipeline.send(request.body))
+
+
+services = ServiceContainer(settings, asynchronous=True)
+startup.mark('container')
+app = BotASGIApp(services, startup)
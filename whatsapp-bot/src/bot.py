@@ -2,46 +2,79 @@
 Bot WhatsApp - Astra Agenda
 Processa mensagens e gerencia agendamentos via WhatsApp
 """
+import time
+
+_started_at = time.perf_counter()
+
 import logging
-import asyncio
-from flask import Flask, request, jsonify
+from typing import Optional
+from flask import Flask, Response, request, jsonify
+from twilio.twiml.messaging_response import MessagingResponse
 from src.config import settings
-from src.handlers.message_handler import MessageHandler
-from src.services.api_client import APIClient
-from src.services.twilio_provider import TwilioProvider
-from src.services.evolution_provider import EvolutionProvider
-
-# Configurar logging
-logging.basicConfig(
-    level=getattr(logging, settings.log_level),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from src.container import ServiceContainer
+from src.pipeline import BotPipeline, Reply
+from src.utils.async_runner import run_coroutine, run_inline
+from src.utils.logging_setup import configure_logging, get_logger
+from src.utils.startup import StartupTimer
+from src.utils.profiler import configure_profiler
+from src.utils.tracing import configure_tracing
+
+# Configurar logging (fila + thread de escrita; ver src/utils/logging_setup.py)
+configure_logging(
+    level=settings.log_level,
+    log_format=settings.log_format,
+    info_sample_rate=settings.log_info_sample_rate,
+    queue_size=settings.log_queue_size
+)
+configure_tracing(
+    settings.tracing_sample_rate,
+    exporter=settings.tracing_exporter,
+    file_path=settings.tracing_file,
+    collector_url=settings.tracing_collector_url,
+    queue_size=settings.tracing_queue_size
+)
+configure_profiler(
+    settings.profiler_dir,
+    sample_rate=settings.profiler_sample_rate,
+    seconds=settings.profiler_seconds,
+    interval_ms=settings.profiler_interval_ms
 )
 logger = logging.getLogger(__name__)
+log = get_logger(__name__)
+
+startup = StartupTimer(_started_at)
+startup.mark('imports')
 
 # Inicializar Flask
 app = Flask(__name__)
 app.config['SECRET_KEY'] = settings.secret_key
 
-# Inicializar serviços
-api_client = APIClient(settings.api_base_url, settings.api_key)
+# Inicializar serviços (a entrada ASGI em src/asgi.py usa o mesmo container)
+services = ServiceContainer(settings)
+startup.mark('container')
+if settings.startup_mode == 'warm':
+    services.warm_up()
+    startup.mark('warmup')
+services.start()
+pipeline = BotPipeline(services)
+startup.mark('start')
+startup.register_gauge()
+log.info("startup_complete", startup_mode=settings.startup_mode, **startup.report())
 
-# Inicializar provedor WhatsApp baseado na configuração
-if settings.whatsapp_provider == 'evolution':
-    logger.info("Usando Evolution API como provedor WhatsApp")
-    whatsapp_provider = EvolutionProvider(
-        base_url=settings.evolution_api_url,
-        api_key=settings.evolution_api_key,
-        instance_name=settings.evolution_instance_name
-    )
-else:
-    logger.info("Usando Twilio como provedor WhatsApp")
-    whatsapp_provider = TwilioProvider(
-        account_sid=settings.twilio_account_sid,
-        auth_token=settings.twilio_auth_token,
-        whatsapp_number=settings.twilio_whatsapp_number
-    )
 
-message_handler = MessageHandler(api_client, whatsapp_provider)
+def _twiml(message: Optional[str] = None, status: int = 200):
+    """Resposta TwiML (vazia confirma o recebimento sem responder)"""
+    resp = MessagingResponse()
+    if message:
+        resp.message(message)
+    return str(resp), status
+
+
+def _respond(reply: Reply):
+    """Resposta Flask para o resultado do pipeline"""
+    if reply.twiml:
+        return _twiml(reply.body, reply.status)
+    return jsonify(reply.body), reply.status
 
 
 @app.route('/health', methods=['GET'])
@@ -54,78 +87,49 @@ def health_check():
     }), 200
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Prontidão: estado em cache das dependências (503 se alguma estiver fora do ar)"""
+    report = services.ready()
+    status = 'ready' if report['ready'] else 'not_ready'
+    return jsonify(dict(report, status=status)), 200 if report['ready'] else 503
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Estatísticas internas (filas, sessões, inicialização)"""
+    return jsonify(dict(services.stats(), startup=dict(startup.report(), mode=settings.startup_mode))), 200
+
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """
+    Profiler sob demanda (Authorization: Bearer ADMIN_TOKEN)
+    
+    POST {"rate": 0.1} ou {"seconds": 30} inicia uma sessão em todos os
+    workers ({} encerra); GET combina os perfis dos workers em um .folded.
+    """
+    return _respond(run_inline(pipeline.admin_profiler(
+        request.method, request.headers.get('Authorization', ''), request.get_data())))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas no formato Prometheus (somadas entre os workers)"""
+    return Response(services.metrics_exporter.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """
     Webhook universal para receber mensagens do WhatsApp
-    Suporta Twilio e Evolution API
+    Suporta Twilio e Evolution API (fluxo em src/pipeline.py)
     """
-    try:
-        # Determinar tipo de webhook baseado no provider
-        if settings.whatsapp_provider == 'evolution':
-            # Evolution API envia JSON
-            data = request.get_json() or {}
-            logger.info(f"Evolution webhook recebido: {data.get('event', 'unknown')}")
-            
-            # Validar webhook
-            webhook_data = {
-                'headers': dict(request.headers),
-                'body': data
-            }
-            if not whatsapp_provider.validate_webhook(webhook_data):
-                logger.warning("Evolution webhook inválido")
-                return jsonify({'error': 'Unauthorized'}), 401
-            
-            # Parsear mensagem
-            msg_data = whatsapp_provider.parse_incoming_message(data)
-            
-        else:
-            # Twilio envia form data
-            logger.info(f"Twilio webhook recebido de {request.values.get('From', '')}")
-            msg_data = whatsapp_provider.parse_incoming_message(dict(request.values))
-        
-        incoming_msg = msg_data.get('message', '')
-        from_number = msg_data.get('from_number', '')
-        
-        if not incoming_msg or not from_number:
-            # Responder de forma adequada para cada provedor
-            if settings.whatsapp_provider == 'evolution':
-                return jsonify({'error': 'Missing message or from_number'}), 400
-            else:
-                from twilio.twiml.messaging_response import MessagingResponse
-                resp = MessagingResponse()
-                resp.message("❌ Webhook inválido ou incompleto.")
-                return str(resp), 200
-        
-        # Processar mensagem e montar resposta
-        try:
-            reply = message_handler.process_message(incoming_msg, from_number)
-            
-            if settings.whatsapp_provider == 'evolution':
-                return jsonify({'reply': reply}), 200
-            else:
-                from twilio.twiml.messaging_response import MessagingResponse
-                resp = MessagingResponse()
-                resp.message(reply)
-                return str(resp), 200
-        except Exception as e:
-            logger.error(f"Erro ao processar mensagem: {str(e)}", exc_info=True)
-            if settings.whatsapp_provider == 'evolution':
-                return jsonify({'error': 'Internal error'}), 500
-            else:
-                from twilio.twiml.messaging_response import MessagingResponse
-                resp = MessagingResponse()
-                resp.message("❌ Desculpe, ocorreu um erro. Tente novamente mais tarde.")
-                return str(resp), 200
-    except Exception as e:
-        logger.error(f"Erro ao processar webhook: {str(e)}", exc_info=True)
-        if settings.whatsapp_provider == 'evolution':
-            return jsonify({'error': 'Internal error'}), 500
-        else:
-            from twilio.twiml.messaging_response import MessagingResponse
-            resp = MessagingResponse()
-            resp.message("❌ Desculpe, ocorreu um erro. Tente novamente mais tarde.")
-            return str(resp), 200
+    # Com o APIClient síncrono o pipeline roda inteiro nesta thread
+    return _respond(run_inline(pipeline.webhook(
+        request.get_data(), request.headers, lambda: dict(request.values),
+        traceparent=request.headers.get('traceparent')
+    )))
 
 
 @app.route('/send', methods=['POST'])
@@ -133,34 +137,13 @@ def send_message():
     """
     Endpoint para enviar mensagens proativas
     Usado para lembretes e notificações
+    
+    Aceita uma mensagem ({"to", "message"}) ou um lote
+    ({"messages": [{"to", "message", "media_url"?}, ...]}), com "tenant"
+    opcional (padrão: configuração global).
     """
-    try:
-        data = request.get_json()
-        to_number = data.get('to')
-        message = data.get('message')
-        
-        if not to_number or not message:
-            return jsonify({'error': 'Missing to or message'}), 400
-        
-        from twilio.rest import Client
-        client = Client(settings.twilio_account_sid, settings.twilio_auth_token)
-        
-        msg = client.messages.create(
-            body=message,
-            from_=settings.twilio_whatsapp_number,
-            to=f'whatsapp:{to_number}'
-        )
-        
-        logger.info(f"Mensagem enviada para {to_number}: {msg.sid}")
-        
-        return jsonify({
-            'success': True,
-            'message_sid': msg.sid
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"Erro ao enviar mensagem: {str(e)}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
+    # Envio pelo dispatcher async no loop compartilhado (o timeout fica no pipeline)
+    return _respond(run_coroutine(pipeline.send(request.get_data())))
 
 
 if __name__ == '__main__':
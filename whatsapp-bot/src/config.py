@@ -2,7 +2,7 @@
 Configurações do Bot WhatsApp
 """
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -19,6 +19,98 @@ class Settings(BaseSettings):
         default="",
         description="Chave de API para autenticação"
     )
+    api_connect_timeout_seconds: float = Field(
+        default=3.05,
+        description="Timeout de conexão com a API backend"
+    )
+    api_read_timeout_seconds: float = Field(
+        default=10.0,
+        description="Timeout de leitura padrão da API backend"
+    )
+    api_endpoint_timeouts: Dict[str, float] = Field(
+        default_factory=dict,
+        description='Timeout de leitura por operação, ex: {"get_available_slots": 15}'
+    )
+    api_pool_size: int = Field(
+        default=0,
+        description="Conexões HTTP mantidas com a API (0 = automático pelo número de workers)"
+    )
+    api_async_pool_size: int = Field(
+        default=100,
+        description="Conexões keep-alive do cliente assíncrono (AsyncAPIClient)"
+    )
+    api_http2: bool = Field(
+        default=False,
+        description="Usar HTTP/2 no cliente assíncrono (requer o pacote h2)"
+    )
+    api_max_retries: int = Field(
+        default=2,
+        description="Retries em GETs que falharem por rede ou 502/503/504"
+    )
+    api_retry_backoff_seconds: float = Field(
+        default=0.2,
+        description="Base do backoff exponencial (com jitter) entre retries"
+    )
+    api_circuit_failure_threshold: int = Field(
+        default=5,
+        description="Falhas consecutivas para abrir o circuito da API"
+    )
+    api_circuit_recovery_seconds: float = Field(
+        default=30.0,
+        description="Tempo com o circuito aberto antes de testar a API novamente"
+    )
+    customer_cache_ttl_seconds: float = Field(
+        default=300.0,
+        description="TTL do cache de clientes por telefone (0 desativa)"
+    )
+    customer_cache_negative_ttl_seconds: float = Field(
+        default=30.0,
+        description="TTL do cache de telefones não cadastrados (404)"
+    )
+    customer_cache_max_entries: int = Field(
+        default=5000,
+        description="Máximo de clientes em cache"
+    )
+    slot_cache_ttl_seconds: float = Field(
+        default=30.0,
+        description="TTL do cache de horários disponíveis (0 desativa)"
+    )
+    slot_cache_max_entries: int = Field(
+        default=512,
+        description="Máximo de combinações (data, recurso) em cache"
+    )
+    appointment_page_ttl_seconds: float = Field(
+        default=30.0,
+        description='TTL do cache das páginas de "meus agendamentos" por cliente (0 desativa)'
+    )
+    appointment_page_max_entries: int = Field(
+        default=2000,
+        description="Máximo de páginas de agendamentos em cache"
+    )
+    availability_hours: List[str] = Field(
+        default_factory=lambda: ["08:00-18:00"],
+        description='Expediente usado em "próximos horários", ex: ["08:00-12:00", "13:00-18:00"]'
+    )
+    availability_weekdays: List[int] = Field(
+        default_factory=lambda: [0, 1, 2, 3, 4, 5],
+        description="Dias com expediente (0 = segunda ... 6 = domingo)"
+    )
+    availability_slot_minutes: int = Field(
+        default=60,
+        description="Duração de cada horário oferecido"
+    )
+    availability_horizon_days: int = Field(
+        default=14,
+        description='Dias à frente buscados por "próximos horários" (uma chamada à API)'
+    )
+    slot_prefetch_days: int = Field(
+        default=0,
+        description="Dias à frente mantidos em cache pelo prefetch (0 desativa)"
+    )
+    slot_prefetch_interval_seconds: float = Field(
+        default=25.0,
+        description="Intervalo do prefetch (deve ser menor que o TTL do cache)"
+    )
     
     # WhatsApp Provider
     whatsapp_provider: str = Field(
@@ -39,6 +131,10 @@ class Settings(BaseSettings):
         default="whatsapp:+14155238886",
         description="Número WhatsApp do Twilio"
     )
+    twilio_api_base_url: str = Field(
+        default="",
+        description="URL base da API REST do Twilio (vazio = https://api.twilio.com)"
+    )
     
     # Evolution API
     evolution_api_url: str = Field(
@@ -53,21 +149,287 @@ class Settings(BaseSettings):
         default="",
         description="Nome da instância Evolution API"
     )
+    evolution_webhook_events: List[str] = Field(
+        default_factory=lambda: ["messages.upsert"],
+        description="Eventos do webhook processados; os demais recebem 200 sem decodificar o corpo"
+    )
+    
+    # Conexões com o provedor (Twilio e Evolution)
+    provider_pool_size: int = Field(
+        default=100,
+        description="Conexões keep-alive com a API do provedor WhatsApp"
+    )
+    provider_connect_timeout_seconds: float = Field(
+        default=5.0,
+        description="Timeout de conexão com a API do provedor WhatsApp"
+    )
+    provider_timeout_seconds: float = Field(
+        default=30.0,
+        description="Timeout de leitura/escrita com a API do provedor WhatsApp"
+    )
     
     # Servidor
     port: int = Field(default=5000, description="Porta do servidor")
     flask_env: str = Field(default="production", description="Ambiente Flask")
     secret_key: str = Field(default="change-me", description="Secret key para Flask")
+
+    # Processamento de mensagens
+    webhook_mode: str = Field(
+        default="inline",
+        description="'inline' (responde no webhook) ou 'background' (enfileira e responde via provedor)"
+    )
+    worker_count: int = Field(
+        default=4,
+        description="Workers (faixas seriais por remetente) do modo background"
+    )
+    worker_queue_size: int = Field(
+        default=1000,
+        description="Capacidade total das filas (dividida entre as faixas)"
+    )
+    message_deadline_seconds: float = Field(
+        default=30.0,
+        description="Tempo máximo na fila antes de descartar a mensagem"
+    )
+    reply_send_timeout_seconds: float = Field(
+        default=15.0,
+        description="Timeout para enviar a resposta pelo provedor"
+    )
+    admission_max_in_flight: int = Field(
+        default=0,
+        description="Mensagens em voo por processo (webhook inline ou fila do background; 0 desativa, padrão)"
+    )
+    admission_reserved_for_active: int = Field(
+        default=40,
+        description="Vagas do orçamento reservadas a conversas em andamento (sessão ativa)"
+    )
+    admission_shed_response: str = Field(
+        default="reply",
+        description="Com o orçamento esgotado: 'reply' (mensagem de alta demanda), '503' ou '429'"
+    )
     
+    # Envio de mensagens (rate limit por provedor e por destinatário)
+    outbound_rate_per_second: float = Field(
+        default=10.0,
+        description="Mensagens por segundo enviadas ao provedor (0 desativa)"
+    )
+    outbound_burst: int = Field(default=20, description="Rajada máxima ao provedor")
+    outbound_destination_rate_per_second: float = Field(
+        default=1.0,
+        description="Mensagens por segundo para um mesmo destinatário (0 desativa)"
+    )
+    outbound_destination_burst: int = Field(
+        default=3,
+        description="Rajada máxima para um mesmo destinatário"
+    )
+    outbound_max_concurrency: int = Field(
+        default=10,
+        description="Envios simultâneos ao provedor"
+    )
+    outbound_max_wait_seconds: float = Field(
+        default=30.0,
+        description="Espera máxima por rate limit antes de falhar o envio"
+    )
+    outbound_max_batch: int = Field(
+        default=100,
+        description="Máximo de mensagens por chamada em lote a /send"
+    )
+
+    # Outbox durável (respostas do modo background e lembretes)
+    outbox_backend: str = Field(
+        default="none",
+        description="'none' (envio direto), 'sqlite' (arquivo local) ou 'redis' (usa redis_url)"
+    )
+    outbox_db_path: str = Field(default="outbox.db", description="Arquivo SQLite do outbox")
+    outbox_batch_size: int = Field(default=50, description="Mensagens reservadas por ciclo de flush")
+    outbox_max_in_flight: int = Field(
+        default=200,
+        description="Mensagens do outbox enviadas ao provedor e ainda sem resultado"
+    )
+    outbox_flush_interval_seconds: float = Field(
+        default=1.0,
+        description="Intervalo máximo entre ciclos de flush (novas mensagens acordam o flush)"
+    )
+    outbox_max_attempts: int = Field(default=5, description="Tentativas antes de marcar a mensagem como falha")
+    outbox_retry_backoff_seconds: float = Field(
+        default=2.0,
+        description="Base do backoff exponencial entre tentativas"
+    )
+    outbox_retention_seconds: float = Field(
+        default=86400.0,
+        description="Tempo que mensagens enviadas/falhas ficam guardadas para consulta"
+    )
+
     # Redis (opcional)
     redis_url: Optional[str] = Field(
         default=None,
         description="URL do Redis para cache"
     )
+
+    # Sessões de conversa
+    session_backend: str = Field(
+        default="memory",
+        description="Armazenamento de sessões: 'memory' ou 'redis' (usa redis_url)"
+    )
+    session_ttl_seconds: float = Field(
+        default=1800.0,
+        description="Sessões inativas por mais tempo que isso expiram"
+    )
+    session_max_entries: int = Field(
+        default=10000,
+        description="Máximo de sessões em memória (LRU)"
+    )
+    
+    # Deduplicação de webhooks
+    dedup_window_seconds: float = Field(
+        default=600.0,
+        description="Janela em que um ID de mensagem repetido é ignorado (0 desativa)"
+    )
+    dedup_max_entries: int = Field(default=50000, description="IDs mantidos no LRU local")
+    dedup_backend: str = Field(
+        default="memory",
+        description="'memory' ou 'redis' (usa redis_url; cobre vários workers)"
+    )
+    
+    # Lembretes de agendamento
+    reminders_enabled: bool = Field(default=False, description="Ativa o envio de lembretes")
+    reminder_lead_minutes: int = Field(
+        default=60,
+        description="Antecedência do lembrete em relação ao horário"
+    )
+    reminder_lookahead_minutes: int = Field(
+        default=0,
+        description="Janela buscada à frente (0 = antecedência + duas buscas)"
+    )
+    reminder_fetch_interval_seconds: float = Field(
+        default=300.0,
+        description="Intervalo entre buscas de agendamentos na API"
+    )
+    reminder_fetch_window_minutes: int = Field(
+        default=60,
+        description="Tamanho de cada bloco de tempo buscado na API"
+    )
+    reminder_tick_seconds: float = Field(
+        default=5.0,
+        description="Intervalo de verificação dos lembretes vencidos"
+    )
+    reminder_batch_size: int = Field(default=200, description="Lembretes enviados por tick")
+    reminder_store: str = Field(
+        default="sqlite",
+        description="Estado dos lembretes: 'sqlite' (arquivo local) ou 'redis'"
+    )
+    reminder_db_path: str = Field(
+        default="reminders.db",
+        description="Arquivo SQLite do estado dos lembretes"
+    )
+    
+    # Métricas (o diretório multiprocess é PROMETHEUS_MULTIPROC_DIR, lido no import)
+    metrics_flush_seconds: float = Field(
+        default=5.0,
+        description="Intervalo de cópia dos gauges de cada worker para o diretório multiprocess"
+    )
+    
+    # Multi-tenant
+    tenants: List[Dict[str, str]] = Field(
+        default_factory=list,
+        description=('Tenants extras (JSON): [{"id": "loja-a", "evolution_instance_name": "...", '
+                     '"evolution_api_key": "...", "api_key": "..."}]; campos omitidos usam a configuração global')
+    )
+    tenant_pool_size: int = Field(
+        default=50,
+        description="Máximo de tenants com clientes (API e provedor) abertos ao mesmo tempo"
+    )
+    tenant_idle_seconds: float = Field(
+        default=900.0,
+        description="Fecha os clientes de um tenant sem mensagens há mais tempo que isso"
+    )
+    
+    # Inicialização
+    startup_mode: str = Field(
+        default="eager",
+        description="'eager' (constrói tudo no boot), 'lazy' (no primeiro uso) ou 'warm' (eager + abre conexões antes do tráfego)"
+    )
+    startup_warmup_connections: int = Field(
+        default=4,
+        description="Conexões keep-alive abertas com a API no warm-up"
+    )
+    startup_warmup_timeout_seconds: float = Field(
+        default=5.0,
+        description="Tempo máximo do warm-up de cada destino"
+    )
+    
+    # Prontidão (/ready)
+    readiness_interval_seconds: float = Field(
+        default=10.0,
+        description="Intervalo das verificações de API, provedor e Redis (0 desativa; /ready fica sempre 200)"
+    )
+    readiness_timeout_seconds: float = Field(
+        default=3.0,
+        description="Tempo máximo de cada verificação de dependência"
+    )
+    readiness_failure_threshold: int = Field(
+        default=2,
+        description="Falhas seguidas até a dependência ser considerada fora do ar"
+    )
     
     # Configurações gerais
     timezone: str = Field(default="America/Sao_Paulo", description="Fuso horário")
     log_level: str = Field(default="INFO", description="Nível de log")
+    log_format: str = Field(
+        default="text",
+        description="Formato dos logs: 'text' (data - logger - nível - mensagem) ou 'json' (uma linha por evento)"
+    )
+    log_info_sample_rate: float = Field(
+        default=1.0,
+        description="Fração dos eventos INFO de alto volume registrados (0 a 1; WARNING+ sempre)"
+    )
+    log_queue_size: int = Field(
+        default=10000,
+        description="Tamanho da fila de logs (eventos excedentes são descartados e contados)"
+    )
+    
+    # Tracing
+    tracing_sample_rate: float = Field(
+        default=0.0,
+        description="Fração dos webhooks com trace (0 desativa; 1 registra todos)"
+    )
+    tracing_exporter: str = Field(
+        default="file",
+        description="Destino dos spans: 'file' (JSONL em tracing_file) ou 'http' (POST em tracing_collector_url)"
+    )
+    tracing_file: str = Field(
+        default="/tmp/whatsapp-bot-traces.jsonl",
+        description="Arquivo JSONL dos spans (compartilhado pelos workers)"
+    )
+    tracing_collector_url: str = Field(
+        default="",
+        description="URL do coletor que recebe POST {\"spans\": [...]} em lote"
+    )
+    tracing_queue_size: int = Field(
+        default=10000,
+        description="Tamanho da fila de spans (excedentes são descartados e contados)"
+    )
+    
+    # Profiler sob demanda
+    profiler_dir: str = Field(
+        default="/tmp/whatsapp-bot-profiles",
+        description="Diretório do controle e dos perfis folded (vazio desativa o profiler)"
+    )
+    profiler_sample_rate: float = Field(
+        default=0.0,
+        description="Fração das mensagens amostradas desde o boot (0 = só pelo endpoint admin)"
+    )
+    profiler_seconds: float = Field(
+        default=0.0,
+        description="Amostra todas as mensagens nos primeiros N segundos após o boot"
+    )
+    profiler_interval_ms: float = Field(
+        default=5.0,
+        description="Intervalo entre amostras das pilhas"
+    )
+    admin_token: str = Field(
+        default="",
+        description="Token Bearer dos endpoints /admin (vazio desativa os endpoints)"
+    )
     
     class Config:
         env_file = ".env"
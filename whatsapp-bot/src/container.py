@@ -0,0 +1,557 @@
+"""
+Construção dos serviços do bot, compartilhada pelas entradas WSGI e ASGI
+"""
+import asyncio
+import hmac
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import Dict, List, Optional
+
+from src.config import Settings
+from src.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tenant da configuração global (serviços do próprio container)
+DEFAULT_TENANT = 'default'
+
+# Campos que um tenant pode sobrescrever (o tipo de provedor é o do webhook, global)
+TENANT_FIELDS = frozenset({
+    'id', 'api_base_url', 'api_key',
+    'evolution_api_url', 'evolution_api_key', 'evolution_instance_name',
+    'twilio_account_sid', 'twilio_auth_token', 'twilio_whatsapp_number', 'twilio_api_base_url',
+})
+
+WEBHOOK_PARSE_LATENCY = metrics.histogram(
+    'whatsapp_webhook_parse_seconds',
+    'Tempo de leitura, validação e parse do webhook',
+    ('provider',)
+)
+WEBHOOKS = metrics.counter(
+    'whatsapp_webhooks_total',
+    'Webhooks recebidos por resultado',
+    ('provider', 'outcome')
+)
+
+
+class ServiceContainer:
+    """
+    Monta API, provedor, sessões, handler, dispatcher e serviços em background
+
+    Cada serviço é construído (e seu módulo importado) no primeiro acesso:
+    só o provedor configurado é importado, e AsyncAPIClient/httpx, APScheduler
+    e Redis só quando usados. Com `STARTUP_MODE=eager` tudo é construído na
+    inicialização; com `warm`, além disso, as conexões keep-alive com a API e
+    com o provedor são abertas antes do primeiro webhook (ver `warm_up`).
+
+    Args:
+        asynchronous: True na entrada ASGI (AsyncAPIClient e pool de tasks
+            no event loop); False no Flask/gunicorn (APIClient e threads)
+    """
+
+    def __init__(self, settings: Settings, asynchronous: bool = False):
+        self.settings = settings
+        self.asynchronous = asynchronous
+
+        # Gauges leem só serviços já construídos (não forçam a construção)
+        metrics.gauge('whatsapp_active_sessions', 'Sessões de conversa ativas',
+                      lambda: self.session_store.size() if self._built('session_store') else None)
+        metrics.gauge('whatsapp_queue_depth', 'Mensagens aguardando processamento no pool de workers',
+                      lambda: self.worker_pool.queue_depth() if self._built('worker_pool') else None)
+
+        # Tenants extras: configuração e chave de roteamento (instância/número) -> tenant
+        self.tenant_settings: Dict[str, Settings] = {}
+        self.tenant_routes: Dict[str, str] = {self._route_key(settings): DEFAULT_TENANT}
+        for config in settings.tenants:
+            unknown = set(config) - TENANT_FIELDS
+            tenant_id = config.get('id')
+            if not tenant_id or tenant_id == DEFAULT_TENANT or unknown:
+                raise ValueError(f"Tenant inválido {tenant_id!r}: campos não suportados {sorted(unknown)}")
+            tenant = settings.model_copy(update={k: v for k, v in config.items() if k != 'id'})
+            key = self._route_key(tenant)
+            if key in self.tenant_routes:
+                raise ValueError(f"Tenant {tenant_id!r}: instância/número já usado por {self.tenant_routes[key]!r}")
+            self.tenant_settings[tenant_id] = tenant
+            self.tenant_routes[key] = tenant_id
+        metrics.gauge('whatsapp_tenants_live', 'Tenants com clientes abertos no pool',
+                      lambda: self.tenant_pool.live() if self._built('tenant_pool') else None)
+
+        if settings.startup_mode != 'lazy':
+            self.build_all()
+
+    def _built(self, name: str) -> bool:
+        return name in self.__dict__ and self.__dict__[name] is not None
+
+    def build_all(self):
+        """Constrói todos os serviços agora (modos eager e warm)"""
+        for name in ('api_client', 'whatsapp_provider', 'session_store', 'message_handler',
+                     'outbound_dispatcher', 'deduplicator', 'event_filter', 'slot_prefetcher',
+                     'outbox', 'reminder_engine', 'admission', 'worker_pool', 'readiness',
+                     'metrics_exporter'):
+            getattr(self, name)
+
+    # Construção
+    @cached_property
+    def api_client(self):
+        return self._new_api_client(self.settings)
+
+    def _new_api_client(self, settings: Settings):
+        from src.utils.circuit_breaker import CircuitBreaker
+        breaker = CircuitBreaker(
+            failure_threshold=settings.api_circuit_failure_threshold,
+            recovery_timeout=settings.api_circuit_recovery_seconds
+        )
+        cache_options = dict(
+            customer_cache_ttl=settings.customer_cache_ttl_seconds,
+            customer_negative_ttl=settings.customer_cache_negative_ttl_seconds,
+            customer_cache_size=settings.customer_cache_max_entries,
+            slot_cache_ttl=settings.slot_cache_ttl_seconds,
+            slot_cache_size=settings.slot_cache_max_entries,
+            appointment_page_ttl=settings.appointment_page_ttl_seconds,
+            appointment_page_size=settings.appointment_page_max_entries
+        )
+        if self.asynchronous:
+            from src.services.async_api_client import AsyncAPIClient
+            return AsyncAPIClient(
+                settings.api_base_url,
+                settings.api_key,
+                connect_timeout=settings.api_connect_timeout_seconds,
+                read_timeout=settings.api_read_timeout_seconds,
+                endpoint_timeouts=settings.api_endpoint_timeouts,
+                pool_size=settings.api_async_pool_size,
+                max_retries=settings.api_max_retries,
+                backoff_base=settings.api_retry_backoff_seconds,
+                http2=settings.api_http2,
+                breaker=breaker,
+                **cache_options
+            )
+        from src.services.api_client import APIClient
+        from src.services.http_transport import HttpTransport
+        transport = HttpTransport(
+            connect_timeout=settings.api_connect_timeout_seconds,
+            read_timeout=settings.api_read_timeout_seconds,
+            endpoint_timeouts=settings.api_endpoint_timeouts,
+            pool_size=settings.api_pool_size or max(10, settings.worker_count * 2),
+            max_retries=settings.api_max_retries,
+            backoff_base=settings.api_retry_backoff_seconds,
+            breaker=breaker
+        )
+        return APIClient(settings.api_base_url, settings.api_key, transport=transport, **cache_options)
+
+    @cached_property
+    def whatsapp_provider(self):
+        return self._new_provider(self.settings)
+
+    @staticmethod
+    def _new_provider(settings: Settings):
+        """Provedor WhatsApp baseado na configuração"""
+        if settings.whatsapp_provider == 'evolution':
+            from src.services.evolution_provider import EvolutionProvider
+            logger.info("Usando Evolution API como provedor WhatsApp")
+            return EvolutionProvider(
+                base_url=settings.evolution_api_url,
+                api_key=settings.evolution_api_key,
+                instance_name=settings.evolution_instance_name,
+                pool_size=settings.provider_pool_size,
+                connect_timeout=settings.provider_connect_timeout_seconds,
+                timeout=settings.provider_timeout_seconds
+            )
+        from src.services.twilio_provider import TwilioProvider
+        logger.info("Usando Twilio como provedor WhatsApp")
+        return TwilioProvider(
+            account_sid=settings.twilio_account_sid,
+            auth_token=settings.twilio_auth_token,
+            whatsapp_number=settings.twilio_whatsapp_number,
+            api_base_url=settings.twilio_api_base_url or None,
+            pool_size=settings.provider_pool_size,
+            connect_timeout=settings.provider_connect_timeout_seconds,
+            timeout=settings.provider_timeout_seconds
+        )
+
+    @cached_property
+    def session_store(self):
+        """Sessões de conversa: Redis compartilha o estado entre workers"""
+        settings = self.settings
+        from src.services.session_store import InMemorySessionStore, RedisSessionStore
+        if settings.session_backend == 'redis' and settings.redis_url:
+            from src.services.redis_client import get_redis_client
+            logger.info("Usando Redis para sessões de conversa")
+            return RedisSessionStore(
+                get_redis_client(settings.redis_url),
+                ttl_seconds=settings.session_ttl_seconds
+            )
+        return InMemorySessionStore(
+            max_entries=settings.session_max_entries,
+            ttl_seconds=settings.session_ttl_seconds
+        )
+
+    @cached_property
+    def message_handler(self):
+        from src.handlers.message_handler import MessageHandler
+        return MessageHandler(self.api_client, self.whatsapp_provider, self.session_store,
+                              self._new_availability(self.settings, self.api_client))
+
+    @staticmethod
+    def _new_availability(settings: Settings, api_client):
+        """Busca de horários livres em vários dias ("próximos", "semana")"""
+        from src.services.availability import AvailabilityEngine
+        return AvailabilityEngine(
+            api_client,
+            hours=settings.availability_hours,
+            weekdays=settings.availability_weekdays,
+            slot_minutes=settings.availability_slot_minutes,
+            horizon_days=settings.availability_horizon_days,
+            timezone=settings.timezone
+        )
+
+    @cached_property
+    def outbound_dispatcher(self):
+        return self._new_dispatcher(self.settings, self.whatsapp_provider)
+
+    @staticmethod
+    def _new_dispatcher(settings: Settings, provider):
+        """Envio de mensagens: reaproveita o provedor e aplica rate limit"""
+        from src.services.outbound_dispatcher import OutboundDispatcher
+        return OutboundDispatcher(
+            provider,
+            provider_rate=settings.outbound_rate_per_second,
+            provider_burst=settings.outbound_burst,
+            destination_rate=settings.outbound_destination_rate_per_second,
+            destination_burst=settings.outbound_destination_burst,
+            max_concurrency=settings.outbound_max_concurrency,
+            max_wait_seconds=settings.outbound_max_wait_seconds,
+            send_timeout=settings.reply_send_timeout_seconds
+        )
+
+    @cached_property
+    def deduplicator(self):
+        """Deduplicação de webhooks reenviados pelo provedor"""
+        settings = self.settings
+        from src.services.deduplicator import MessageDeduplicator
+        dedup_redis = None
+        if settings.dedup_backend == 'redis' and settings.redis_url:
+            from src.services.redis_client import get_redis_client
+            dedup_redis = get_redis_client(settings.redis_url)
+        return MessageDeduplicator(
+            window_seconds=settings.dedup_window_seconds,
+            max_entries=settings.dedup_max_entries,
+            redis_client=dedup_redis
+        )
+
+    @cached_property
+    def slot_prefetcher(self):
+        """Prefetch opcional dos horários dos próximos dias"""
+        settings = self.settings
+        if settings.slot_prefetch_days <= 0 or settings.slot_cache_ttl_seconds <= 0:
+            return None
+        from src.services.slot_prefetcher import SlotPrefetcher
+        return SlotPrefetcher(
+            self.api_client,
+            days=settings.slot_prefetch_days,
+            interval_seconds=settings.slot_prefetch_interval_seconds
+        )
+
+    @cached_property
+    def reminder_engine(self):
+        """Lembretes de agendamento"""
+        settings = self.settings
+        if not settings.reminders_enabled:
+            return None
+        from src.services.reminder_engine import ReminderEngine, RedisReminderStore, SQLiteReminderStore
+        if settings.reminder_store == 'redis' and settings.redis_url:
+            from src.services.redis_client import get_redis_client
+            reminder_store = RedisReminderStore(get_redis_client(settings.redis_url))
+        else:
+            reminder_store = SQLiteReminderStore(settings.reminder_db_path)
+        return ReminderEngine(
+            self.api_client,
+            self.outbound_dispatcher,
+            reminder_store,
+            lead_minutes=settings.reminder_lead_minutes,
+            lookahead_minutes=settings.reminder_lookahead_minutes,
+            fetch_interval_seconds=settings.reminder_fetch_interval_seconds,
+            fetch_window_minutes=settings.reminder_fetch_window_minutes,
+            tick_seconds=settings.reminder_tick_seconds,
+            batch_size=settings.reminder_batch_size,
+            timezone=settings.timezone,
+            outbox=self.outbox,
+            tenants=self
+        )
+
+    @cached_property
+    def worker_pool(self):
+        """Modo background: webhook só enfileira, workers processam e respondem"""
+        settings = self.settings
+        if settings.webhook_mode != 'background':
+            return None
+        from src.services.worker_pool import AsyncMessagePool, MessageWorkerPool
+        send_timeout = settings.outbound_max_wait_seconds + settings.reply_send_timeout_seconds
+        if self.asynchronous:
+            return AsyncMessagePool(
+                self.message_handler,
+                self.outbound_dispatcher,
+                max_pending=settings.worker_queue_size,
+                deadline_seconds=settings.message_deadline_seconds,
+                send_timeout=send_timeout,
+                tenants=self,
+                admission=self.admission,
+                outbox=self.outbox
+            )
+        return MessageWorkerPool(
+            self.message_handler,
+            self.outbound_dispatcher,
+            num_workers=settings.worker_count,
+            queue_size=settings.worker_queue_size,
+            deadline_seconds=settings.message_deadline_seconds,
+            send_timeout=send_timeout,
+            tenants=self,
+            admission=self.admission,
+            outbox=self.outbox
+        )
+
+    @cached_property
+    def outbox(self):
+        """Outbox durável das respostas do background e dos lembretes (opcional)"""
+        settings = self.settings
+        if settings.outbox_backend not in ('sqlite', 'redis'):
+            return None
+        from src.services.outbox import Outbox, RedisOutboxStore, SQLiteOutboxStore
+        if settings.outbox_backend == 'redis' and settings.redis_url:
+            from src.services.redis_client import get_redis_client
+            store = RedisOutboxStore(get_redis_client(settings.redis_url),
+                                     retention_seconds=settings.outbox_retention_seconds)
+        else:
+            store = SQLiteOutboxStore(settings.outbox_db_path)
+        return Outbox(
+            store,
+            self.outbound_dispatcher,
+            tenants=self,
+            batch_size=settings.outbox_batch_size,
+            max_in_flight=settings.outbox_max_in_flight,
+            interval_seconds=settings.outbox_flush_interval_seconds,
+            max_attempts=settings.outbox_max_attempts,
+            backoff_seconds=settings.outbox_retry_backoff_seconds,
+            retention_seconds=settings.outbox_retention_seconds,
+            send_timeout=settings.outbound_max_wait_seconds + settings.reply_send_timeout_seconds
+        )
+
+    @cached_property
+    def admission(self):
+        """Orçamento de mensagens em voo (prioridade para sessões ativas)"""
+        from src.services.admission import AdmissionController
+        return AdmissionController(
+            max_in_flight=self.settings.admission_max_in_flight,
+            reserved_for_active=self.settings.admission_reserved_for_active
+        )
+
+    @cached_property
+    def readiness(self):
+        """Verificação periódica de API, provedor e Redis para o /ready (None se desativada)"""
+        settings = self.settings
+        if settings.readiness_interval_seconds <= 0:
+            return None
+        from src.services.readiness import ReadinessProber
+        timeout = settings.readiness_timeout_seconds
+        api_client, provider = self.api_client, self.whatsapp_provider
+        checks = {
+            'api': lambda: api_client.health_check(timeout=timeout),
+            'provider': provider.health_check,
+        }
+        if settings.redis_url:
+            from src.services.redis_client import get_redis_client
+            checks['redis'] = lambda: get_redis_client(settings.redis_url).ping()
+        return ReadinessProber(
+            checks,
+            interval_seconds=settings.readiness_interval_seconds,
+            timeout_seconds=timeout,
+            failure_threshold=settings.readiness_failure_threshold
+        )
+
+    def ready(self) -> Dict:
+        """Estado de prontidão em cache (sem chamadas de rede)"""
+        if self.readiness is None:
+            return {'ready': True, 'checked_at': None, 'dependencies': {}}
+        return self.readiness.report()
+
+    @cached_property
+    def metrics_exporter(self):
+        """Métricas: arquivos mmap por worker (PROMETHEUS_MULTIPROC_DIR), somados no /metrics"""
+        return metrics.MetricsExporter(flush_interval_seconds=self.settings.metrics_flush_seconds)
+
+    # Multi-tenant
+    @cached_property
+    def tenant_pool(self):
+        """Clientes por tenant (LRU com expiração por inatividade)"""
+        if not self.tenant_settings:
+            return None
+        from src.services.tenant_pool import TenantPool
+        return TenantPool(
+            list(self.tenant_settings),
+            self._build_tenant,
+            max_live=self.settings.tenant_pool_size,
+            idle_seconds=self.settings.tenant_idle_seconds
+        )
+
+    def _build_tenant(self, tenant_id: str):
+        from src.handlers.message_handler import MessageHandler
+        from src.services.session_store import NamespacedSessionStore
+        from src.services.tenant_pool import TenantServices
+        settings = self.tenant_settings[tenant_id]
+        api_client = self._new_api_client(settings)
+        provider = self._new_provider(settings)
+        sessions = NamespacedSessionStore(self.session_store, tenant_id)
+        return TenantServices(
+            tenant_id,
+            api_client,
+            provider,
+            MessageHandler(api_client, provider, sessions,
+                           self._new_availability(settings, api_client)),
+            self._new_dispatcher(settings, provider)
+        )
+
+    @staticmethod
+    def _route_key(settings: Settings) -> str:
+        if settings.whatsapp_provider == 'evolution':
+            return settings.evolution_instance_name
+        return ''.join(c for c in settings.twilio_whatsapp_number if c.isdigit())
+
+    def resolve_tenant(self, request_data: Dict) -> Optional[str]:
+        """
+        Tenant do webhook pela instância (Evolution) ou número de destino (Twilio)
+
+        Sem tenants extras configurados tudo vai para o tenant global.
+
+        Returns:
+            id do tenant ou None se a instância/número não for de nenhum tenant
+        """
+        if not self.tenant_settings:
+            return DEFAULT_TENANT
+        return self.tenant_routes.get(type(self.whatsapp_provider).tenant_key(request_data))
+
+    def tenant_config(self, tenant_id: str) -> Settings:
+        """Configuração efetiva de um tenant (a global para o tenant padrão)"""
+        if tenant_id == DEFAULT_TENANT:
+            return self.settings
+        return self.tenant_settings[tenant_id]
+
+    @cached_property
+    def event_filter(self):
+        """Resposta rápida a eventos Evolution não assinados (None no Twilio)"""
+        if self.settings.whatsapp_provider != 'evolution':
+            return None
+        from src.services.webhook_filter import EvolutionEventFilter
+        return EvolutionEventFilter(
+            self.settings.evolution_webhook_events,
+            self.resolve_tenant,
+            lambda tenant_id: self.tenant_config(tenant_id).evolution_api_key
+        )
+
+    def is_admin(self, authorization: str) -> bool:
+        """Header Authorization com o ADMIN_TOKEN (sempre False sem token configurado)"""
+        token = self.settings.admin_token
+        return bool(token) and hmac.compare_digest(authorization or '', f'Bearer {token}')
+
+    def tenant_ids(self) -> List[str]:
+        """Tenant global e tenants extras da configuração"""
+        return [DEFAULT_TENANT, *self.tenant_settings]
+
+    def has_tenant(self, tenant_id: str) -> bool:
+        return tenant_id == DEFAULT_TENANT or tenant_id in self.tenant_settings
+
+    def acquire_tenant(self, tenant_id: str):
+        """
+        Serviços do tenant (`whatsapp_provider`, `message_handler`,
+        `outbound_dispatcher`); devolver com `release_tenant`
+
+        O tenant global é o próprio container.
+        """
+        if tenant_id == DEFAULT_TENANT:
+            return self
+        return self.tenant_pool.acquire(tenant_id)
+
+    def release_tenant(self, services):
+        if services is not self:
+            self.tenant_pool.release(services)
+
+    # Warm-up
+    def warm_up(self) -> Dict[str, bool]:
+        """
+        Abre conexões keep-alive com a API e com o provedor (modo síncrono)
+
+        As requisições de saúde da API rodam em paralelo para abrir
+        `startup_warmup_connections` conexões no pool. O provedor é
+        aquecido no loop compartilhado, onde os envios acontecem.
+        """
+        from src.utils.async_runner import run_coroutine
+        connections = max(1, self.settings.startup_warmup_connections)
+        timeout = self.settings.startup_warmup_timeout_seconds
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            api_ok = any(list(pool.map(lambda _: self.api_client.health_check(), range(connections))))
+        try:
+            provider_ok = run_coroutine(self.whatsapp_provider.warm_up(), timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Warm-up do provedor falhou: {str(e)}")
+            provider_ok = False
+        return self._log_warm_up(api_ok, provider_ok)
+
+    async def warm_up_async(self) -> Dict[str, bool]:
+        """Igual a `warm_up`, no event loop do servidor ASGI"""
+        connections = max(1, self.settings.startup_warmup_connections)
+        timeout = self.settings.startup_warmup_timeout_seconds
+        results = await asyncio.gather(
+            asyncio.wait_for(asyncio.gather(*[self.api_client.health_check() for _ in range(connections)]),
+                             timeout=timeout),
+            asyncio.wait_for(self.whatsapp_provider.warm_up(), timeout=timeout),
+            return_exceptions=True
+        )
+        api_ok = not isinstance(results[0], BaseException) and any(results[0])
+        provider_ok = results[1] is True
+        return self._log_warm_up(api_ok, provider_ok)
+
+    @staticmethod
+    def _log_warm_up(api_ok: bool, provider_ok: bool) -> Dict[str, bool]:
+        if not (api_ok and provider_ok):
+            logger.warning(f"Warm-up incompleto: api={api_ok}, provedor={provider_ok}")
+        return {'api': api_ok, 'provider': provider_ok}
+
+    # Ciclo de vida
+    def start(self):
+        """Inicia os serviços em background (prefetch, outbox, lembretes, workers, prontidão, métricas)"""
+        for service in (self.slot_prefetcher, self.outbox, self.reminder_engine, self.worker_pool,
+                        self.readiness):
+            if service is not None:
+                service.start()
+        self.metrics_exporter.start()
+
+    def stop(self):
+        for name in ('readiness', 'worker_pool', 'reminder_engine', 'outbox', 'slot_prefetcher'):
+            if self._built(name):
+                getattr(self, name).stop()
+
+    async def close_async(self):
+        """Fecha os clientes HTTP já construídos (entrada ASGI)"""
+        if self._built('api_client'):
+            await self.api_client.close()
+        if self._built('whatsapp_provider'):
+            close = getattr(self.whatsapp_provider, 'close', None)
+            if close is not None:
+                await close()
+        if self._built('tenant_pool'):
+            self.tenant_pool.close_all()
+
+    def stats(self) -> Dict:
+        """Estatísticas internas (filas, sessões, caches)"""
+        return {
+            'webhook_mode': self.settings.webhook_mode,
+            'workers': self.worker_pool.stats() if self.worker_pool is not None else None,
+            'sessions': self.session_store.size(),
+            'api_cache': self.api_client.cache_stats(),
+            'api_transport': self.api_client.transport_stats(),
+            'outbound': self.outbound_dispatcher.stats(),
+            'reminders': self.reminder_engine.stats() if self.reminder_engine is not None else None,
+            'outbox': self.outbox.stats() if self.outbox is not None else None,
+            'dedup': self.deduplicator.stats(),
+            'admission': self.admission.stats(),
+            'tenants': self.tenant_pool.stats() if self.tenant_pool is not None else None
+        }
@@ -2,61 +2,171 @@
 Handler para processar mensagens do WhatsApp
 """
 import logging
-import re
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional
-from src.services.api_client import APIClient
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from src.handlers.state_machine import ConversationFlow, IDLE, normalize
+from src.services.api_client import APIClient, BackendUnavailableError, appointment_start
+from src.services.availability import AvailabilityEngine
+from src.services.session_store import ConversationSession, SessionStore, InMemorySessionStore
+from src.utils import metrics, profiler, tracing
+from src.utils.async_runner import maybe_await, run_inline
 
 logger = logging.getLogger(__name__)
 
+# Etapas do fluxo aceitam resultados do APIClient e do AsyncAPIClient
+_await = maybe_await
+
+HANDLER_LATENCY = metrics.histogram(
+    'whatsapp_handler_seconds',
+    'Tempo de processamento da mensagem pelo estado da conversa ao recebê-la',
+    ('state',)
+)
+
+UNAVAILABLE_REPLY = ("⚠️ Nosso sistema está temporariamente indisponível.\n"
+                     "Por favor, tente novamente em alguns minutos.")
+
+# Estados do fluxo de agendamento
+AGUARDANDO_NOME = 'aguardando_nome'
+AGUARDANDO_DATA = 'aguardando_data'
+AGUARDANDO_HORARIO = 'aguardando_horario'
+AGUARDANDO_SERVICO = 'aguardando_servico'
+LISTANDO_AGENDAMENTOS = 'listando_agendamentos'
+
+DIAS_SEMANA = ('seg', 'ter', 'qua', 'qui', 'sex', 'sáb', 'dom')
+
+# Fluxo de conversa: registrado uma vez, resolvido por (estado, texto)
+FLOW = (
+    ConversationFlow()
+    .on('oi', 'olá', 'ola', 'hey', 'inicio', 'start', 'menu', action='menu')
+    .on('ajuda', 'help', '?', action='ajuda')
+    # Atalhos numéricos só valem fora de um fluxo (no fluxo, "1" é uma opção da lista)
+    .on('1', action='agendar', states=(IDLE, LISTANDO_AGENDAMENTOS))
+    .on('2', action='listar', states=(IDLE, LISTANDO_AGENDAMENTOS))
+    .on('3', action='cancelar', states=(IDLE, LISTANDO_AGENDAMENTOS))
+    .on('mais', 'ver mais', 'more', action='mais_agendamentos', states=(LISTANDO_AGENDAMENTOS,))
+    # Na etapa de data: busca em vários dias em vez de uma data específica
+    .on('proximos', 'próximos', 'proximos horarios', 'próximos horários',
+        action='proximos_horarios', states=(AGUARDANDO_DATA,))
+    .on('semana', 'esta semana', 'essa semana', action='horarios_semana', states=(AGUARDANDO_DATA,))
+    .on_keyword('agendar', action='agendar')
+    .on_keyword('meus agendamentos', action='listar')
+    .on_keyword('cancelar', action='cancelar')
+    .state(AGUARDANDO_NOME, 'processar_nome')
+    .state(AGUARDANDO_DATA, 'processar_data')
+    .state(AGUARDANDO_HORARIO, 'processar_horario')
+    .state(AGUARDANDO_SERVICO, 'processar_servico')
+)
+
 
 class MessageHandler:
-    """Processa mensagens recebidas do WhatsApp"""
+    """
+    Processa mensagens recebidas do WhatsApp
+    
+    As etapas do fluxo são corrotinas e funcionam com o APIClient (Flask,
+    via `process_message`) ou com o AsyncAPIClient (ASGI, via
+    `process_message_async`).
+    """
     
-    def __init__(self, api_client: APIClient, whatsapp_provider=None):
+    MAX_SLOTS = 10  # Horários oferecidos por data
+    APPOINTMENTS_PAGE = 5  # Agendamentos por página em "meus agendamentos"
+    NEXT_SLOTS = 5  # Horários oferecidos por "próximos"
+    
+    def __init__(self, api_client: APIClient, whatsapp_provider=None,
+                 session_store: Optional[SessionStore] = None,
+                 availability: Optional[AvailabilityEngine] = None):
         self.api = api_client
         self.whatsapp_provider = whatsapp_provider
-        self.user_sessions: Dict[str, Dict] = {}  # Cache de sessões de usuário
+        self.sessions = session_store or InMemorySessionStore()
+        self.availability = availability or AvailabilityEngine(api_client)
+        
+        # Ações do FLOW -> métodos (from_number, texto, sessão) -> resposta
+        self._actions: Dict[str, Callable[[str, str, ConversationSession], Any]] = {
+            'menu': lambda *_: self._menu_principal(),
+            'ajuda': lambda *_: self._help_message(),
+            'agendar': self._iniciar_agendamento,
+            'listar': self._listar_agendamentos,
+            'mais_agendamentos': self._mais_agendamentos,
+            'cancelar': self._iniciar_cancelamento,
+            'processar_nome': self._processar_nome,
+            'processar_data': self._processar_data,
+            'proximos_horarios': self._proximos_horarios,
+            'horarios_semana': self._horarios_semana,
+            'processar_horario': self._processar_horario,
+            'processar_servico': self._processar_servico,
+        }
+        missing = FLOW.actions() - self._actions.keys()
+        if missing:
+            raise ValueError(f"Ações sem implementação no fluxo: {sorted(missing)}")
     
     def process_message(self, message: str, from_number: str) -> str:
+        """Processa mensagem e retorna resposta (APIClient síncrono)"""
+        return run_inline(self.process_message_async(message, from_number, offload=False))
+    
+    async def process_message_async(self, message: str, from_number: str, offload: bool = True,
+                                    session: Optional[ConversationSession] = None) -> str:
         """
         Processa mensagem e retorna resposta
-        """
-        message = message.lower().strip()
-        
-        # Comandos básicos
-        if message in ['oi', 'olá', 'ola', 'hey', 'inicio', 'start', 'menu']:
-            return self._menu_principal()
-        
-        if message in ['ajuda', 'help', '?']:
-            return self._help_message()
         
-        if message == '1' or 'agendar' in message:
-            return self._iniciar_agendamento(from_number)
+        A sessão é lida uma vez no início e gravada uma vez no fim
+        (somente se mudou), independente do backend de sessões. Com
+        `offload` (event loop), um backend bloqueante (Redis) é acessado em
+        uma thread.
         
-        if message == '2' or 'meus agendamentos' in message:
-            return self._listar_agendamentos(from_number)
-        
-        if message == '3' or 'cancelar' in message:
-            return self._iniciar_cancelamento(from_number)
-        
-        # Processar fluxo de agendamento
-        session = self.user_sessions.get(from_number, {})
-        if session.get('status') == 'aguardando_nome':
-            return self._processar_nome(from_number, message)
-        
-        if session.get('status') == 'aguardando_data':
-            return self._processar_data(from_number, message)
+        Args:
+            session: sessão já lida pelo chamador (ex: na admissão); não é
+                lida de novo
+        """
+        with profiler.region():
+            return await self._process(message, from_number, offload, session)
+    
+    async def _process(self, message: str, from_number: str, offload: bool,
+                       session: Optional[ConversationSession] = None) -> str:
+        started = time.perf_counter()
+        if session is None:
+            with tracing.span('session.get'):
+                if offload:
+                    session = await self.sessions.get_async(from_number)
+                else:
+                    session = self.sessions.get(from_number)
+                session = session or ConversationSession()
+        before = session.copy()
         
-        if session.get('status') == 'aguardando_horario':
-            return self._processar_horario(from_number, message)
+        try:
+            with tracing.span('handler.dispatch', state=before.state or 'idle'):
+                reply = await self._dispatch(message, from_number, session)
+        except BackendUnavailableError:
+            # Circuito aberto: falha rápida com resposta amigável
+            logger.warning("API backend indisponível, respondendo com mensagem padrão")
+            return UNAVAILABLE_REPLY
+        finally:
+            HANDLER_LATENCY.labels(before.state or 'idle').observe(time.perf_counter() - started)
         
-        if session.get('status') == 'aguardando_servico':
-            return self._processar_servico(from_number, message)
+        if session != before:
+            with tracing.span('session.save'):
+                if session:
+                    session.updated_at = time.time()
+                    if offload:
+                        await self.sessions.set_async(from_number, session)
+                    else:
+                        self.sessions.set(from_number, session)
+                elif offload:
+                    await self.sessions.delete_async(from_number)
+                else:
+                    self.sessions.delete(from_number)
+        return reply
+    
+    async def _dispatch(self, message: str, from_number: str, session: ConversationSession) -> str:
+        """Roteia a mensagem para o comando ou etapa do fluxo"""
+        message = normalize(message)
+        action = FLOW.resolve(session.state, message)
+        tracing.annotate(action=action)
         
-        # Mensagem não reconhecida
-        return ("❓ Desculpe, não entendi sua mensagem.\n\n"
-                "Digite *menu* para ver as opções disponíveis.")
+        if action is None:
+            # Mensagem não reconhecida
+            return ("❓ Desculpe, não entendi sua mensagem.\n\n"
+                    "Digite *menu* para ver as opções disponíveis.")
+        return await _await(self._actions[action](from_number, message, session))
     
     def _menu_principal(self) -> str:
         """Retorna menu principal"""
@@ -77,56 +187,64 @@ class MessageHandler:
                 "• *cancelar* - Cancelar um agendamento\n\n"
                 "Precisa de ajuda? Entre em contato conosco!")
     
-    def _iniciar_agendamento(self, from_number: str) -> str:
+    @staticmethod
+    def _aguardar_data(session: ConversationSession, customer: Dict):
+        """Reinicia a sessão na etapa de data para o cliente"""
+        session.clear()
+        session.state = AGUARDANDO_DATA
+        session.customer_id = customer['id']
+        session.customer_name = customer['name']
+    
+    async def _iniciar_agendamento(self, from_number: str, text: str,
+                             session: ConversationSession) -> str:
         """Inicia processo de agendamento"""
         # Verificar se cliente já existe
         phone = from_number.replace('whatsapp:', '')
-        customer = self.api.get_customer_by_phone(phone)
+        customer = await _await(self.api.get_customer_by_phone(phone))
         
         if customer:
             # Cliente já cadastrado
-            self.user_sessions[from_number] = {
-                'status': 'aguardando_data',
-                'customer': customer
-            }
+            self._aguardar_data(session, customer)
             return (f"✅ Olá *{customer['name']}*!\n\n"
                    "📅 Para qual data você gostaria de agendar?\n"
                    "Digite no formato: DD/MM/YYYY\n"
-                   "Exemplo: 30/01/2026")
+                   "Exemplo: 30/01/2026\n\n"
+                   "Ou digite *próximos* (ou *semana*) para ver os horários livres.")
         else:
             # Cliente novo - solicitar nome
-            self.user_sessions[from_number] = {
-                'status': 'aguardando_nome'
-            }
+            session.clear()
+            session.state = AGUARDANDO_NOME
             return ("👋 Olá! Vejo que é sua primeira vez aqui.\n\n"
                    "📝 Por favor, digite seu nome completo:")
     
-    def _processar_nome(self, from_number: str, nome: str) -> str:
+    async def _processar_nome(self, from_number: str, nome: str,
+                        session: ConversationSession) -> str:
         """Processa nome do novo cliente"""
         # Criar cliente
         phone = from_number.replace('whatsapp:', '')
         
         try:
-            customer = self.api.create_customer(
+            customer = await _await(self.api.create_customer(
                 name=nome.title(),
                 phone=phone
-            )
+            ))
             
-            self.user_sessions[from_number] = {
-                'status': 'aguardando_data',
-                'customer': customer
-            }
+            self._aguardar_data(session, customer)
             
             return (f"✅ Prazer em conhecê-lo, *{customer['name']}*!\n\n"
                    "📅 Para qual data você gostaria de agendar?\n"
                    "Digite no formato: DD/MM/YYYY\n"
-                   "Exemplo: 30/01/2026")
+                   "Exemplo: 30/01/2026\n\n"
+                   "Ou digite *próximos* (ou *semana*) para ver os horários livres.")
         
+        except BackendUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Erro ao criar cliente: {e}")
             return "❌ Erro ao cadastrar. Tente novamente mais tarde."
     
-    def _processar_data(self, from_number: str, data_str: str) -> str:
+    async def _processar_data(self, from_number: str, data_str: str,
+                        session: ConversationSession) -> str:
         """Processa data escolhida"""
         try:
             # Tentar parsear data
@@ -137,22 +255,22 @@ class MessageHandler:
                 return "❌ Data inválida. Por favor, escolha uma data futura."
             
             # Buscar horários disponíveis
-            slots = self.api.get_available_slots(data)
+            slots = await _await(self.api.get_available_slots(data))
             
             if not slots:
                 return ("❌ Não há horários disponíveis nesta data.\n"
-                       "Por favor, escolha outra data.")
+                       "Por favor, escolha outra data ou digite *próximos*.")
             
-            # Atualizar sessão
-            session = self.user_sessions[from_number]
-            session['status'] = 'aguardando_horario'
-            session['data'] = data
-            session['slots'] = slots
+            # Atualizar sessão (somente os horários oferecidos)
+            slot_times = tuple(slot['startTime'] for slot in slots[:self.MAX_SLOTS])
+            session.state = AGUARDANDO_HORARIO
+            session.date = data.isoformat()
+            session.slot_times = slot_times
             
             # Montar mensagem com horários
             horarios_text = "\n".join([
-                f"{i+1}. {slot['startTime'][11:16]}"
-                for i, slot in enumerate(slots[:10])  # Max 10 horários
+                f"{i+1}. {start_time[11:16]}"
+                for i, start_time in enumerate(slot_times)
             ])
             
             return (f"✅ Data selecionada: *{data.strftime('%d/%m/%Y')}*\n\n"
@@ -164,19 +282,64 @@ class MessageHandler:
                    "Use: DD/MM/YYYY\n"
                    "Exemplo: 30/01/2026")
     
-    def _processar_horario(self, from_number: str, escolha: str) -> str:
+    async def _proximos_horarios(self, from_number: str, text: str,
+                           session: ConversationSession) -> str:
+        """Próximos horários livres em qualquer dia do horizonte"""
+        return await self._horarios_livres(
+            self.availability.next_free(self.NEXT_SLOTS), "Próximos horários livres", session
+        )
+    
+    async def _horarios_semana(self, from_number: str, text: str,
+                         session: ConversationSession) -> str:
+        """Horários livres de hoje até domingo"""
+        return await self._horarios_livres(
+            self.availability.this_week(self.MAX_SLOTS), "Horários livres nesta semana", session
+        )
+    
+    async def _horarios_livres(self, busca: Awaitable[List[datetime]], titulo: str,
+                         session: ConversationSession) -> str:
+        """
+        Oferece horários de vários dias (uma busca no período)
+        
+        A sessão guarda os horários completos (data e hora), então a
+        escolha segue por `_processar_horario` como na busca por data.
+        """
+        try:
+            slots = await busca
+        except BackendUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao buscar horários livres: {e}")
+            return "❌ Erro ao buscar horários. Digite uma data no formato DD/MM/YYYY."
+        
+        if not slots:
+            return ("❌ Não há horários livres no período.\n"
+                   "Por favor, digite uma data no formato DD/MM/YYYY.")
+        
+        session.state = AGUARDANDO_HORARIO
+        session.date = None
+        session.slot_times = tuple(slot.isoformat() for slot in slots)
+        
+        horarios_text = "\n".join([
+            f"{i+1}. {slot.strftime('%d/%m')} ({DIAS_SEMANA[slot.weekday()]}) {slot.strftime('%H:%M')}"
+            for i, slot in enumerate(slots)
+        ])
+        
+        return (f"⏰ {titulo}:\n{horarios_text}\n\n"
+               "Digite o número do horário desejado:")
+    
+    async def _processar_horario(self, from_number: str, escolha: str,
+                           session: ConversationSession) -> str:
         """Processa horário escolhido"""
         try:
-            session = self.user_sessions[from_number]
-            slots = session['slots']
+            slots = session.slot_times
             index = int(escolha) - 1
             
             if index < 0 or index >= len(slots):
                 return "❌ Opção inválida. Digite um número da lista."
             
-            slot = slots[index]
-            session['status'] = 'aguardando_servico'
-            session['slot'] = slot
+            session.state = AGUARDANDO_SERVICO
+            session.slot_time = slots[index]
             
             return ("✅ Horário selecionado!\n\n"
                    "💈 Qual serviço você deseja?\n"
@@ -185,73 +348,98 @@ class MessageHandler:
         except ValueError:
             return "❌ Digite apenas o número da opção."
     
-    def _processar_servico(self, from_number: str, servico: str) -> str:
+    async def _processar_servico(self, from_number: str, servico: str,
+                           session: ConversationSession) -> str:
         """Processa serviço e confirma agendamento"""
         try:
-            session = self.user_sessions[from_number]
-            customer = session['customer']
-            slot = session['slot']
+            customer_name = session.customer_name
             
             # Criar agendamento
-            start_time = datetime.fromisoformat(slot['startTime'])
+            start_time = datetime.fromisoformat(session.slot_time)
             end_time = start_time + timedelta(hours=1)  # Duração padrão 1h
             
-            appointment = self.api.create_appointment(
-                customer_id=customer['id'],
+            appointment = await _await(self.api.create_appointment(
+                customer_id=session.customer_id,
                 start_time=start_time,
                 end_time=end_time,
                 service=servico.title()
-            )
+            ))
             
             # Limpar sessão
-            del self.user_sessions[from_number]
+            session.clear()
             
             return (f"✅ *Agendamento confirmado!*\n\n"
-                   f"👤 Cliente: {customer['name']}\n"
+                   f"👤 Cliente: {customer_name}\n"
                    f"📅 Data: {start_time.strftime('%d/%m/%Y')}\n"
                    f"⏰ Horário: {start_time.strftime('%H:%M')}\n"
                    f"💈 Serviço: {servico.title()}\n\n"
                    f"📱 Você receberá um lembrete antes do horário.\n\n"
                    f"Digite *menu* para mais opções.")
         
+        except BackendUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Erro ao criar agendamento: {e}")
             return "❌ Erro ao confirmar agendamento. Tente novamente."
     
-    def _listar_agendamentos(self, from_number: str) -> str:
-        """Lista agendamentos do cliente"""
+    async def _listar_agendamentos(self, from_number: str, text: str,
+                             session: ConversationSession) -> str:
+        """Lista a primeira página dos agendamentos futuros do cliente"""
         phone = from_number.replace('whatsapp:', '')
-        customer = self.api.get_customer_by_phone(phone)
+        customer = await _await(self.api.get_customer_by_phone(phone))
         
         if not customer:
             return "❌ Você ainda não tem cadastro. Digite *agendar* para começar."
         
-        try:
-            appointments = self.api.get_customer_appointments(customer['id'])
-            
-            if not appointments:
-                return "📅 Você não tem agendamentos no momento."
-            
-            # Filtrar apenas agendamentos futuros
-            future = [apt for apt in appointments 
-                     if datetime.fromisoformat(apt['startTime']) >= datetime.now()]
-            
-            if not future:
-                return "📅 Você não tem agendamentos futuros."
-            
-            text = "📅 *Seus agendamentos:*\n\n"
-            for apt in future[:5]:  # Max 5
-                start = datetime.fromisoformat(apt['startTime'])
-                text += (f"🗓️ {start.strftime('%d/%m/%Y às %H:%M')}\n"
-                        f"   {apt.get('service', 'Serviço')}\n\n")
-            
-            return text + "Digite *menu* para mais opções."
+        return await self._pagina_agendamentos(customer['id'], None, session)
+    
+    async def _mais_agendamentos(self, from_number: str, text: str,
+                           session: ConversationSession) -> str:
+        """Próxima página de "meus agendamentos" """
+        return await self._pagina_agendamentos(session.customer_id, session.cursor, session)
+    
+    async def _pagina_agendamentos(self, customer_id: str, cursor: Optional[str],
+                             session: ConversationSession) -> str:
+        """
+        Busca uma página (só futuros, filtrados e limitados pela API)
         
+        Com mais páginas, a sessão guarda o cursor para o comando *mais*;
+        dentro de outro fluxo (ex: agendamento) a sessão não é alterada.
+        """
+        try:
+            page = await _await(self.api.get_upcoming_appointments(
+                customer_id, limit=self.APPOINTMENTS_PAGE, cursor=cursor
+            ))
+        except BackendUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Erro ao listar agendamentos: {e}")
             return "❌ Erro ao buscar agendamentos."
+        
+        paging = session.state in (IDLE, LISTANDO_AGENDAMENTOS)
+        if paging:
+            session.clear()
+        
+        if not page['items']:
+            if cursor:
+                return "📅 Não há mais agendamentos.\n\nDigite *menu* para mais opções."
+            return "📅 Você não tem agendamentos futuros."
+        
+        text = "📅 *Seus agendamentos:*\n\n" if not cursor else "📅 *Mais agendamentos:*\n\n"
+        for apt in page['items']:
+            start = datetime.fromisoformat(appointment_start(apt).replace('Z', '+00:00'))
+            text += (f"🗓️ {start.strftime('%d/%m/%Y às %H:%M')}\n"
+                    f"   {apt.get('title') or apt.get('service') or 'Serviço'}\n\n")
+        
+        if page['next_cursor'] and paging:
+            session.state = LISTANDO_AGENDAMENTOS
+            session.customer_id = customer_id
+            session.cursor = page['next_cursor']
+            return text + "Digite *mais* para ver os próximos ou *menu* para mais opções."
+        return text + "Digite *menu* para mais opções."
     
-    def _iniciar_cancelamento(self, from_number: str) -> str:
+    async def _iniciar_cancelamento(self, from_number: str, text: str,
+                              session: ConversationSession) -> str:
         """Inicia processo de cancelamento"""
         return ("⚠️ Para cancelar um agendamento, "
                "entre em contato diretamente conosco.\n\n"
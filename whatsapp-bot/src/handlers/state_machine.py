@@ -0,0 +1,85 @@
+"""
+Máquina de estados declarativa para o fluxo de conversa
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+# Estado de quem não está em nenhum fluxo
+IDLE: Optional[str] = None
+
+_ANY = object()
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sem espaços nas pontas e com espaços internos colapsados"""
+    return ' '.join(text.lower().split())
+
+
+class ConversationFlow:
+    """
+    Registro de comandos e estados, indexado uma única vez na inicialização
+
+    Ordem de resolução de uma mensagem (estado, texto normalizado):
+
+    1. entrada exata registrada para o estado (ex: "1" no menu ocioso);
+    2. entrada exata global (ex: "menu", "ajuda");
+    3. palavra-chave contida na mensagem (palavra ou par de palavras);
+    4. ação padrão do estado (entrada livre: nome, data, horário...).
+
+    Os passos 1, 2 e 4 são buscas em dicionário; o passo 3 custa uma busca
+    por palavra da mensagem.
+    """
+
+    def __init__(self):
+        self._exact: Dict[Tuple[object, str], str] = {}
+        self._keywords: Dict[Tuple[object, str], str] = {}
+        self._states: Dict[Optional[str], str] = {}
+        self._keyword_scopes = set()
+
+    def on(self, *inputs: str, action: str, states: Iterable[Optional[str]] = (_ANY,)):
+        """Associa entradas exatas a uma ação (globais ou restritas a estados)"""
+        for state in states:
+            for text in inputs:
+                self._exact[(state, normalize(text))] = action
+        return self
+
+    def on_keyword(self, *keywords: str, action: str,
+                   states: Iterable[Optional[str]] = (_ANY,)):
+        """Ação disparada quando a mensagem contém a palavra (ou par de palavras)"""
+        for state in states:
+            self._keyword_scopes.add(state)
+            for keyword in keywords:
+                self._keywords[(state, normalize(keyword))] = action
+        return self
+
+    def state(self, name: str, action: str):
+        """Ação padrão para entrada livre no estado"""
+        self._states[name] = action
+        return self
+
+    def actions(self) -> set:
+        """Nomes de todas as ações registradas"""
+        return set(self._exact.values()) | set(self._keywords.values()) | set(self._states.values())
+
+    def _match_keyword(self, state: Optional[str], text: str) -> Optional[str]:
+        scopes = [s for s in (state, _ANY) if s in self._keyword_scopes]
+        if not scopes:
+            return None
+        words = text.split()
+        for i, word in enumerate(words):
+            candidates = (word, f"{word} {words[i + 1]}") if i + 1 < len(words) else (word,)
+            for candidate in candidates:
+                for scope in scopes:
+                    action = self._keywords.get((scope, candidate))
+                    if action is not None:
+                        return action
+        return None
+
+    def resolve(self, state: Optional[str], text: str) -> Optional[str]:
+        """Retorna o nome da ação para a mensagem (já normalizada) no estado"""
+        action = self._exact.get((state, text)) or self._exact.get((_ANY, text))
+        if action is not None:
+            return action
+        action = self._match_keyword(state, text)
+        if action is not None:
+            return action
+        return self._states.get(state)
@@ -0,0 +1,313 @@
+"""
+Fluxo das rotas do bot, independente do framework
+
+O Flask (src/bot.py) e a aplicação ASGI (src/asgi.py) só adaptam a
+requisição (corpo, headers, form) e a resposta (`Reply` -> JSON ou TwiML);
+parse, tenant, deduplicação, admissão e despacho ficam aqui. Os métodos são
+corrotinas: no ASGI são aguardados no event loop, com o I/O bloqueante
+(Redis, SQLite, arquivos) em threads; no Flask o webhook roda com
+`run_inline` (nenhum `await` suspende com o APIClient síncrono).
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from src.container import DEFAULT_TENANT, ServiceContainer, WEBHOOKS, WEBHOOK_PARSE_LATENCY
+from src.services.admission import HIGH_DEMAND_REPLY
+from src.services.session_store import ConversationSession
+from src.services.worker_pool import SenderLocks
+from src.utils import json_codec, profiler, tracing
+from src.utils.logging_setup import bind_request, get_logger
+
+logger = logging.getLogger(__name__)
+log = get_logger(__name__)
+
+ERROR_REPLY = "❌ Desculpe, ocorreu um erro. Tente novamente mais tarde."
+INVALID_REPLY = "❌ Webhook inválido ou incompleto."
+QUEUE_FULL_REPLY = "⏳ Estamos com muitas mensagens no momento. Tente novamente em instantes."
+
+
+class Reply(NamedTuple):
+    """Resposta de uma rota: corpo JSON ou, com `twiml`, o texto da mensagem (None = TwiML vazio)"""
+    status: int
+    body: Any
+    twiml: bool = False
+
+
+def json_reply(body: Any, status: int = 200) -> Reply:
+    return Reply(status, body)
+
+
+def twiml_reply(message: Optional[str] = None, status: int = 200) -> Reply:
+    return Reply(status, message, twiml=True)
+
+
+class BotPipeline:
+    """
+    Webhook, envio proativo e profiler sobre o ServiceContainer
+
+    Com o container assíncrono (ASGI), o handler roda com
+    `process_message_async` e as chamadas bloqueantes vão para threads; no
+    síncrono (Flask) tudo roda na thread da requisição.
+    """
+
+    def __init__(self, services: ServiceContainer):
+        self.services = services
+        self.settings = services.settings
+        self.offload = services.asynchronous
+        # Inline: mensagens do mesmo remetente (no tenant) processadas uma de cada vez
+        self.sender_locks = SenderLocks(asynchronous=services.asynchronous)
+
+    # Webhook
+    async def webhook(self, body: bytes, headers, form: Callable[[], Dict],
+                      traceparent: Optional[str] = None) -> Reply:
+        """
+        Webhook universal (Twilio form data ou Evolution JSON)
+
+        Args:
+            body: corpo bruto (Evolution)
+            headers: headers da requisição (`apikey` da Evolution)
+            form: campos do form data (Twilio), lidos só para esse provedor
+            traceparent: header W3C recebido
+        """
+        provider = self.settings.whatsapp_provider
+        evolution = provider == 'evolution'
+        services = self.services
+        bind_request()
+        trace = tracing.start('webhook', traceparent=traceparent, provider=provider)
+        tenant = None
+        admitted = False
+        # ID marcado pelo deduplicador: liberado se a resposta for um erro (o provedor reenvia)
+        seen_id = None
+        try:
+            parse_started = time.perf_counter()
+            if evolution:
+                # Eventos não assinados voltam sem decodificar o corpo
+                early = services.event_filter.screen(body, headers)
+                if early is not None:
+                    status, payload, outcome = early
+                    WEBHOOKS.labels(provider, outcome).inc()
+                    return json_reply(payload, status)
+                data = json_codec.loads(body or b'{}') or {}
+                payload = data
+            else:
+                data = None
+                payload = form()
+
+            # Tenant pela instância (Evolution) ou número de destino (Twilio)
+            tenant_id = services.resolve_tenant(payload)
+            if tenant_id is None:
+                logger.warning(f"Webhook de tenant desconhecido: {type(services.whatsapp_provider).tenant_key(payload)}")
+                WEBHOOKS.labels(provider, 'unknown_tenant').inc()
+                return json_reply({'error': 'Unknown tenant'}, 404)
+            tenant = services.acquire_tenant(tenant_id)
+
+            if evolution and not tenant.whatsapp_provider.validate_webhook({'headers': headers, 'body': data}):
+                logger.warning("Evolution webhook inválido")
+                WEBHOOKS.labels(provider, 'unauthorized').inc()
+                return json_reply({'error': 'Unauthorized'}, 401)
+            msg_data = tenant.whatsapp_provider.parse_incoming_message(payload)
+            msg_data['tenant'] = tenant_id
+            tracing.annotate(tenant=tenant_id)
+            WEBHOOK_PARSE_LATENCY.labels(provider).observe(time.perf_counter() - parse_started)
+
+            incoming_msg = msg_data.get('message', '')
+            from_number = msg_data.get('from_number', '')
+            message_id = msg_data.get('message_id')
+            bind_request(from_number, message_id)
+            log.info("webhook_received", provider=provider, tenant=tenant_id,
+                     webhook_event=lambda: data.get('event', 'unknown') if data is not None else 'message')
+            if not incoming_msg or not from_number:
+                WEBHOOKS.labels(provider, 'invalid').inc()
+                if evolution:
+                    return json_reply({'error': 'Missing message or from_number'}, 400)
+                return twiml_reply(INVALID_REPLY)
+
+            # Reenvio do provedor (mesmo ID): confirmar sem reprocessar
+            if await self._is_duplicate(message_id):
+                log.info("webhook_duplicate", provider=provider)
+                WEBHOOKS.labels(provider, 'duplicate').inc()
+                return json_reply({'status': 'duplicate'}) if evolution else twiml_reply()
+            seen_id = message_id
+
+            # Admissão: com o orçamento esgotado, conversas em andamento passam primeiro
+            handler = tenant.message_handler
+            worker_pool = services.worker_pool
+
+            # Modo background: enfileirar e confirmar recebimento imediatamente
+            if worker_pool is not None:
+                # A sessão lida na admissão não vai para o worker: mensagens
+                # anteriores do remetente ainda na fila podem alterá-la
+                if not (await self._admit(handler.sessions, from_number))[0]:
+                    return await self._shed(provider, message_id, queued=True)
+                if not worker_pool.submit(msg_data):
+                    services.admission.release()
+                    WEBHOOKS.labels(provider, 'queue_full').inc()
+                    if evolution:
+                        await self._forget(message_id)
+                        return json_reply({'error': 'Queue full'}, 503)
+                    return twiml_reply(QUEUE_FULL_REPLY)
+                WEBHOOKS.labels(provider, 'queued').inc()
+                return json_reply({'status': 'queued'}) if evolution else twiml_reply()
+
+            # Processar mensagem e montar resposta (a vaga é devolvida no finally).
+            # A admissão fica dentro do lock do remetente: a sessão lida por ela
+            # (só com as vagas livres esgotadas) é a que o handler usa, sem reler
+            try:
+                async with self.sender_locks.hold(f'{tenant_id}:{from_number}'):
+                    admitted, session = await self._admit(handler.sessions, from_number)
+                    if admitted:
+                        reply = await handler.process_message_async(
+                            incoming_msg, from_number, offload=self.offload, session=session)
+                if not admitted:
+                    return await self._shed(provider, message_id, queued=False)
+                WEBHOOKS.labels(provider, 'processed').inc()
+            except Exception as e:
+                logger.error(f"Erro ao processar mensagem: {str(e)}", exc_info=True)
+                WEBHOOKS.labels(provider, 'error').inc()
+                if evolution:
+                    await self._forget(seen_id)
+                    return json_reply({'error': 'Internal error'}, 500)
+                return twiml_reply(ERROR_REPLY)
+            return json_reply({'reply': reply}) if evolution else twiml_reply(reply)
+        except Exception as e:
+            logger.error(f"Erro ao processar webhook: {str(e)}", exc_info=True)
+            WEBHOOKS.labels(provider, 'error').inc()
+            if evolution:
+                await self._forget(seen_id)
+                return json_reply({'error': 'Internal error'}, 500)
+            return twiml_reply(ERROR_REPLY)
+        finally:
+            if admitted:
+                services.admission.release()
+            if tenant is not None:
+                services.release_tenant(tenant)
+            tracing.finish(trace)
+
+    async def _is_duplicate(self, message_id: Optional[str]) -> bool:
+        deduplicator = self.services.deduplicator
+        if self.offload:
+            return await deduplicator.is_duplicate_async(message_id)
+        return deduplicator.is_duplicate(message_id)
+
+    async def _forget(self, message_id: Optional[str]):
+        deduplicator = self.services.deduplicator
+        if self.offload:
+            await deduplicator.forget_async(message_id)
+        else:
+            deduplicator.forget(message_id)
+
+    async def _admit(self, sessions, from_number: str) -> Tuple[bool, Optional[ConversationSession]]:
+        """
+        (admitido, sessão): a sessão vem quando a admissão precisou lê-la
+        para decidir a prioridade (vazia se o remetente não tem sessão)
+        """
+        admission = self.services.admission
+        loaded = []
+
+        def keep(session):
+            loaded.append(session or ConversationSession())
+            return session
+
+        if self.offload:
+            async def is_active():
+                return keep(await sessions.get_async(from_number))
+            admitted = await admission.admit_async(is_active)
+        else:
+            admitted = admission.admit(lambda: keep(sessions.get(from_number)))
+        return admitted, (loaded[0] if loaded else None)
+
+    async def _shed(self, provider: str, message_id: Optional[str], queued: bool) -> Reply:
+        """Resposta com o orçamento de admissão esgotado (ADMISSION_SHED_RESPONSE)"""
+        WEBHOOKS.labels(provider, 'shed').inc()
+        mode = self.settings.admission_shed_response
+        evolution = provider == 'evolution'
+        # Evolution em background não tem resposta no corpo do webhook
+        if mode == 'reply' and not (evolution and queued):
+            return json_reply({'reply': HIGH_DEMAND_REPLY}) if evolution else twiml_reply(HIGH_DEMAND_REPLY)
+        # O provedor reenvia após o erro: o reenvio não pode ser tratado como duplicado
+        await self._forget(message_id)
+        return json_reply({'error': 'High demand'}, 429 if mode == '429' else 503)
+
+    # Envio proativo
+    async def send(self, body: bytes) -> Reply:
+        """
+        Envio de uma mensagem ({"to", "message"}) ou de um lote
+        ({"messages": [{"to", "message", "media_url"?}, ...]}), com "tenant"
+        opcional (padrão: configuração global)
+
+        Roda no loop compartilhado (o Flask usa `run_coroutine`).
+        """
+        settings = self.settings
+        tenant = None
+        try:
+            data = json_codec.loads(body or b'{}') or {}
+            batch = data.get('messages')
+            single = batch is None
+            if single:
+                batch = [{'to': data.get('to'), 'message': data.get('message')}]
+
+            if not isinstance(batch, list) or not batch:
+                return json_reply({'error': 'Missing messages'}, 400)
+            if len(batch) > settings.outbound_max_batch:
+                return json_reply({'error': f'Batch too large (max {settings.outbound_max_batch})'}, 413)
+            for item in batch:
+                if not isinstance(item, dict) or not item.get('to') or not (item.get('message') or item.get('media_url')):
+                    return json_reply({'error': 'Missing to or message'}, 400)
+
+            tenant_id = data.get('tenant') or DEFAULT_TENANT
+            if not self.services.has_tenant(tenant_id):
+                return json_reply({'error': 'Unknown tenant'}, 404)
+            tenant = self.services.acquire_tenant(tenant_id)
+
+            results = await asyncio.wait_for(
+                tenant.outbound_dispatcher.send_batch(batch),
+                timeout=settings.outbound_max_wait_seconds + settings.reply_send_timeout_seconds
+            )
+            sent = sum(1 for result in results if result.get('success'))
+            log.info("send_completed", sent=sent, total=len(results))
+            for result in results:
+                result.pop('response', None)
+
+            if single:
+                result = results[0]
+                result['message_sid'] = result.get('message_id', '')
+                return json_reply(result, 200 if result.get('success') else 502)
+            return json_reply({
+                'success': sent == len(results),
+                'sent': sent,
+                'failed': len(results) - sent,
+                'results': results
+            })
+        except Exception as e:
+            logger.error(f"Erro ao enviar mensagem: {str(e)}", exc_info=True)
+            return json_reply({'error': str(e)}, 500)
+        finally:
+            if tenant is not None:
+                self.services.release_tenant(tenant)
+
+    # Administração
+    async def admin_profiler(self, method: str, authorization: str, body: bytes) -> Reply:
+        """
+        Profiler sob demanda (Authorization: Bearer ADMIN_TOKEN)
+
+        POST {"rate": 0.1} ou {"seconds": 30} inicia uma sessão em todos os
+        workers ({} encerra); GET combina os perfis dos workers em um .folded.
+        """
+        sampler = profiler.get()
+        if not self.settings.admin_token or sampler is None:
+            return json_reply({'error': 'Not found'}, 404)
+        if not self.services.is_admin(authorization or ''):
+            return json_reply({'error': 'Unauthorized'}, 401)
+        if method == 'GET':
+            # Lê os arquivos de todos os workers (fora do event loop no ASGI)
+            merged = await asyncio.to_thread(sampler.merge) if self.offload else sampler.merge()
+            return json_reply(dict(sampler.status(), profile=merged))
+        try:
+            data = json_codec.loads(body or b'{}') or {}
+            status = sampler.control(rate=float(data.get('rate') or 0), seconds=float(data.get('seconds') or 0),
+                                     interval_ms=float(data['interval_ms']) if data.get('interval_ms') else None)
+        except (TypeError, ValueError, AttributeError):
+            return json_reply({'error': 'rate, seconds e interval_ms devem ser números'}, 400)
+        return json_reply(status)
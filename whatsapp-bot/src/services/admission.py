@@ -0,0 +1,106 @@
+"""
+Controle de admissão: orçamento de mensagens em voo com prioridade
+para conversas em andamento
+"""
+import logging
+import threading
+from typing import Awaitable, Callable, Dict
+
+from src.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+SHED = metrics.counter(
+    'whatsapp_admission_shed_total',
+    'Mensagens recusadas com o orçamento esgotado, por prioridade (active ou new)',
+    ('priority',)
+)
+
+HIGH_DEMAND_REPLY = ("⏳ Estamos com alta demanda no momento.\n"
+                     "Por favor, envie sua mensagem novamente em alguns minutos.")
+
+
+class AdmissionController:
+    """
+    Limita as mensagens aceitas e ainda não concluídas no processo
+
+    As últimas `reserved_for_active` vagas só são usadas por quem já está
+    em um fluxo (sessão ativa); aberturas ("oi", "menu") são recusadas
+    primeiro. A sessão só é consultada quando o orçamento livre acaba, então
+    em operação normal a admissão custa um lock e um contador.
+
+    Inline, a mensagem fica em voo durante o webhook; no modo background,
+    do `submit` até o worker terminar (o pool chama `release`).
+
+    Args:
+        max_in_flight: mensagens em voo (0 desativa o limite)
+        reserved_for_active: vagas reservadas a conversas em andamento
+    """
+
+    def __init__(self, max_in_flight: int = 0, reserved_for_active: int = 40):
+        self.max_in_flight = max(0, max_in_flight)
+        self.reserved_for_active = min(max(0, reserved_for_active), self.max_in_flight)
+        self.open_limit = self.max_in_flight - self.reserved_for_active
+        self.in_flight = 0
+        self.shed = {'active': 0, 'new': 0}
+        self._lock = threading.Lock()
+        metrics.gauge('whatsapp_in_flight_messages', 'Mensagens aceitas e ainda não concluídas',
+                      lambda: self.in_flight)
+
+    def admit(self, is_active: Callable[[], bool]) -> bool:
+        """
+        Reserva uma vaga (devolver com `release`)
+
+        Args:
+            is_active: consulta se o remetente tem sessão ativa; chamada só
+                quando as vagas livres acabaram
+        """
+        if self._reserve_open():
+            return True
+        try:
+            active = bool(is_active())
+        except Exception as e:
+            logger.warning(f"Erro ao consultar sessão na admissão: {str(e)}")
+            active = False
+        return self._reserve(active)
+
+    async def admit_async(self, is_active: Callable[[], Awaitable]) -> bool:
+        """admit para o event loop: `is_active` é uma corrotina (ex: sessão lida em thread)"""
+        if self._reserve_open():
+            return True
+        try:
+            active = bool(await is_active())
+        except Exception as e:
+            logger.warning(f"Erro ao consultar sessão na admissão: {str(e)}")
+            active = False
+        return self._reserve(active)
+
+    def _reserve_open(self) -> bool:
+        """Vaga livre sem consultar a sessão"""
+        with self._lock:
+            if self.max_in_flight == 0 or self.in_flight < self.open_limit:
+                self.in_flight += 1
+                return True
+        return False
+
+    def _reserve(self, active: bool) -> bool:
+        priority = 'active' if active else 'new'
+        with self._lock:
+            if self.in_flight < (self.max_in_flight if active else self.open_limit):
+                self.in_flight += 1
+                return True
+            self.shed[priority] += 1
+        SHED.labels(priority).inc()
+        return False
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict:
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'reserved_for_active': self.reserved_for_active,
+            'shed': dict(self.shed)
+        }
@@ -2,46 +2,322 @@
 Cliente para comunicação com a API backend
 """
 import logging
+import time
 from typing import Optional, List, Dict, Any
 import requests
 from datetime import datetime, date
+from src.services.http_transport import HttpTransport, BackendUnavailableError
+from src.utils import metrics, profiler, tracing
+from src.utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+API_LATENCY = metrics.histogram(
+    'whatsapp_api_request_seconds',
+    'Latência das chamadas à API backend por método do cliente (inclui retries)',
+    ('method', 'outcome')
+)
 
-class APIClient:
-    """Cliente para interagir com a API do Astra Agenda"""
+_MISSING = object()
+
+# Status (em minúsculas) de agendamentos cancelados: não ocupam horário nem geram lembrete
+CANCELLED_STATUSES = frozenset({'cancelled', 'canceled', 'cancelado'})
+
+
+def appointment_start(appointment: Dict) -> Optional[str]:
+    """Início do agendamento: `scheduledAt` (AppointmentDto) ou `startTime` (payload antigo)"""
+    return appointment.get('scheduledAt') or appointment.get('startTime')
+
+
+def appointment_end(appointment: Dict) -> Optional[str]:
+    """Fim do agendamento: `endsAt` (AppointmentDto) ou `endTime`"""
+    return appointment.get('endsAt') or appointment.get('endTime')
+
+
+def _start_key(value: Optional[str]) -> Optional[float]:
+    """Início ISO 8601 como timestamp (sem fuso = horário local); None se inválido"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def appointment_status(appointment: Dict) -> str:
+    """Status em minúsculas (a API envia o nome do enum: "Scheduled", "Cancelled"...)"""
+    return str(appointment.get('status') or '').lower()
+
+
+class BaseAPIClient:
+    """Caches e montagem de payloads comuns aos clientes síncrono e assíncrono"""
     
-    def __init__(self, base_url: str, api_key: str):
+    def __init__(self, base_url: str, api_key: str,
+                 customer_cache_ttl: float = 300.0,
+                 customer_negative_ttl: float = 30.0,
+                 customer_cache_size: int = 5000,
+                 slot_cache_ttl: float = 30.0,
+                 slot_cache_size: int = 512,
+                 appointment_page_ttl: float = 30.0,
+                 appointment_page_size: int = 2000):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'Content-Type': 'application/json',
             'X-API-Key': api_key
-        })
+        }
+        
+        # Cache de clientes por telefone (None = 404 em cache negativo)
+        self.customer_negative_ttl = customer_negative_ttl
+        self.customer_cache = (
+            TTLCache(max_size=customer_cache_size, ttl_seconds=customer_cache_ttl)
+            if customer_cache_ttl > 0 else None
+        )
+        
+        # Cache de horários disponíveis por (data, resource_id)
+        self.slot_cache = (
+            TTLCache(max_size=slot_cache_size, ttl_seconds=slot_cache_ttl)
+            if slot_cache_ttl > 0 else None
+        )
+        
+        # Páginas de "meus agendamentos" por (cliente, cursor)
+        self.appointment_page_cache = (
+            TTLCache(max_size=appointment_page_size, ttl_seconds=appointment_page_ttl)
+            if appointment_page_ttl > 0 else None
+        )
+    
+    def _url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+    
+    # Cache de clientes
+    def _cached_customer(self, phone: str) -> Any:
+        """Cliente em cache, None (404 em cache) ou _MISSING"""
+        if self.customer_cache is None:
+            return _MISSING
+        return self.customer_cache.get(phone, _MISSING)
     
-    def _request(self, method: str, endpoint: str, **kwargs) -> Dict[Any, Any]:
-        """Faz requisição HTTP à API"""
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+    def _cache_customer(self, phone: str, customer: Optional[Dict]):
+        if self.customer_cache is None:
+            return
+        if customer is None:
+            if self.customer_negative_ttl > 0:
+                self.customer_cache.set(phone, None, ttl=self.customer_negative_ttl)
+        elif customer.get('id'):
+            self.customer_cache.set(phone, customer)
+        else:
+            self.customer_cache.pop(phone)
+    
+    def _forget_customer(self, phone: str):
+        if self.customer_cache is not None:
+            self.customer_cache.pop(phone)
+    
+    # Cache de horários
+    def _cached_slots(self, key: tuple) -> Any:
+        if self.slot_cache is None:
+            return _MISSING
+        return self.slot_cache.get(key, _MISSING)
+    
+    def _cache_slots(self, key: tuple, slots: List[Dict]):
+        if self.slot_cache is not None:
+            self.slot_cache.set(key, slots)
+    
+    def _invalidate_slots(self, start_time: Optional[Any] = None):
+        """Descarta horários em cache da data afetada (ou todos se desconhecida)"""
+        if self.slot_cache is None:
+            return
+        
+        day = None
+        if isinstance(start_time, datetime):
+            day = start_time.date().isoformat()
+        elif isinstance(start_time, str) and len(start_time) >= 10:
+            day = start_time[:10]
+        
+        if day is None:
+            self.slot_cache.clear()
+            return
+        for key in self.slot_cache.keys():
+            if key[0] == day:
+                self.slot_cache.pop(key)
+    
+    # Cache de páginas de agendamentos
+    def _cached_page(self, key: tuple) -> Any:
+        if self.appointment_page_cache is None:
+            return _MISSING
+        return self.appointment_page_cache.get(key, _MISSING)
+    
+    def _cache_page(self, key: tuple, page: Dict):
+        if self.appointment_page_cache is not None:
+            self.appointment_page_cache.set(key, page)
+    
+    def _invalidate_pages(self, customer_id: Optional[str] = None):
+        """Descarta as páginas do cliente (ou de todos se desconhecido)"""
+        if self.appointment_page_cache is None:
+            return
+        if customer_id is None:
+            self.appointment_page_cache.clear()
+            return
+        for key in self.appointment_page_cache.keys():
+            if key[0] == customer_id:
+                self.appointment_page_cache.pop(key)
+    
+    def _invalidate_appointment(self, result: Any):
+        """Após cancelar/alterar: horários da data e páginas do cliente"""
+        result = result if isinstance(result, dict) else {}
+        self._invalidate_slots(appointment_start(result))
+        self._invalidate_pages(result.get('customerId'))
+    
+    # Paginação de agendamentos futuros
+    @staticmethod
+    def _upcoming_params(customer_id: str) -> Dict[str, Any]:
+        """
+        Filtros da busca dos próximos agendamentos
+        
+        A API não pagina e só filtra por data com startDate + endDate, busca
+        que ignora o cliente: vêm todos os agendamentos do cliente e a
+        página é montada localmente em `_upcoming_page`.
+        """
+        return {'customerId': customer_id}
+    
+    @staticmethod
+    def _upcoming_page(appointments: List[Dict], limit: int, cursor: Optional[str],
+                       now: Optional[datetime] = None) -> Dict:
+        """
+        Monta a página localmente: só futuros (ou após o cursor), por início
+        
+        O cursor é `<início>|<id>` do último item exibido. O início é
+        `scheduledAt` (ou `startTime`), comparado como horário e não como
+        texto.
+        
+        Returns:
+            {'items': [...], 'next_cursor': str ou None}
+        """
+        items = []
+        for apt in appointments or []:
+            start = _start_key(appointment_start(apt))
+            if start is not None:
+                items.append(((start, str(apt.get('id', ''))), apt))
+        items.sort(key=lambda item: item[0])
+        
+        after = None
+        if cursor:
+            start, _, appointment_id = cursor.partition('|')
+            after = (_start_key(start), appointment_id)
+        if after is not None and after[0] is not None:
+            items = [item for item in items if item[0] > after]
+        else:
+            threshold = (now or datetime.now()).timestamp()
+            items = [item for item in items if item[0][0] >= threshold]
+        
+        page = [apt for _, apt in items[:limit]]
+        next_cursor = None
+        if len(items) > limit:
+            last = page[-1]
+            next_cursor = f"{appointment_start(last)}|{last.get('id', '')}"
+        return {'items': page, 'next_cursor': next_cursor}
+    
+    # Payloads
+    @staticmethod
+    def _slot_params(date: date, resource_id: Optional[str]) -> Dict[str, str]:
+        params = {'date': date.isoformat()}
+        if resource_id:
+            params['resourceId'] = resource_id
+        return params
+    
+    @staticmethod
+    def _window_params(start: datetime, end: datetime, status: Optional[str]) -> Dict[str, str]:
+        params = {'startDate': start.isoformat(), 'endDate': end.isoformat()}
+        if status:
+            params['status'] = status
+        return params
+    
+    @staticmethod
+    def _appointment_payload(customer_id: str, start_time: datetime, end_time: datetime,
+                             service: str, resource_id: Optional[str]) -> Dict:
+        data = {
+            'customerId': customer_id,
+            'startTime': start_time.isoformat(),
+            'endTime': end_time.isoformat(),
+            'service': service,
+            'status': 'scheduled'
+        }
+        if resource_id:
+            data['resourceId'] = resource_id
+        return data
+    
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Contadores de hit/miss dos caches do cliente"""
+        stats = {}
+        if self.customer_cache is not None:
+            stats['customers'] = self.customer_cache.stats()
+        if self.slot_cache is not None:
+            stats['slots'] = self.slot_cache.stats()
+        if self.appointment_page_cache is not None:
+            stats['appointment_pages'] = self.appointment_page_cache.stats()
+        return stats
+
+
+class APIClient(BaseAPIClient):
+    """Cliente para interagir com a API do Astra Agenda"""
+    
+    def __init__(self, base_url: str, api_key: str,
+                 transport: Optional[HttpTransport] = None, **cache_options):
+        super().__init__(base_url, api_key, **cache_options)
+        self.transport = transport or HttpTransport()
+        self.session = self.transport.session
+        self.session.headers.update(self.headers)
+    
+    def _request(self, method: str, endpoint: str, name: Optional[str] = None,
+                 **kwargs) -> Dict[Any, Any]:
+        """
+        Faz requisição HTTP à API
+        
+        Args:
+            name: nome da operação (timeouts por endpoint na camada HTTP)
+        """
+        url = self._url(endpoint)
+        started = time.perf_counter()
+        outcome = 'error'
+        span = tracing.child(f"api.{name or method}", method=method, endpoint=endpoint)
+        if span is not None:
+            # Trace id para correlacionar com os logs do backend
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, traceparent=span.traceparent())
         
         try:
-            response = self.session.request(method, url, **kwargs)
+            with profiler.region():
+                response = self.transport.request(method, url, endpoint=name, **kwargs)
+            if span is not None:
+                span.set(status=response.status_code)
             response.raise_for_status()
+            outcome = 'ok'
             return response.json()
+        except BackendUnavailableError:
+            outcome = 'unavailable'
+            raise
         except requests.exceptions.RequestException as e:
             logger.error(f"Erro na requisição {method} {url}: {str(e)}")
             raise
+        finally:
+            API_LATENCY.labels(name or method, outcome).observe(time.perf_counter() - started)
+            if span is not None:
+                span.set(outcome=outcome)
+                span.end()
     
     # Clientes
     def get_customer_by_phone(self, phone: str) -> Optional[Dict]:
-        """Busca cliente por telefone"""
+        """Busca cliente por telefone (read-through no cache)"""
+        cached = self._cached_customer(phone)
+        if cached is not _MISSING:
+            return cached
+        
         try:
-            return self._request('GET', f'/customers/phone/{phone}')
+            customer = self._request('GET', f'/customers/phone/{phone}',
+                                     name='get_customer_by_phone')
         except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
+            if e.response is not None and e.response.status_code == 404:
+                self._cache_customer(phone, None)
                 return None
             raise
+        
+        self._cache_customer(phone, customer)
+        return customer
     
     def create_customer(self, name: str, phone: str, email: Optional[str] = None) -> Dict:
         """Cria novo cliente"""
@@ -50,51 +326,121 @@ class APIClient:
             'phone': phone,
             'email': email
         }
-        return self._request('POST', '/customers', json=data)
+        try:
+            customer = self._request('POST', '/customers', name='create_customer', json=data)
+        except requests.exceptions.RequestException:
+            # Estado desconhecido: não confiar no cache negativo
+            self._forget_customer(phone)
+            raise
+        
+        self._cache_customer(phone, customer or {})
+        return customer
+    
+    def get_customer(self, customer_id: str) -> Optional[Dict]:
+        """Busca cliente por ID"""
+        try:
+            return self._request('GET', f'/customers/{customer_id}', name='get_customer')
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return None
+            raise
     
     # Agendamentos
-    def get_available_slots(self, date: date, resource_id: Optional[str] = None) -> List[Dict]:
-        """Lista horários disponíveis para uma data"""
-        params = {'date': date.isoformat()}
-        if resource_id:
-            params['resourceId'] = resource_id
+    def get_available_slots(self, date: date, resource_id: Optional[str] = None,
+                            refresh: bool = False) -> List[Dict]:
+        """
+        Lista horários disponíveis para uma data
+        
+        Args:
+            refresh: ignora o cache e busca na API (usado pelo prefetch)
+        """
+        key = (date.isoformat(), resource_id)
+        if not refresh:
+            cached = self._cached_slots(key)
+            if cached is not _MISSING:
+                return cached
         
-        return self._request('GET', '/appointments/available', params=params)
+        slots = self._request('GET', '/appointments/available', name='get_available_slots',
+                              params=self._slot_params(date, resource_id))
+        self._cache_slots(key, slots)
+        return slots
     
     def create_appointment(self, customer_id: str, start_time: datetime, 
                           end_time: datetime, service: str,
                           resource_id: Optional[str] = None) -> Dict:
         """Cria novo agendamento"""
-        data = {
-            'customerId': customer_id,
-            'startTime': start_time.isoformat(),
-            'endTime': end_time.isoformat(),
-            'service': service,
-            'status': 'scheduled'
-        }
-        if resource_id:
-            data['resourceId'] = resource_id
-        
-        return self._request('POST', '/appointments', json=data)
+        data = self._appointment_payload(customer_id, start_time, end_time, service, resource_id)
+        try:
+            return self._request('POST', '/appointments', name='create_appointment', json=data)
+        finally:
+            self._invalidate_slots(start_time)
+            self._invalidate_pages(customer_id)
+    
+    def get_appointments(self, start: datetime, end: datetime,
+                         status: Optional[str] = None) -> List[Dict]:
+        """Lista agendamentos do tenant em uma janela de tempo"""
+        return self._request('GET', '/appointments', name='get_appointments',
+                             params=self._window_params(start, end, status))
     
     def get_customer_appointments(self, customer_id: str) -> List[Dict]:
-        """Lista agendamentos de um cliente"""
-        return self._request('GET', f'/appointments/customer/{customer_id}')
+        """Lista agendamentos de um cliente (todos; ver get_upcoming_appointments)"""
+        return self._request('GET', f'/appointments/customer/{customer_id}',
+                             name='get_customer_appointments')
+    
+    def get_upcoming_appointments(self, customer_id: str, limit: int = 5,
+                                  cursor: Optional[str] = None) -> Dict:
+        """
+        Uma página dos agendamentos futuros do cliente (cache curto por página)
+        
+        Args:
+            cursor: `next_cursor` da página anterior
+            
+        Returns:
+            {'items': [...], 'next_cursor': str ou None}
+        """
+        key = (customer_id, cursor, limit)
+        cached = self._cached_page(key)
+        if cached is not _MISSING:
+            return cached
+        
+        appointments = self._request('GET', '/appointments', name='get_upcoming_appointments',
+                                     params=self._upcoming_params(customer_id))
+        page = self._upcoming_page(appointments, limit, cursor)
+        self._cache_page(key, page)
+        return page
     
     def cancel_appointment(self, appointment_id: str) -> Dict:
         """Cancela um agendamento"""
-        return self._request('DELETE', f'/appointments/{appointment_id}')
+        result = self._request('DELETE', f'/appointments/{appointment_id}',
+                               name='cancel_appointment')
+        # Data e cliente vêm na resposta quando a API os retorna; senão limpa tudo
+        self._invalidate_appointment(result)
+        return result
     
     def update_appointment_status(self, appointment_id: str, status: str) -> Dict:
         """Atualiza status de um agendamento"""
         data = {'status': status}
-        return self._request('PATCH', f'/appointments/{appointment_id}/status', json=data)
+        result = self._request('PATCH', f'/appointments/{appointment_id}/status',
+                               name='update_appointment_status', json=data)
+        if status.lower() in CANCELLED_STATUSES:
+            self._invalidate_slots(appointment_start(result) if isinstance(result, dict) else None)
+        self._invalidate_pages(result.get('customerId') if isinstance(result, dict) else None)
+        return result
+    
+    # Estatísticas
+    def transport_stats(self) -> Dict:
+        """Contadores da camada HTTP (requisições, retries, circuito)"""
+        return self.transport.stats()
+    
+    def close(self):
+        """Fecha conexões HTTP"""
+        self.session.close()
     
     # Health check
-    def health_check(self) -> bool:
+    def health_check(self, timeout: float = 5) -> bool:
         """Verifica se a API está respondendo"""
         try:
-            response = self.session.get(f"{self.base_url}/health", timeout=5)
+            response = self.session.get(f"{self.base_url}/health", timeout=timeout)
             return response.status_code == 200
         except Exception:
             return False
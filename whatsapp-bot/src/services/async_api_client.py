@@ -0,0 +1,321 @@
+"""
+Cliente assíncrono (httpx) para a API backend
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, date
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from src.services.api_client import API_LATENCY, BaseAPIClient, CANCELLED_STATUSES, _MISSING, appointment_start
+from src.services.http_transport import BackendUnavailableError, IDEMPOTENT_METHODS, RETRY_STATUS
+from src.utils import profiler, tracing
+from src.utils.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class AsyncAPIClient(BaseAPIClient):
+    """
+    Versão assíncrona do APIClient, com os mesmos métodos e caches
+
+    GETs idênticos concorrentes são unificados (single-flight): apenas uma
+    requisição fica em voo e todos os chamadores recebem o mesmo resultado.
+    A requisição roda em uma task própria, então o cancelamento de quem a
+    iniciou não atinge os demais; ela só é cancelada sem ninguém aguardando.
+    """
+
+    def __init__(self, base_url: str, api_key: str,
+                 connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 endpoint_timeouts: Optional[Dict[str, float]] = None,
+                 pool_size: int = 100, max_retries: int = 2,
+                 backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 http2: bool = False, breaker: Optional[CircuitBreaker] = None,
+                 **cache_options):
+        super().__init__(base_url, api_key, **cache_options)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.endpoint_timeouts = endpoint_timeouts or {}
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 solicitado mas o pacote 'h2' não está instalado; usando HTTP/1.1")
+            http2 = False
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            http2=http2,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=60.0
+            )
+        )
+
+        # chave -> [task da requisição, chamadores aguardando]
+        self._inflight: Dict[tuple, list] = {}
+        self.counters = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'short_circuited': 0,
+            'coalesced': 0
+        }
+
+    def _timeout(self, name: Optional[str]) -> httpx.Timeout:
+        read = self.endpoint_timeouts.get(name, self.read_timeout) if name else self.read_timeout
+        return httpx.Timeout(read, connect=self.connect_timeout)
+
+    async def _single_flight(self, key: tuple, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Une chamadas concorrentes com a mesma chave em uma só"""
+        flight = self._inflight.get(key)
+        if flight is None:
+            task = asyncio.get_running_loop().create_task(call())
+            flight = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda _, flight=flight: self._land(key, flight))
+        else:
+            self.counters['coalesced'] += 1
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                # Todos os chamadores desistiram (cancelados): a requisição não serve a ninguém
+                flight[0].cancel()
+
+    def _land(self, key: tuple, flight: list):
+        """Requisição unificada terminou: próximas chamadas fazem uma nova"""
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight[0].cancelled():
+            flight[0].exception()  # marca como consumida se ninguém mais aguardava
+
+    async def _send(self, method: str, url: str, name: Optional[str], **kwargs) -> httpx.Response:
+        attempts = 1 + (self.max_retries if method in IDEMPOTENT_METHODS else 0)
+        kwargs.setdefault('timeout', self._timeout(name))
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breaker.allow():
+                self.counters['short_circuited'] += 1
+                raise BackendUnavailableError(f"Circuito aberto para {method} {url}")
+
+            self.counters['requests'] += 1
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                # Conexão e timeouts (mesmo critério do HttpTransport)
+                self.counters['failures'] += 1
+                self.breaker.record_failure()
+                if attempt >= attempts:
+                    raise
+                logger.warning(f"Falha em {method} {url} ({type(e).__name__}), tentando novamente")
+            except BaseException:
+                # Sem resultado sobre a disponibilidade (TooManyRedirects, DecodingError,
+                # cancelamento): libera a chamada de teste do meio-aberto
+                self.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    self.breaker.record_success()
+                    return response
+                self.counters['failures'] += 1
+                self.breaker.record_failure()
+                if attempt >= attempts:
+                    return response
+                logger.warning(f"{method} {url} retornou {response.status_code}, tentando novamente")
+
+            self.counters['retries'] += 1
+            await asyncio.sleep(random.uniform(
+                0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+            ))
+
+    async def _request(self, method: str, endpoint: str, name: Optional[str] = None,
+                       **kwargs) -> Any:
+        """Faz requisição HTTP à API (GETs concorrentes idênticos são unificados)"""
+        method = method.upper()
+        url = self._url(endpoint)
+        # Num GET unificado o span de quem só aguarda cobre a espera (sem atributo status)
+        span = tracing.child(f"api.{name or method}", method=method, endpoint=endpoint)
+        if span is not None:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, traceparent=span.traceparent())
+
+        async def call():
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                with profiler.region():
+                    response = await self._send(method, url, name, **kwargs)
+                if span is not None:
+                    span.set(status=response.status_code)
+                response.raise_for_status()
+                outcome = 'ok'
+                return response.json()
+            except BackendUnavailableError:
+                outcome = 'unavailable'
+                raise
+            except httpx.HTTPError as e:
+                logger.error(f"Erro na requisição {method} {url}: {str(e)}")
+                raise
+            finally:
+                API_LATENCY.labels(name or method, outcome).observe(time.perf_counter() - started)
+                if span is not None:
+                    span.set(outcome=outcome)
+
+        try:
+            if method != 'GET':
+                return await call()
+            params = kwargs.get('params') or {}
+            return await self._single_flight((url, tuple(sorted(params.items()))), call)
+        finally:
+            if span is not None:
+                span.end()
+
+    # Clientes
+    async def get_customer_by_phone(self, phone: str) -> Optional[Dict]:
+        """Busca cliente por telefone (read-through no cache)"""
+        cached = self._cached_customer(phone)
+        if cached is not _MISSING:
+            return cached
+
+        try:
+            customer = await self._request('GET', f'/customers/phone/{phone}',
+                                           name='get_customer_by_phone')
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                self._cache_customer(phone, None)
+                return None
+            raise
+
+        self._cache_customer(phone, customer)
+        return customer
+
+    async def create_customer(self, name: str, phone: str, email: Optional[str] = None) -> Dict:
+        """Cria novo cliente"""
+        data = {
+            'name': name,
+            'phone': phone,
+            'email': email
+        }
+        try:
+            customer = await self._request('POST', '/customers', name='create_customer', json=data)
+        except httpx.HTTPError:
+            self._forget_customer(phone)
+            raise
+
+        self._cache_customer(phone, customer or {})
+        return customer
+
+    async def get_customer(self, customer_id: str) -> Optional[Dict]:
+        """Busca cliente por ID"""
+        try:
+            return await self._request('GET', f'/customers/{customer_id}', name='get_customer')
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return None
+            raise
+
+    # Agendamentos
+    async def get_available_slots(self, date: date, resource_id: Optional[str] = None,
+                                  refresh: bool = False) -> List[Dict]:
+        """Lista horários disponíveis para uma data"""
+        key = (date.isoformat(), resource_id)
+        if not refresh:
+            cached = self._cached_slots(key)
+            if cached is not _MISSING:
+                return cached
+
+        slots = await self._request('GET', '/appointments/available', name='get_available_slots',
+                                    params=self._slot_params(date, resource_id))
+        self._cache_slots(key, slots)
+        return slots
+
+    async def create_appointment(self, customer_id: str, start_time: datetime,
+                                 end_time: datetime, service: str,
+                                 resource_id: Optional[str] = None) -> Dict:
+        """Cria novo agendamento"""
+        data = self._appointment_payload(customer_id, start_time, end_time, service, resource_id)
+        try:
+            return await self._request('POST', '/appointments', name='create_appointment', json=data)
+        finally:
+            self._invalidate_slots(start_time)
+            self._invalidate_pages(customer_id)
+
+    async def get_appointments(self, start: datetime, end: datetime,
+                               status: Optional[str] = None) -> List[Dict]:
+        """Lista agendamentos do tenant em uma janela de tempo"""
+        return await self._request('GET', '/appointments', name='get_appointments',
+                                   params=self._window_params(start, end, status))
+
+    async def get_customer_appointments(self, customer_id: str) -> List[Dict]:
+        """Lista agendamentos de um cliente (todos; ver get_upcoming_appointments)"""
+        return await self._request('GET', f'/appointments/customer/{customer_id}',
+                                   name='get_customer_appointments')
+
+    async def get_upcoming_appointments(self, customer_id: str, limit: int = 5,
+                                        cursor: Optional[str] = None) -> Dict:
+        """Uma página dos agendamentos futuros do cliente (cache curto por página)"""
+        key = (customer_id, cursor, limit)
+        cached = self._cached_page(key)
+        if cached is not _MISSING:
+            return cached
+
+        appointments = await self._request('GET', '/appointments', name='get_upcoming_appointments',
+                                           params=self._upcoming_params(customer_id))
+        page = self._upcoming_page(appointments, limit, cursor)
+        self._cache_page(key, page)
+        return page
+
+    async def cancel_appointment(self, appointment_id: str) -> Dict:
+        """Cancela um agendamento"""
+        result = await self._request('DELETE', f'/appointments/{appointment_id}',
+                                     name='cancel_appointment')
+        self._invalidate_appointment(result)
+        return result
+
+    async def update_appointment_status(self, appointment_id: str, status: str) -> Dict:
+        """Atualiza status de um agendamento"""
+        data = {'status': status}
+        result = await self._request('PATCH', f'/appointments/{appointment_id}/status',
+                                     name='update_appointment_status', json=data)
+        if status.lower() in CANCELLED_STATUSES:
+            self._invalidate_slots(appointment_start(result) if isinstance(result, dict) else None)
+        self._invalidate_pages(result.get('customerId') if isinstance(result, dict) else None)
+        return result
+
+    # Estatísticas
+    def transport_stats(self) -> Dict:
+        """Contadores HTTP, requisições unificadas e estado do circuito"""
+        stats = dict(self.counters)
+        stats['in_flight'] = len(self._inflight)
+        stats['circuit'] = self.breaker.stats()
+        return stats
+
+    # Health check
+    async def health_check(self, timeout: float = 5) -> bool:
+        """Verifica se a API está respondendo"""
+        try:
+            response = await self.client.get(f"{self.base_url}/health", timeout=timeout)
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    async def close(self):
+        """Fecha conexões HTTP"""
+        await self.client.aclose()
@@ -0,0 +1,211 @@
+"""
+Busca local de horários livres em vários dias ("próximos horários")
+
+Uma única chamada GET /appointments traz os agendamentos do período; os
+intervalos livres (expediente menos ocupados) são calculados localmente,
+sem uma chamada a /appointments/available por dia.
+"""
+import logging
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pytz
+
+from src.services.api_client import CANCELLED_STATUSES, appointment_end, appointment_start, appointment_status
+from src.utils.async_runner import maybe_await
+
+logger = logging.getLogger(__name__)
+
+Interval = Tuple[datetime, datetime]
+
+# Agendamentos com estes status (minúsculas; a API envia "Cancelled"...) não ocupam o horário
+FREE_STATUSES = CANCELLED_STATUSES
+
+
+class IntervalSet:
+    """
+    Intervalos [início, fim) ordenados e disjuntos
+
+    Guardados em duas listas paralelas (inícios e fins): construção por
+    ordenação + fusão, diferença por varredura linear e consulta de
+    pertinência por busca binária.
+    """
+
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, intervals: Iterable[Interval] = ()):
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                # Sobreposto ou encostado no anterior: funde
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __iter__(self) -> Iterator[Interval]:
+        return zip(self.starts, self.ends)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def contains(self, start: datetime, end: datetime) -> bool:
+        """O intervalo [start, end) está inteiro dentro de um dos intervalos"""
+        i = bisect_right(self.starts, start) - 1
+        return i >= 0 and end <= self.ends[i]
+
+    def subtract(self, other: 'IntervalSet') -> 'IntervalSet':
+        """Partes deste conjunto que não cruzam `other` (O(n + m))"""
+        result = IntervalSet()
+        j = 0
+        n = len(other.starts)
+        for start, end in self:
+            # Ocupados que terminam antes deste intervalo não afetam os próximos
+            while j < n and other.ends[j] <= start:
+                j += 1
+            k = j
+            cursor = start
+            while k < n and other.starts[k] < end:
+                if other.starts[k] > cursor:
+                    result.starts.append(cursor)
+                    result.ends.append(other.starts[k])
+                cursor = max(cursor, other.ends[k])
+                k += 1
+            if cursor < end:
+                result.starts.append(cursor)
+                result.ends.append(end)
+        return result
+
+    def slots(self, duration: timedelta, limit: Optional[int] = None) -> List[datetime]:
+        """
+        Inícios de horários de `duration` que cabem nos intervalos
+
+        Os horários ficam alinhados a múltiplos de `duration` desde a
+        meia-noite (ex: 60 min -> 09:00, 10:00...).
+        """
+        step = int(duration.total_seconds())
+        found: List[datetime] = []
+        for start, end in self:
+            midnight = datetime.combine(start.date(), time())
+            offset = int((start - midnight).total_seconds())
+            slot = midnight + timedelta(seconds=-(-offset // step) * step)
+            while slot + duration <= end:
+                found.append(slot)
+                if limit is not None and len(found) >= limit:
+                    return found
+                slot += duration
+        return found
+
+
+def _parse_hours(value: str) -> Tuple[time, time]:
+    """'08:00-12:00' -> (08:00, 12:00)"""
+    opens, closes = (time.fromisoformat(part.strip()) for part in value.split('-'))
+    if closes <= opens:
+        raise ValueError(f"Expediente inválido: {value}")
+    return opens, closes
+
+
+def _parse_datetime(value: str, tz=None) -> datetime:
+    """
+    Horário local sem fuso (como no restante do fluxo) do ISO 8601 da API
+
+    Horários com fuso (ex: `scheduledAt` em UTC) são convertidos para `tz`.
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        return parsed
+    return parsed.astimezone(tz).replace(tzinfo=None)
+
+
+class AvailabilityEngine:
+    """
+    Horários livres de um período com uma chamada à API
+
+    Args:
+        api_client: APIClient ou AsyncAPIClient (usa `get_appointments`)
+        hours: faixas de expediente, ex: ["08:00-12:00", "13:00-18:00"]
+        weekdays: dias com expediente (0 = segunda ... 6 = domingo)
+        slot_minutes: duração de cada horário
+        horizon_days: dias à frente buscados por "próximos horários"
+        timezone: fuso do expediente (horários da API com fuso são convertidos)
+    """
+
+    def __init__(self, api_client, hours: Sequence[str] = ('08:00-18:00',),
+                 weekdays: Sequence[int] = (0, 1, 2, 3, 4, 5),
+                 slot_minutes: int = 60, horizon_days: int = 14,
+                 timezone: Optional[str] = None):
+        self.api = api_client
+        self.hours = [_parse_hours(value) for value in hours]
+        self.weekdays = frozenset(weekdays)
+        self.slot = timedelta(minutes=slot_minutes)
+        self.horizon_days = max(1, horizon_days)
+        self.tz = pytz.timezone(timezone) if timezone else None
+
+    def working(self, start: datetime, end: datetime) -> IntervalSet:
+        """Expediente entre start e end"""
+        intervals = []
+        day: date = start.date()
+        while day <= end.date():
+            if day.weekday() in self.weekdays:
+                for opens, closes in self.hours:
+                    intervals.append((max(start, datetime.combine(day, opens)),
+                                      min(end, datetime.combine(day, closes))))
+            day += timedelta(days=1)
+        return IntervalSet(intervals)
+
+    def _interval(self, appointment: Dict) -> Interval:
+        """[início, fim) do AppointmentDto (`scheduledAt`/`endsAt`, ou `startTime`/`endTime`)"""
+        begins = _parse_datetime(appointment_start(appointment), self.tz)
+        ends = appointment_end(appointment)
+        if ends:
+            return begins, _parse_datetime(ends, self.tz)
+        minutes = appointment.get('durationMinutes')
+        return begins, begins + (timedelta(minutes=minutes) if minutes else self.slot)
+
+    async def busy(self, start: datetime, end: datetime,
+                   resource_id: Optional[str] = None) -> IntervalSet:
+        """
+        Horários ocupados no período (uma chamada GET /appointments)
+
+        A busca por intervalo da API ignora `resourceId`: com `resource_id`
+        o filtro é feito aqui.
+        """
+        appointments = await maybe_await(self.api.get_appointments(start, end))
+        intervals = []
+        for appointment in appointments:
+            if appointment_status(appointment) in FREE_STATUSES:
+                continue
+            if resource_id and appointment.get('resourceId') not in (None, resource_id):
+                continue
+            try:
+                intervals.append(self._interval(appointment))
+            except (AttributeError, TypeError, ValueError):
+                logger.warning(f"Agendamento com horário inválido ignorado: {appointment.get('id')}")
+        return IntervalSet(intervals)
+
+    async def free_slots(self, start: datetime, end: datetime, limit: Optional[int] = None,
+                         resource_id: Optional[str] = None) -> List[datetime]:
+        """Horários livres entre start e end, em ordem"""
+        working = self.working(start, end)
+        if not working:
+            return []
+        free = working.subtract(await self.busy(start, end, resource_id))
+        return free.slots(self.slot, limit)
+
+    async def next_free(self, count: int = 5, now: Optional[datetime] = None,
+                        resource_id: Optional[str] = None) -> List[datetime]:
+        """Os próximos `count` horários livres dentro do horizonte"""
+        now = now or datetime.now()
+        return await self.free_slots(now, now + timedelta(days=self.horizon_days), count, resource_id)
+
+    async def this_week(self, limit: Optional[int] = None, now: Optional[datetime] = None,
+                        resource_id: Optional[str] = None) -> List[datetime]:
+        """Horários livres de agora até o fim de domingo"""
+        now = now or datetime.now()
+        next_monday = datetime.combine(now.date() + timedelta(days=7 - now.weekday()), time())
+        return await self.free_slots(now, next_monday, limit, resource_id)
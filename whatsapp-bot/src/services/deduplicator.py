@@ -0,0 +1,83 @@
+"""
+Supressão de webhooks duplicados pelo ID da mensagem do provedor
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDeduplicator:
+    """
+    Marca IDs de mensagem já recebidos dentro de uma janela de tempo
+
+    Twilio e Evolution reenviam o webhook quando a resposta demora; o
+    reenvio chega com o mesmo ID e deve ser ignorado antes de qualquer
+    chamada à API. Usa um LRU local e, se configurado, o Redis
+    (SET NX EX) para cobrir vários workers/containers.
+    """
+
+    def __init__(self, window_seconds: float = 600.0, max_entries: int = 50000,
+                 redis_client=None, prefix: str = 'astra:msgid:'):
+        self.window_seconds = window_seconds
+        self.seen = TTLCache(max_size=max_entries, ttl_seconds=window_seconds)
+        self.redis = redis_client
+        self.prefix = prefix
+        self.duplicates = 0
+
+    def is_duplicate(self, message_id: Optional[str]) -> bool:
+        """Registra o ID e indica se ele já tinha sido visto na janela"""
+        if not message_id or self.window_seconds <= 0:
+            return False
+
+        if self.seen.get(message_id) is not None:
+            self.duplicates += 1
+            return True
+
+        if self.redis is not None:
+            try:
+                first = self.redis.set(self.prefix + message_id, '1', nx=True,
+                                       ex=max(1, int(self.window_seconds)))
+            except Exception as e:
+                # Redis fora: seguir só com o LRU local
+                logger.warning(f"Redis indisponível para deduplicação: {str(e)}")
+                first = True
+            if not first:
+                self.seen.set(message_id, True)
+                self.duplicates += 1
+                return True
+
+        self.seen.set(message_id, True)
+        return False
+
+    def forget(self, message_id: Optional[str]):
+        """Libera o ID para que um reenvio seja processado (mensagem recusada com erro)"""
+        if not message_id:
+            return
+        self.seen.pop(message_id)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self.prefix + message_id)
+            except Exception as e:
+                logger.warning(f"Redis indisponível para deduplicação: {str(e)}")
+
+    async def is_duplicate_async(self, message_id: Optional[str]) -> bool:
+        """is_duplicate para o event loop: com Redis, roda em uma thread"""
+        if self.redis is None or not message_id:
+            return self.is_duplicate(message_id)
+        return await asyncio.to_thread(self.is_duplicate, message_id)
+
+    async def forget_async(self, message_id: Optional[str]):
+        if self.redis is None or not message_id:
+            self.forget(message_id)
+        else:
+            await asyncio.to_thread(self.forget, message_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'tracked': len(self.seen),
+            'duplicates': self.duplicates
+        }
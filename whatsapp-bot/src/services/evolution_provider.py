@@ -5,14 +5,19 @@ import logging
 import httpx
 from typing import Optional, Dict, Any
 from .whatsapp_provider import WhatsAppProvider
+from src.utils.logging_setup import conversation_id, get_logger
 
 logger = logging.getLogger(__name__)
+log = get_logger(__name__)
 
 
 class EvolutionProvider(WhatsAppProvider):
     """Implementação Evolution API para WhatsApp"""
     
-    def __init__(self, base_url: str, api_key: str, instance_name: str):
+    name = 'evolution'
+    
+    def __init__(self, base_url: str, api_key: str, instance_name: str,
+                 pool_size: int = 100, connect_timeout: float = 5.0, timeout: float = 30.0):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.instance_name = instance_name
@@ -21,7 +26,11 @@ class EvolutionProvider(WhatsAppProvider):
                 'Content-Type': 'application/json',
                 'apikey': api_key
             },
-            timeout=30.0
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            )
         )
         
     async def send_message(self, to: str, message: str) -> Dict[str, Any]:
@@ -56,7 +65,7 @@ class EvolutionProvider(WhatsAppProvider):
             
             data = response.json()
             
-            logger.info(f"Evolution API message sent to {number}")
+            log.info("message_sent", provider="evolution", to=lambda: conversation_id(number))
             
             return {
                 'success': True,
@@ -109,7 +118,7 @@ class EvolutionProvider(WhatsAppProvider):
             
             data = response.json()
             
-            logger.info(f"Evolution API media sent to {number}")
+            log.info("media_sent", provider="evolution", to=lambda: conversation_id(number))
             
             return {
                 'success': True,
@@ -127,6 +136,31 @@ class EvolutionProvider(WhatsAppProvider):
                 'provider': 'evolution'
             }
     
+    async def warm_up(self) -> bool:
+        """Abre a conexão (TLS + keep-alive) consultando o estado da instância"""
+        try:
+            response = await self.client.get(
+                f"{self.base_url}/instance/connectionState/{self.instance_name}"
+            )
+            return response.status_code < 400
+        except httpx.HTTPError as e:
+            logger.warning(f"Evolution API warm-up failed: {str(e)}")
+            return False
+    
+    async def health_check(self) -> bool:
+        """Instância conectada ao WhatsApp (connectionState "open")"""
+        response = await self.client.get(
+            f"{self.base_url}/instance/connectionState/{self.instance_name}"
+        )
+        if response.status_code >= 400:
+            return False
+        return (response.json().get('instance') or {}).get('state') == 'open'
+    
+    @classmethod
+    def tenant_key(cls, request_data: Dict) -> str:
+        """Nome da instância que recebeu a mensagem"""
+        return request_data.get('instance') or ''
+    
     def validate_webhook(self, request_data: Dict) -> bool:
         """
         Valida webhook do Evolution API
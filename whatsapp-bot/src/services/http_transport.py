@@ -0,0 +1,133 @@
+"""
+Camada HTTP resiliente para chamadas à API backend
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.utils.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# Falhas que indicam API fora do ar: retentadas (métodos idempotentes) e contadas
+# pelo circuit breaker. Um 500 da aplicação ou uma resposta inválida não abrem o circuito.
+RETRY_STATUS = frozenset({502, 503, 504})
+RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class BackendUnavailableError(requests.exceptions.ConnectionError):
+    """API backend indisponível (circuito aberto)"""
+    pass
+
+
+class HttpTransport:
+    """
+    Sessão `requests` com pool dimensionado, timeouts por endpoint,
+    retries com backoff + jitter em métodos idempotentes e circuit breaker.
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None,
+                 connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 endpoint_timeouts: Optional[Dict[str, float]] = None,
+                 pool_size: int = 10, max_retries: int = 2,
+                 backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.endpoint_timeouts = endpoint_timeouts or {}
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # Retries são feitos aqui (para contar e respeitar o breaker), não no urllib3
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'short_circuited': 0
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _timeout(self, endpoint: Optional[str]):
+        read = self.endpoint_timeouts.get(endpoint, self.read_timeout) if endpoint else self.read_timeout
+        return (self.connect_timeout, read)
+
+    def _backoff(self, attempt: int) -> float:
+        # Backoff exponencial com "full jitter"
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, url: str, endpoint: Optional[str] = None,
+                **kwargs) -> requests.Response:
+        """
+        Executa a requisição
+
+        Args:
+            endpoint: nome lógico da operação (chave de endpoint_timeouts)
+
+        Raises:
+            BackendUnavailableError: se o circuito estiver aberto
+            requests.exceptions.RequestException: falha de rede após retries
+        """
+        method = method.upper()
+        kwargs.setdefault('timeout', self._timeout(endpoint))
+        attempts = 1 + (self.max_retries if method in IDEMPOTENT_METHODS else 0)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breaker.allow():
+                self._count('short_circuited')
+                raise BackendUnavailableError(f"Circuito aberto para {method} {url}")
+
+            self._count('requests')
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except RETRY_ERRORS:
+                self._count('failures')
+                self.breaker.record_failure()
+                if attempt >= attempts:
+                    raise
+                logger.warning(f"Falha de conexão em {method} {url}, tentando novamente")
+            except BaseException:
+                # Sem resultado sobre a disponibilidade (TooManyRedirects, corpo inválido,
+                # interrupção): o meio-aberto não pode ficar preso na chamada de teste
+                self.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    # A API respondeu (inclusive um 500 de uma requisição): está de pé
+                    self.breaker.record_success()
+                    return response
+                self._count('failures')
+                self.breaker.record_failure()
+                if attempt >= attempts:
+                    return response
+                logger.warning(f"{method} {url} retornou {response.status_code}, tentando novamente")
+
+            self._count('retries')
+            time.sleep(self._backoff(attempt - 1))
+
+    def stats(self) -> Dict:
+        """Contadores da camada HTTP e estado do circuito"""
+        with self._lock:
+            stats = dict(self.counters)
+        stats['circuit'] = self.breaker.stats()
+        return stats
@@ -0,0 +1,141 @@
+"""
+Envio de mensagens ativas (respostas, lembretes, notificações) com rate limit
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from src.services.whatsapp_provider import WhatsAppProvider
+from src.utils import metrics, tracing
+from src.utils.rate_limiter import KeyedTokenBuckets, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SEND_LATENCY = metrics.histogram(
+    'whatsapp_provider_send_seconds',
+    'Latência do envio pelo provedor (sem a espera do rate limit)',
+    ('provider',)
+)
+SENDS = metrics.counter(
+    'whatsapp_provider_sends_total',
+    'Envios pelo provedor por resultado (success, failed, timeout, error, rate_limited)',
+    ('provider', 'outcome')
+)
+
+
+class OutboundDispatcher:
+    """
+    Envia mensagens pelo WhatsAppProvider configurado
+
+    Reutiliza a instância (e o pool de conexões) do provedor, aplica um
+    token bucket global do provedor e outro por destinatário, e limita o
+    número de envios simultâneos. Deve ser usado de um único event loop.
+    """
+
+    def __init__(self, whatsapp_provider: WhatsAppProvider,
+                 provider_rate: float = 10.0, provider_burst: float = 20,
+                 destination_rate: float = 1.0, destination_burst: float = 3,
+                 max_concurrency: int = 10, max_wait_seconds: float = 30.0,
+                 send_timeout: float = 15.0):
+        self.provider = whatsapp_provider
+        self.provider_bucket = TokenBucket(provider_rate, provider_burst)
+        self.destination_buckets = KeyedTokenBuckets(destination_rate, destination_burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_wait_seconds = max_wait_seconds
+        self.send_timeout = send_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.counters = {
+            'sent': 0,
+            'failed': 0,
+            'rate_limited': 0,
+            'throttled_waits': 0
+        }
+
+    @property
+    def provider_name(self) -> str:
+        return getattr(self.provider, 'name', type(self.provider).__name__)
+
+    def _failure(self, to: str, error: str) -> Dict[str, Any]:
+        return {'success': False, 'to': to, 'error': error, 'provider': self.provider_name}
+
+    async def _throttle(self, to: str) -> bool:
+        """Aguarda os dois buckets; False se a espera passar do limite"""
+        destination_bucket = self.destination_buckets.get(to)
+        wait_provider = self.provider_bucket.reserve()
+        wait_destination = destination_bucket.reserve()
+        wait = max(wait_provider, wait_destination)
+        if wait > self.max_wait_seconds:
+            self.provider_bucket.refund()
+            destination_bucket.refund()
+            return False
+        if wait > 0:
+            self.counters['throttled_waits'] += 1
+            await asyncio.sleep(wait)
+        return True
+
+    async def send(self, to: str, message: str, media_url: Optional[str] = None) -> Dict[str, Any]:
+        """Envia uma mensagem respeitando os limites; retorna o resultado do provedor"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        requested = time.perf_counter()
+        span = tracing.child('provider.send', provider=self.provider_name, media=bool(media_url))
+
+        if not await self._throttle(to):
+            self.counters['rate_limited'] += 1
+            SENDS.labels(self.provider_name, 'rate_limited').inc()
+            logger.warning(f"Envio para {to} excede o limite de taxa, descartado")
+            if span is not None:
+                span.set(outcome='rate_limited')
+                span.end()
+            return self._failure(to, 'rate_limited')
+
+        async with self._semaphore:
+            started = time.perf_counter()
+            if span is not None:
+                # Espera do rate limit e do semáforo, antes do envio em si
+                span.set(wait_ms=round((started - requested) * 1000, 3))
+            try:
+                if media_url:
+                    coro = self.provider.send_media(to, media_url, caption=message)
+                else:
+                    coro = self.provider.send_message(to, message)
+                result = await asyncio.wait_for(coro, timeout=self.send_timeout)
+                outcome = 'success' if result.get('success') else 'failed'
+            except asyncio.TimeoutError:
+                result = self._failure(to, 'timeout')
+                outcome = 'timeout'
+            except Exception as e:
+                logger.error(f"Erro ao enviar mensagem para {to}: {str(e)}")
+                result = self._failure(to, str(e))
+                outcome = 'error'
+            SEND_LATENCY.labels(self.provider_name).observe(time.perf_counter() - started)
+
+        SENDS.labels(self.provider_name, outcome).inc()
+        if span is not None:
+            span.set(outcome=outcome)
+            span.end()
+        result.setdefault('to', to)
+        self.counters['sent' if result.get('success') else 'failed'] += 1
+        return result
+
+    async def send_batch(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Envia um lote de mensagens
+
+        Args:
+            messages: itens com 'to', 'message' e opcionalmente 'media_url'
+
+        Returns:
+            Um resultado por mensagem, na mesma ordem
+        """
+        return await asyncio.gather(*[
+            self.send(item['to'], item.get('message', ''), item.get('media_url'))
+            for item in messages
+        ])
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self.counters)
+        stats['provider'] = self.provider_name
+        stats['destinations_tracked'] = self.destination_buckets.stats()['keys']
+        return stats
@@ -0,0 +1,520 @@
+"""
+Outbox durável de mensagens ativas (respostas do modo background e lembretes)
+
+A mensagem é gravada (SQLite local ou Redis) antes do envio; uma thread
+entrega em lotes pelo OutboundDispatcher, com retries e backoff, e registra
+o resultado do provedor. Entrega "pelo menos uma vez": se o processo cair
+entre o envio e o registro, a mensagem é reenviada quando a reserva
+(`lease`) expirar.
+"""
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils import metrics
+from src.utils.async_runner import background_loop
+
+logger = logging.getLogger(__name__)
+
+OUTBOX = metrics.counter(
+    'whatsapp_outbox_messages_total',
+    'Mensagens do outbox por evento (enqueued, duplicate, sent, retried, failed)',
+    ('outcome',)
+)
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class OutboxStore(ABC):
+    """
+    Persistência do outbox
+
+    Cada mensagem tem uma chave de idempotência única: `add` com uma chave
+    já existente não cria outra mensagem. `claim` é atômico entre
+    processos e reserva as mensagens por `lease_seconds`.
+
+    As mensagens de um destino (tenant + número) saem uma de cada vez, na
+    ordem em que foram gravadas: `claim` só reserva a mais antiga pendente
+    de cada destino, então uma mensagem em envio ou aguardando retry segura
+    as seguintes até ser enviada ou marcada como falha.
+    """
+
+    @abstractmethod
+    def add(self, item: Dict[str, Any]) -> bool:
+        """Grava a mensagem pendente; False se a chave já existir"""
+        pass
+
+    @abstractmethod
+    def claim(self, now: float, lease_seconds: float, limit: int) -> List[Dict[str, Any]]:
+        """Reserva até `limit` mensagens vencidas, uma por destino (incrementa `attempts`)"""
+        pass
+
+    @abstractmethod
+    def mark_sent(self, key: str, provider_message_id: Optional[str],
+                  provider_status: Optional[str]):
+        pass
+
+    @abstractmethod
+    def mark_retry(self, key: str, next_attempt_at: float, error: str):
+        pass
+
+    @abstractmethod
+    def mark_failed(self, key: str, error: str):
+        pass
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Mensagem e status de entrega"""
+        pass
+
+    @abstractmethod
+    def pending(self) -> int:
+        pass
+
+    def purge(self, before: float) -> int:
+        """Remove mensagens concluídas (enviadas ou falhas) antes de `before`"""
+        return 0
+
+
+class SQLiteOutboxStore(OutboxStore):
+    """Outbox em arquivo SQLite local (compartilhado pelos workers do container)"""
+
+    _COLUMNS = ('key', 'tenant', 'to_number', 'message', 'media_url', 'status', 'attempts',
+                'next_attempt_at', 'created_at', 'updated_at', 'provider_message_id',
+                'provider_status', 'last_error')
+
+    def __init__(self, path: str = 'outbox.db'):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " key TEXT PRIMARY KEY,"
+                " tenant TEXT,"
+                " to_number TEXT NOT NULL,"
+                " message TEXT NOT NULL,"
+                " media_url TEXT,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt_at REAL NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " provider_message_id TEXT,"
+                " provider_status TEXT,"
+                " last_error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_destination"
+                         " ON outbox (to_number, status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def add(self, item: Dict[str, Any]) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO outbox (key, tenant, to_number, message, media_url, status,"
+            " next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (item['key'], item.get('tenant'), item['to'], item['message'], item.get('media_url'),
+             PENDING, now, now, now)
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, now: float, lease_seconds: float, limit: int) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        # BEGIN IMMEDIATE: um processo por vez entre o SELECT e o UPDATE
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Só a mais antiga pendente de cada destino (rowid desempata a ordem de gravação)
+            rows = conn.execute(
+                "SELECT key, tenant, to_number, message, media_url, attempts FROM outbox AS o"
+                " WHERE status = ? AND next_attempt_at <= ? AND NOT EXISTS ("
+                "  SELECT 1 FROM outbox AS e WHERE e.to_number = o.to_number AND e.status = ?"
+                "  AND e.tenant IS o.tenant AND (e.created_at < o.created_at"
+                "  OR (e.created_at = o.created_at AND e.rowid < o.rowid)))"
+                " ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, PENDING, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, updated_at = ?"
+                " WHERE key = ?",
+                [(now + lease_seconds, now, row['key']) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [{'key': row['key'], 'tenant': row['tenant'], 'to': row['to_number'],
+                 'message': row['message'], 'media_url': row['media_url'],
+                 'attempts': row['attempts'] + 1} for row in rows]
+
+    def mark_sent(self, key: str, provider_message_id: Optional[str],
+                  provider_status: Optional[str]):
+        self._connect().execute(
+            "UPDATE outbox SET status = ?, provider_message_id = ?, provider_status = ?,"
+            " last_error = NULL, updated_at = ? WHERE key = ?",
+            (SENT, provider_message_id, provider_status, time.time(), key)
+        )
+
+    def mark_retry(self, key: str, next_attempt_at: float, error: str):
+        self._connect().execute(
+            "UPDATE outbox SET next_attempt_at = ?, last_error = ?, updated_at = ? WHERE key = ?",
+            (next_attempt_at, error, time.time(), key)
+        )
+
+    def mark_failed(self, key: str, error: str):
+        self._connect().execute(
+            "UPDATE outbox SET status = ?, last_error = ?, updated_at = ? WHERE key = ?",
+            (FAILED, error, time.time(), key)
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM outbox WHERE key = ?", (key,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def pending(self) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM outbox WHERE status = ?", (PENDING,)
+        ).fetchone()[0]
+
+    def purge(self, before: float) -> int:
+        cursor = self._connect().execute(
+            "DELETE FROM outbox WHERE status != ? AND updated_at < ?", (PENDING, before)
+        )
+        return cursor.rowcount
+
+
+class RedisOutboxStore(OutboxStore):
+    """
+    Outbox no Redis (compartilhado entre containers)
+
+    Um hash por mensagem, uma lista por destino com as pendentes na ordem de
+    gravação e um sorted set com a primeira de cada lista pelo horário da
+    próxima tentativa; ao concluir a primeira, a seguinte do destino entra no
+    sorted set. Mensagens concluídas expiram após `retention_seconds`.
+    """
+
+    # Grava na fila do destino; a primeira da fila fica disponível para reserva
+    _ADD = """
+if redis.call('RPUSH', KEYS[2], ARGV[1]) == 1 then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+end
+"""
+
+    # Tira a mensagem concluída da fila do destino e libera a seguinte
+    _ADVANCE = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+local following = redis.call('LINDEX', KEYS[2], 0)
+if following then
+    redis.call('ZADD', KEYS[1], 'NX', ARGV[2], following)
+end
+"""
+
+    # Reserva atômica: lê as vencidas e adia cada uma pelo lease
+    _CLAIM = """
+local keys = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, key in ipairs(keys) do
+    redis.call('ZADD', KEYS[1], ARGV[3], key)
+end
+return keys
+"""
+
+    def __init__(self, client, prefix: str = 'astra:outbox:', retention_seconds: float = 86400.0):
+        self.client = client
+        self.prefix = prefix
+        self.due_key = prefix + 'due'
+        self.retention_seconds = max(60, int(retention_seconds))
+        self._claim = client.register_script(self._CLAIM)
+        self._add = client.register_script(self._ADD)
+        self._advance = client.register_script(self._ADVANCE)
+
+    def _hash(self, key: str) -> str:
+        return f'{self.prefix}msg:{key}'
+
+    def _destination(self, tenant: Optional[str], to_number: str) -> str:
+        return f'{self.prefix}dest:{tenant or ""}:{to_number}'
+
+    def add(self, item: Dict[str, Any]) -> bool:
+        now = time.time()
+        if not self.client.hsetnx(self._hash(item['key']), 'status', PENDING):
+            return False
+        pipe = self.client.pipeline()
+        pipe.hset(self._hash(item['key']), mapping={
+            'key': item['key'],
+            'tenant': item.get('tenant') or '',
+            'to_number': item['to'],
+            'message': item['message'],
+            'media_url': item.get('media_url') or '',
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now,
+        })
+        pipe.execute()
+        self._add(keys=[self.due_key, self._destination(item.get('tenant'), item['to'])],
+                  args=[item['key'], now])
+        return True
+
+    def claim(self, now: float, lease_seconds: float, limit: int) -> List[Dict[str, Any]]:
+        keys = self._claim(keys=[self.due_key], args=[now, limit, now + lease_seconds])
+        if not keys:
+            return []
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.hincrby(self._hash(key), 'attempts', 1)
+            pipe.hgetall(self._hash(key))
+        replies = pipe.execute()
+        items = []
+        for key, attempts, data in zip(keys, replies[::2], replies[1::2]):
+            if not data.get('to_number'):
+                # Hash expirado/removido: tira do sorted set
+                self.client.zrem(self.due_key, key)
+                continue
+            items.append({'key': key, 'tenant': data.get('tenant') or None, 'to': data['to_number'],
+                          'message': data.get('message', ''), 'media_url': data.get('media_url') or None,
+                          'attempts': int(attempts)})
+        return items
+
+    def _finish(self, key: str, fields: Dict[str, Any]):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._hash(key), mapping=dict(fields, updated_at=now))
+        pipe.expire(self._hash(key), self.retention_seconds)
+        pipe.hmget(self._hash(key), 'tenant', 'to_number')
+        tenant, to_number = pipe.execute()[2]
+        self._advance(keys=[self.due_key, self._destination(tenant, to_number or '')], args=[key, now])
+
+    def mark_sent(self, key: str, provider_message_id: Optional[str],
+                  provider_status: Optional[str]):
+        self._finish(key, {'status': SENT, 'provider_message_id': provider_message_id or '',
+                           'provider_status': provider_status or '', 'last_error': ''})
+
+    def mark_retry(self, key: str, next_attempt_at: float, error: str):
+        pipe = self.client.pipeline()
+        pipe.hset(self._hash(key), mapping={'last_error': error, 'updated_at': time.time()})
+        pipe.zadd(self.due_key, {key: next_attempt_at})
+        pipe.execute()
+
+    def mark_failed(self, key: str, error: str):
+        self._finish(key, {'status': FAILED, 'last_error': error})
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.client.hgetall(self._hash(key)) or None
+
+    def pending(self) -> int:
+        return self.client.zcard(self.due_key)
+
+
+class Outbox:
+    """
+    Grava mensagens no OutboxStore e as entrega em background
+
+    A thread de flush reserva lotes de mensagens vencidas (no máximo uma
+    por destino, então cada destino recebe na ordem de gravação), agrupa por
+    tenant e agenda cada lote no loop compartilhado (`send_batch` do
+    dispatcher) sem esperar; os resultados voltam por uma fila e são
+    registrados na própria thread. Falhas são retentadas com backoff
+    exponencial até `max_attempts`.
+
+    Args:
+        store: persistência (SQLite ou Redis)
+        dispatcher: OutboundDispatcher do tenant padrão
+        tenants: ServiceContainer (dispatcher de mensagens com `tenant`)
+        batch_size: mensagens reservadas por ciclo
+        max_in_flight: mensagens enviadas e ainda sem resultado
+        interval_seconds: intervalo máximo entre ciclos (enqueue acorda a thread)
+        max_attempts: tentativas antes de marcar a mensagem como falha
+        backoff_seconds: base do backoff entre tentativas
+        lease_seconds: reserva de uma mensagem em envio (reenvio após expirar)
+        retention_seconds: mensagens concluídas mantidas para consulta
+        send_timeout: tempo máximo de um lote no dispatcher
+    """
+
+    def __init__(self, store: OutboxStore, dispatcher, tenants=None, batch_size: int = 50,
+                 max_in_flight: int = 200, interval_seconds: float = 1.0, max_attempts: int = 5,
+                 backoff_seconds: float = 2.0, lease_seconds: float = 120.0,
+                 retention_seconds: float = 86400.0, send_timeout: float = 60.0):
+        self.store = store
+        self.dispatcher = dispatcher
+        self.tenants = tenants
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.interval_seconds = interval_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = max(lease_seconds, send_timeout)
+        self.retention_seconds = retention_seconds
+        self.send_timeout = send_timeout
+        self.in_flight = 0
+        self.counters = {'enqueued': 0, 'duplicate': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        self._results: "queue.SimpleQueue[Tuple[List[Dict], Any, Any]]" = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_purge = 0.0
+        # O store é compartilhado: todos os workers leem o mesmo valor
+        metrics.gauge('whatsapp_outbox_pending', 'Mensagens pendentes no outbox', self._pending_gauge,
+                      multiprocess_mode='livemax')
+
+    def enqueue(self, to: str, message: str, key: Optional[str] = None,
+                tenant: Optional[str] = None, media_url: Optional[str] = None) -> bool:
+        """
+        Grava a mensagem para envio (a entrega acontece em background)
+
+        Args:
+            key: chave de idempotência (ex: ID da mensagem recebida); a
+                mesma chave nunca gera um segundo envio
+
+        Returns:
+            False se a chave já estava no outbox
+        """
+        added = self.store.add({'key': key or uuid.uuid4().hex, 'tenant': tenant, 'to': to,
+                                'message': message, 'media_url': media_url})
+        outcome = 'enqueued' if added else 'duplicate'
+        self.counters[outcome] += 1
+        OUTBOX.labels(outcome).inc()
+        if added:
+            self._wake.set()
+        return added
+
+    # Ciclo de vida
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='outbox-flusher', daemon=True)
+        self._thread.start()
+        logger.info(f"Outbox ativo ({type(self.store).__name__}, {self.store.pending()} pendentes)")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            try:
+                self.collect()
+                self.flush()
+                self._purge()
+            except Exception as e:
+                logger.error(f"Erro no flush do outbox: {str(e)}", exc_info=True)
+        self.collect()
+
+    # Envio
+    def flush(self) -> int:
+        """Reserva e agenda um lote de mensagens vencidas; retorna quantas"""
+        capacity = min(self.batch_size, self.max_in_flight - self.in_flight)
+        if capacity <= 0:
+            return 0
+        items = self.store.claim(time.time(), self.lease_seconds, capacity)
+        groups: Dict[Optional[str], List[Dict]] = {}
+        for item in items:
+            groups.setdefault(item['tenant'], []).append(item)
+        for tenant_id, group in groups.items():
+            services, dispatcher = self._acquire(tenant_id)
+            self.in_flight += len(group)
+            future = background_loop.submit(self._send(dispatcher, group))
+            future.add_done_callback(
+                lambda f, group=group, services=services: self._done(group, services, f)
+            )
+        return len(items)
+
+    async def _send(self, dispatcher, group: List[Dict]) -> List[Dict[str, Any]]:
+        return await asyncio.wait_for(
+            dispatcher.send_batch([{'to': item['to'], 'message': item['message'],
+                                    'media_url': item['media_url']} for item in group]),
+            timeout=self.send_timeout
+        )
+
+    def _done(self, group: List[Dict], services, future):
+        """Callback no loop: só repassa o resultado para a thread do outbox"""
+        self._results.put((group, services, future))
+        self._wake.set()
+
+    def collect(self) -> int:
+        """Registra os resultados dos lotes concluídos; retorna quantas mensagens"""
+        recorded = 0
+        while True:
+            try:
+                group, services, future = self._results.get_nowait()
+            except queue.Empty:
+                return recorded
+            self.in_flight -= len(group)
+            self._release(services)
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [{'success': False, 'error': str(e) or type(e).__name__}] * len(group)
+            for item, result in zip(group, results):
+                self._record(item, result)
+            recorded += len(group)
+
+    def _record(self, item: Dict, result: Dict[str, Any]):
+        if result.get('success'):
+            self.store.mark_sent(item['key'], result.get('message_id'), result.get('status'))
+            outcome = 'sent'
+        else:
+            error = str(result.get('error') or 'failed')
+            if item['attempts'] >= self.max_attempts:
+                self.store.mark_failed(item['key'], error)
+                logger.error(f"Outbox: mensagem {item['key']} falhou após {item['attempts']} tentativas: {error}")
+                outcome = 'failed'
+            else:
+                delay = self.backoff_seconds * 2 ** (item['attempts'] - 1)
+                self.store.mark_retry(item['key'], time.time() + delay, error)
+                outcome = 'retried'
+        self.counters[outcome] += 1
+        OUTBOX.labels(outcome).inc()
+
+    def _acquire(self, tenant_id: Optional[str]):
+        if tenant_id is None or self.tenants is None:
+            return None, self.dispatcher
+        services = self.tenants.acquire_tenant(tenant_id)
+        return services, services.outbound_dispatcher
+
+    def _release(self, services):
+        if services is not None:
+            self.tenants.release_tenant(services)
+
+    def _purge(self):
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        removed = self.store.purge(now - self.retention_seconds)
+        if removed:
+            logger.info(f"Outbox: {removed} mensagens concluídas removidas")
+
+    def _pending_gauge(self) -> Optional[int]:
+        try:
+            return self.store.pending()
+        except Exception:
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self.counters)
+        stats['in_flight'] = self.in_flight
+        stats['pending'] = self._pending_gauge()
+        return stats
@@ -0,0 +1,141 @@
+"""
+Prontidão (/ready) a partir de verificações periódicas das dependências
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from src.utils import metrics
+from src.utils.async_runner import resolve
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessProber:
+    """
+    Verifica API, provedor e Redis em uma thread daemon e guarda o resultado
+
+    O `/ready` só lê o estado em cache, então responde na hora mesmo com uma
+    dependência lenta ou fora do ar. Cada verificação é uma função sem
+    argumentos que retorna bool (ou awaitable de bool, rodado no loop
+    compartilhado); exceção ou timeout conta como falha. Uma dependência fica
+    "down" após `failure_threshold` falhas seguidas, e o estado inteiro é
+    considerado velho se a última rodada tiver mais de 3 intervalos.
+
+    Args:
+        checks: nome da dependência -> função de verificação
+        interval_seconds: intervalo entre rodadas
+        timeout_seconds: tempo máximo de cada verificação
+        failure_threshold: falhas seguidas até marcar a dependência como down
+    """
+
+    def __init__(self, checks: Dict[str, Callable[[], object]], interval_seconds: float = 10.0,
+                 timeout_seconds: float = 3.0, failure_threshold: int = 2):
+        self.checks = dict(checks)
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.failure_threshold = max(1, failure_threshold)
+        self.last_round: Optional[float] = None
+        self.state: Dict[str, Dict] = {
+            name: {'ok': None, 'latency_ms': None, 'last_check': None,
+                   'last_success': None, 'failures': 0, 'error': None}
+            for name in self.checks
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        metrics.gauge('whatsapp_dependency_up', 'Dependência disponível na última verificação (1 ou 0)',
+                      self._up_gauge, ('dependency',), multiprocess_mode='livemin')
+
+    def start(self):
+        if self._thread is not None or not self.checks:
+            return
+        # Uma thread por dependência: uma verificação lenta não atrasa as outras
+        self._executor = ThreadPoolExecutor(max_workers=len(self.checks), thread_name_prefix='readiness')
+        self._thread = threading.Thread(target=self._run, name='readiness-prober', daemon=True)
+        self._thread.start()
+        logger.info(f"Verificação de prontidão ativa: {', '.join(self.checks)} a cada {self.interval_seconds}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout_seconds + 2)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval_seconds)
+
+    def probe(self):
+        """Roda todas as verificações (em paralelo) e atualiza o estado"""
+        if self._executor is None:
+            for name in self.checks:
+                self._check(name)
+        else:
+            list(self._executor.map(self._check, self.checks))
+        self.last_round = time.time()
+
+    def _check(self, name: str):
+        started = time.perf_counter()
+        error = None
+        try:
+            ok = resolve(self.checks[name](), timeout=self.timeout_seconds) is not False
+        except Exception as e:
+            ok = False
+            error = f"{type(e).__name__}: {str(e)}"[:200]
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if not ok and latency_ms > self.timeout_seconds * 1000:
+            # Verificações síncronas não são interrompidas; passar do tempo conta como falha
+            error = error or 'timeout'
+        now = time.time()
+        with self._lock:
+            entry = self.state[name]
+            was_up = entry['ok']
+            entry['latency_ms'] = latency_ms
+            entry['last_check'] = now
+            if ok:
+                entry['last_success'] = now
+                entry['failures'] = 0
+                entry['error'] = None
+                entry['ok'] = True
+            else:
+                entry['failures'] += 1
+                entry['error'] = error or 'check failed'
+                if entry['failures'] >= self.failure_threshold or entry['ok'] is None:
+                    entry['ok'] = False
+        if was_up is not entry['ok'] and entry['ok'] is not None and was_up is not None:
+            logger.warning(f"Dependência {name} {'voltou' if entry['ok'] else 'fora do ar'}: "
+                           f"{entry['error'] or 'ok'}")
+
+    def _up_gauge(self) -> Dict:
+        with self._lock:
+            return {(name, ): 1 if entry['ok'] else 0
+                    for name, entry in self.state.items() if entry['ok'] is not None}
+
+    def report(self) -> Dict:
+        """
+        Estado em cache para o /ready
+
+        Returns:
+            {'ready': bool, 'checked_at': epoch da última rodada,
+             'dependencies': {nome: {ok, latency_ms, last_check, last_success, error}}}
+        """
+        stale = (self.last_round is None
+                 or time.time() - self.last_round > 3 * self.interval_seconds + self.timeout_seconds)
+        with self._lock:
+            dependencies = {
+                name: {key: value for key, value in entry.items() if key != 'failures'}
+                for name, entry in self.state.items()
+            }
+        ready = not stale and all(entry['ok'] for entry in dependencies.values())
+        report = {'ready': ready, 'checked_at': self.last_round, 'dependencies': dependencies}
+        if stale:
+            report['error'] = 'readiness state not available' if self.last_round is None else 'stale'
+        return report
@@ -0,0 +1,17 @@
+"""
+Conexão Redis compartilhada
+"""
+from functools import lru_cache
+import redis
+
+
+@lru_cache(maxsize=None)
+def get_redis_client(url: str) -> redis.Redis:
+    """Retorna um cliente Redis (com pool de conexões) por URL"""
+    return redis.Redis.from_url(
+        url,
+        decode_responses=True,
+        socket_connect_timeout=2,
+        socket_timeout=2,
+        health_check_interval=30
+    )
@@ -0,0 +1,518 @@
+"""
+Motor de lembretes de agendamentos
+"""
+import heapq
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from src.container import DEFAULT_TENANT
+from src.services.api_client import APIClient, appointment_start, appointment_status
+from src.utils.async_runner import resolve, run_coroutine
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Status (nome do enum da API, em minúsculas) que recebem lembrete
+REMINDER_STATUSES = frozenset({'scheduled', 'confirmed'})
+
+
+class ReminderStore(ABC):
+    """
+    Estado persistente dos lembretes
+
+    `claim` é atômico entre processos e vale por um lease curto: quem
+    conseguir o claim envia e, depois do envio, marca o lembrete como
+    concluído (`complete`). Se o processo cair entre o claim e o envio, o
+    lease expira e o lembrete volta a ser agendado, então reinícios não
+    perdem lembretes e múltiplos workers não geram envios duplicados.
+
+    `acquire_leader` elege um único processo para buscar e enviar os
+    lembretes (lease renovado pelo líder a cada tick).
+    """
+
+    @abstractmethod
+    def claim(self, key: str, lease_seconds: float) -> bool:
+        """Reserva o envio do lembrete por `lease_seconds`; False se já reservado/enviado"""
+        pass
+
+    @abstractmethod
+    def complete(self, key: str, expires_at: float):
+        """Marca o lembrete como enviado (guardado até `expires_at`)"""
+        pass
+
+    @abstractmethod
+    def release(self, key: str):
+        """Libera um claim cujo envio falhou (será tentado novamente)"""
+        pass
+
+    @abstractmethod
+    def is_claimed(self, key: str) -> bool:
+        """True se enviado ou com lease ainda válido"""
+        pass
+
+    @abstractmethod
+    def acquire_leader(self, owner: str, ttl_seconds: float) -> bool:
+        """Assume ou renova a liderança; False se outro processo lidera"""
+        pass
+
+    def purge(self) -> int:
+        """Remove claims de agendamentos que já passaram e leases vencidos"""
+        return 0
+
+
+class SQLiteReminderStore(ReminderStore):
+    """Claims em arquivo SQLite local (compartilhado pelos workers do container)"""
+
+    def __init__(self, path: str = 'reminders.db'):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reminders ("
+                " key TEXT PRIMARY KEY,"
+                " claimed_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " lease_until REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(reminders)")}
+            if 'lease_until' not in columns:
+                # Bancos antigos: claims existentes já foram enviados (lease nulo)
+                conn.execute("ALTER TABLE reminders ADD COLUMN lease_until REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_expires ON reminders (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reminder_leader ("
+                " name TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key: str, lease_seconds: float) -> bool:
+        now = time.time()
+        lease_until = now + lease_seconds
+        # Novo claim, ou retomada de um lease vencido (nunca de um lembrete enviado)
+        cursor = self._connect().execute(
+            "INSERT INTO reminders (key, claimed_at, expires_at, lease_until) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET claimed_at = excluded.claimed_at,"
+            " expires_at = excluded.expires_at, lease_until = excluded.lease_until"
+            " WHERE reminders.lease_until IS NOT NULL AND reminders.lease_until < ?",
+            (key, now, lease_until, lease_until, now)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, key: str, expires_at: float):
+        self._connect().execute(
+            "UPDATE reminders SET expires_at = ?, lease_until = NULL WHERE key = ?",
+            (expires_at, key)
+        )
+
+    def release(self, key: str):
+        self._connect().execute("DELETE FROM reminders WHERE key = ?", (key,))
+
+    def is_claimed(self, key: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM reminders WHERE key = ? AND (lease_until IS NULL OR lease_until >= ?)",
+            (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def acquire_leader(self, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO reminder_leader (name, owner, expires_at) VALUES ('reminders', ?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE reminder_leader.owner = excluded.owner OR reminder_leader.expires_at < ?",
+            (owner, now + ttl_seconds, now)
+        )
+        return cursor.rowcount == 1
+
+    def purge(self) -> int:
+        # Leases vencidos têm expires_at = lease_until
+        cursor = self._connect().execute("DELETE FROM reminders WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+
+class RedisReminderStore(ReminderStore):
+    """Claims no Redis (compartilhado entre containers)"""
+
+    # Renova a liderança do dono atual ou assume se estiver vaga
+    _LEADER = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+    def __init__(self, client, prefix: str = 'astra:reminder:'):
+        self.client = client
+        self.prefix = prefix
+        self._leader = client.register_script(self._LEADER)
+
+    def claim(self, key: str, lease_seconds: float) -> bool:
+        # O lease expira sozinho se o envio não for concluído
+        return bool(self.client.set(self.prefix + key, 'pending', nx=True, ex=max(1, int(lease_seconds))))
+
+    def complete(self, key: str, expires_at: float):
+        ttl = max(60, int(expires_at - time.time()))
+        self.client.set(self.prefix + key, 'sent', ex=ttl)
+
+    def release(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def is_claimed(self, key: str) -> bool:
+        return bool(self.client.exists(self.prefix + key))
+
+    def acquire_leader(self, owner: str, ttl_seconds: float) -> bool:
+        ttl = max(1, int(ttl_seconds))
+        return bool(self._leader(keys=[self.prefix + 'leader'], args=[owner, ttl]))
+
+
+class ReminderEngine:
+    """
+    Agenda e envia lembretes antes dos horários marcados
+
+    - busca os agendamentos da janela [agora, agora + lookahead] em blocos
+      (`fetch_window`) a cada `fetch_interval`;
+    - mantém os lembretes pendentes em um heap ordenado pelo horário de envio,
+      então cada tick só olha o topo do heap;
+    - envia pelo OutboundDispatcher (concorrência e rate limit dele) e
+      registra o envio no ReminderStore; com `outbox`, grava o lembrete no
+      outbox, que cuida da entrega e dos retries;
+    - só o processo eleito líder no ReminderStore busca e envia: os demais
+      workers apenas tentam assumir a liderança a cada tick;
+    - com `tenants` (o ServiceContainer), busca e envia os lembretes de cada
+      tenant com a API e o dispatcher dele.
+    """
+
+    def __init__(self, api_client: APIClient, dispatcher, store: ReminderStore,
+                 lead_minutes: int = 60, lookahead_minutes: int = 0,
+                 fetch_interval_seconds: float = 300.0, fetch_window_minutes: int = 60,
+                 tick_seconds: float = 5.0, batch_size: int = 200,
+                 send_timeout: float = 60.0, timezone: str = 'America/Sao_Paulo',
+                 outbox=None, tenants=None):
+        self.api = api_client
+        self.dispatcher = dispatcher
+        self.store = store
+        self.outbox = outbox
+        self.tenants = tenants
+        self.lead = timedelta(minutes=lead_minutes)
+        # A janela precisa cobrir a antecedência + folga de duas buscas
+        self.lookahead = timedelta(minutes=lookahead_minutes) if lookahead_minutes > 0 else (
+            self.lead + timedelta(seconds=2 * fetch_interval_seconds)
+        )
+        self.fetch_interval_seconds = fetch_interval_seconds
+        self.fetch_window = timedelta(minutes=max(1, fetch_window_minutes))
+        self.tick_seconds = tick_seconds
+        self.batch_size = batch_size
+        self.send_timeout = send_timeout
+        self.tz = pytz.timezone(timezone)
+        # Lease do claim: cobre o envio; se o processo cair, o lembrete volta
+        self.claim_lease_seconds = max(60.0, 2 * send_timeout)
+        self.leader_ttl_seconds = max(30.0, 6 * tick_seconds)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leading = False
+
+        # heap de (envio_ts, key); _pending guarda os dados do lembrete vivo
+        self._heap: List[Tuple[float, str]] = []
+        self._pending: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._phones = TTLCache(max_size=10000, ttl_seconds=3600)
+        self._scheduler: Optional[BackgroundScheduler] = None
+        self.counters = {'fetched': 0, 'scheduled': 0, 'sent': 0, 'failed': 0, 'skipped': 0}
+
+    # Ciclo de vida
+    def start(self):
+        if self._scheduler is not None:
+            return
+        self._scheduler = BackgroundScheduler(timezone=self.tz)
+        self._scheduler.add_job(
+            self.elect, 'interval', seconds=self.tick_seconds,
+            next_run_time=datetime.now(self.tz), max_instances=1, coalesce=True, id='reminders-leader'
+        )
+        self._scheduler.add_job(
+            self.fetch, 'interval', seconds=self.fetch_interval_seconds,
+            max_instances=1, coalesce=True, id='reminders-fetch'
+        )
+        self._scheduler.add_job(
+            self.dispatch_due, 'interval', seconds=self.tick_seconds,
+            max_instances=1, coalesce=True, id='reminders-dispatch'
+        )
+        self._scheduler.start()
+        logger.info(f"Lembretes ativos: {int(self.lead.total_seconds() // 60)} min de antecedência")
+
+    def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+        self.leading = False
+
+    def elect(self) -> bool:
+        """Assume ou renova a liderança; o novo líder busca a janela na hora"""
+        try:
+            leading = self.store.acquire_leader(self.owner, self.leader_ttl_seconds)
+        except Exception as e:
+            logger.error(f"Erro ao renovar liderança dos lembretes: {str(e)}")
+            leading = False
+
+        if leading and not self.leading:
+            logger.info(f"Lembretes: {self.owner} assumiu o envio")
+            if self._scheduler is not None:
+                self._scheduler.modify_job('reminders-fetch', next_run_time=datetime.now(self.tz))
+        elif not leading and self.leading:
+            logger.info(f"Lembretes: {self.owner} perdeu a liderança")
+            with self._lock:
+                self._heap.clear()
+                self._pending.clear()
+        self.leading = leading
+        return leading
+
+    # Busca
+    def _parse_start(self, value: str) -> Optional[datetime]:
+        try:
+            start = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return None
+        if start.tzinfo is None:
+            return self.tz.localize(start)
+        return start.astimezone(self.tz)
+
+    @staticmethod
+    def _key(tenant_id: Optional[str], appointment_id: str, start: datetime) -> str:
+        # Inclui o horário: remarcações geram um novo lembrete; o tenant padrão não tem prefixo
+        key = f"{appointment_id}:{int(start.timestamp())}"
+        return key if tenant_id in (None, DEFAULT_TENANT) else f"{tenant_id}:{key}"
+
+    # Tenants
+    def _tenant_ids(self) -> List[Optional[str]]:
+        return [None] if self.tenants is None else self.tenants.tenant_ids()
+
+    def _acquire(self, tenant_id: Optional[str]):
+        """(serviços do tenant ou None, api, dispatcher)"""
+        if tenant_id is None or self.tenants is None:
+            return None, self.api, self.dispatcher
+        services = self.tenants.acquire_tenant(tenant_id)
+        return services, services.api_client, services.outbound_dispatcher
+
+    def _release(self, services):
+        if services is not None:
+            self.tenants.release_tenant(services)
+
+    def fetch(self):
+        """Recarrega os agendamentos da janela de cada tenant e atualiza o heap (só no líder)"""
+        if not self.leading:
+            return
+        now = datetime.now(self.tz)
+        horizon = now + self.lookahead
+        seen = set()
+        # Tenants com erro na busca mantêm os lembretes já agendados
+        failed = set()
+        for tenant_id in self._tenant_ids():
+            try:
+                services, api, _ = self._acquire(tenant_id)
+            except Exception as e:
+                logger.error(f"Erro ao abrir clientes do tenant {tenant_id} para lembretes: {str(e)}")
+                failed.add(tenant_id)
+                continue
+            try:
+                if not self._fetch_tenant(tenant_id, api, now, horizon, seen):
+                    failed.add(tenant_id)
+            finally:
+                self._release(services)
+
+        # Agendamentos cancelados/remarcados somem da janela: descartar
+        with self._lock:
+            for key in [k for k, r in self._pending.items() if k not in seen and r['tenant'] not in failed]:
+                del self._pending[key]
+            # Entradas órfãs ficam no heap até serem retiradas; compactar se acumular
+            if len(self._heap) > 2 * len(self._pending) + 1000:
+                self._heap = [(due, key) for due, key in self._heap if key in self._pending]
+                heapq.heapify(self._heap)
+        self.store.purge()
+
+    def _fetch_tenant(self, tenant_id: Optional[str], api, now: datetime, horizon: datetime,
+                      seen: set) -> bool:
+        window_start = now
+        while window_start < horizon:
+            window_end = min(horizon, window_start + self.fetch_window)
+            # A busca por intervalo da API ignora `status`: filtrado em `_schedule`
+            try:
+                appointments = resolve(api.get_appointments(window_start, window_end))
+            except Exception as e:
+                logger.error(f"Erro ao buscar agendamentos para lembretes ({tenant_id or DEFAULT_TENANT}): {str(e)}")
+                return False
+            self.counters['fetched'] += len(appointments)
+            for appointment in appointments:
+                key = self._schedule(tenant_id, appointment, now)
+                if key:
+                    seen.add(key)
+            window_start = window_end
+        return True
+
+    def _schedule(self, tenant_id: Optional[str], appointment: Dict, now: datetime) -> Optional[str]:
+        if appointment_status(appointment) not in REMINDER_STATUSES:
+            return None
+        start = self._parse_start(appointment_start(appointment))
+        appointment_id = appointment.get('id')
+        if start is None or not appointment_id or start <= now:
+            return None
+
+        key = self._key(tenant_id, appointment_id, start)
+        with self._lock:
+            if key in self._pending:
+                return key
+        if self.store.is_claimed(key):
+            return key
+
+        due = start - self.lead
+        reminder = {
+            'tenant': tenant_id,
+            'start': start,
+            'service': appointment.get('service') or appointment.get('title') or 'Atendimento',
+            'customer_id': appointment.get('customerId'),
+            'phone': appointment.get('customerPhone') or (appointment.get('customer') or {}).get('phone')
+        }
+        with self._lock:
+            self._pending[key] = reminder
+            heapq.heappush(self._heap, (due.timestamp(), key))
+        self.counters['scheduled'] += 1
+        return key
+
+    # Envio
+    def _pop_due(self) -> List[Tuple[str, Dict]]:
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                _, key = heapq.heappop(self._heap)
+                reminder = self._pending.pop(key, None)
+                if reminder is not None:
+                    due.append((key, reminder))
+        return due
+
+    def _resolve_phone(self, reminder: Dict, api) -> Optional[str]:
+        if reminder['phone']:
+            return reminder['phone']
+        customer_id = reminder['customer_id']
+        if not customer_id:
+            return None
+        cache_key = (reminder['tenant'], customer_id)
+        phone = self._phones.get(cache_key)
+        if phone is None:
+            customer = resolve(api.get_customer(customer_id))
+            phone = (customer or {}).get('phone') or ''
+            self._phones.set(cache_key, phone)
+        return phone or None
+
+    @staticmethod
+    def _message(reminder: Dict) -> str:
+        start = reminder['start']
+        return (f"⏰ *Lembrete de agendamento*\n\n"
+                f"📅 Data: {start.strftime('%d/%m/%Y')}\n"
+                f"⏰ Horário: {start.strftime('%H:%M')}\n"
+                f"💈 Serviço: {reminder['service']}\n\n"
+                f"Digite *menu* para mais opções.")
+
+    def _retry_later(self, key: str, reminder: Dict):
+        retry_at = time.time() + self.tick_seconds * 6
+        if reminder['start'].timestamp() > retry_at:
+            with self._lock:
+                self._pending[key] = reminder
+                heapq.heappush(self._heap, (retry_at, key))
+
+    def dispatch_due(self):
+        """Envia os lembretes vencidos (um lote por tick, só no líder), agrupados por tenant"""
+        if not self.leading:
+            return
+        groups: Dict[Optional[str], List[Tuple[str, Dict]]] = {}
+        for key, reminder in self._pop_due():
+            groups.setdefault(reminder['tenant'], []).append((key, reminder))
+
+        for tenant_id, due in groups.items():
+            try:
+                services, api, dispatcher = self._acquire(tenant_id)
+            except Exception as e:
+                logger.error(f"Erro ao abrir clientes do tenant {tenant_id} para lembretes: {str(e)}")
+                for key, reminder in due:
+                    self._retry_later(key, reminder)
+                continue
+            try:
+                self._dispatch(tenant_id, due, api, dispatcher)
+            finally:
+                self._release(services)
+
+    def _dispatch(self, tenant_id: Optional[str], due: List[Tuple[str, Dict]], api, dispatcher):
+        claimed = []
+        messages = []
+        for key, reminder in due:
+            try:
+                phone = self._resolve_phone(reminder, api)
+            except Exception as e:
+                logger.error(f"Erro ao buscar telefone do lembrete {key}: {str(e)}")
+                phone = None
+            if not phone:
+                self.counters['skipped'] += 1
+                continue
+            if not self.store.claim(key, self.claim_lease_seconds):
+                continue
+            claimed.append((key, reminder))
+            messages.append({'to': phone, 'message': self._message(reminder)})
+
+        if not messages:
+            return
+        if self.outbox is not None:
+            self._enqueue(tenant_id, claimed, messages)
+            return
+        try:
+            results = run_coroutine(dispatcher.send_batch(messages), timeout=self.send_timeout)
+        except Exception as e:
+            logger.error(f"Erro ao enviar lote de lembretes: {str(e)}")
+            results = [{'success': False}] * len(messages)
+
+        for (key, reminder), result in zip(claimed, results):
+            if result.get('success'):
+                self.store.complete(key, reminder['start'].timestamp())
+                self.counters['sent'] += 1
+                continue
+            self.counters['failed'] += 1
+            self.store.release(key)
+            self._retry_later(key, reminder)
+
+    def _enqueue(self, tenant_id: Optional[str], claimed: List[Tuple[str, Dict]], messages: List[Dict]):
+        """Grava os lembretes no outbox (chave de idempotência = chave do lembrete)"""
+        for (key, reminder), message in zip(claimed, messages):
+            try:
+                self.outbox.enqueue(message['to'], message['message'], key=f'reminder:{key}',
+                                    tenant=tenant_id)
+                self.store.complete(key, reminder['start'].timestamp())
+                self.counters['sent'] += 1
+            except Exception as e:
+                logger.error(f"Erro ao gravar lembrete {key} no outbox: {str(e)}")
+                self.counters['failed'] += 1
+                self.store.release(key)
+
+    def stats(self) -> Dict:
+        stats = dict(self.counters)
+        stats['pending'] = len(self._pending)
+        stats['leading'] = self.leading
+        return stats
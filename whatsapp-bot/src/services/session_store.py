@@ -0,0 +1,305 @@
+"""
+Armazenamento de sessões de conversa
+"""
+import asyncio
+import atexit
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import astuple, dataclass, field, fields
+from typing import Dict, Optional, Tuple
+
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class ConversationSession:
+    """
+    Estado de uma conversa em andamento
+
+    Guarda apenas IDs, horários oferecidos (ISO) e timestamps que o fluxo
+    usa; nada do payload bruto da API.
+    """
+    state: Optional[str] = None
+    customer_id: Optional[str] = None
+    customer_name: Optional[str] = None
+    date: Optional[str] = None
+    slot_times: Tuple[str, ...] = ()
+    slot_time: Optional[str] = None
+    updated_at: float = field(default_factory=time.time)
+    cursor: Optional[str] = None  # próxima página de "meus agendamentos"
+
+    def copy(self) -> 'ConversationSession':
+        return ConversationSession(*astuple(self))
+
+    def clear(self):
+        """Encerra o fluxo (a sessão será removida do store)"""
+        self.state = None
+        self.customer_id = None
+        self.customer_name = None
+        self.date = None
+        self.slot_times = ()
+        self.slot_time = None
+        self.cursor = None
+
+    def __bool__(self) -> bool:
+        return self.state is not None
+
+
+# Campos gravados em cada versão do formato, na ordem do array. Incluir,
+# remover ou reordenar um campo exige uma nova versão (as anteriores seguem
+# legíveis); a versão 0 é o array sem número de versão das primeiras gravações.
+SESSION_VERSION = 1
+SESSION_FIELDS: Dict[int, Tuple[str, ...]] = {
+    0: ('state', 'customer_id', 'customer_name', 'date', 'slot_times', 'slot_time',
+        'updated_at', 'cursor'),
+    1: ('state', 'customer_id', 'customer_name', 'date', 'slot_times', 'slot_time',
+        'updated_at', 'cursor'),
+}
+_SESSION_ATTRIBUTES = frozenset(f.name for f in fields(ConversationSession))
+
+
+def encode_session(session: ConversationSession) -> str:
+    """Serializa a sessão como array JSON compacto: [versão, campos da versão...]"""
+    values = [SESSION_VERSION]
+    values.extend(getattr(session, name) for name in SESSION_FIELDS[SESSION_VERSION])
+    return json.dumps(values, separators=(',', ':'), ensure_ascii=False)
+
+
+def decode_session(raw: str) -> ConversationSession:
+    """
+    Desserializa sessão gravada por encode_session em qualquer versão conhecida
+
+    Campos ausentes no payload ficam com o padrão; campos que não existem
+    mais são ignorados. Versão desconhecida (ex: gravada por um deploy mais
+    novo) levanta ValueError.
+    """
+    values = json.loads(raw)
+    if not isinstance(values, list):
+        raise ValueError("Sessão não é um array")
+    version = 0
+    if values and type(values[0]) is int:
+        version = values[0]
+        values = values[1:]
+    names = SESSION_FIELDS.get(version)
+    if names is None:
+        raise ValueError(f"Versão de sessão desconhecida: {version}")
+    data = {name: value for name, value in zip(names, values) if name in _SESSION_ATTRIBUTES}
+    if 'slot_times' in data:
+        data['slot_times'] = tuple(data['slot_times'] or ())
+    return ConversationSession(**data)
+
+
+class SessionStore(ABC):
+    """
+    Interface para armazenamento de sessões (chave = número do usuário)
+
+    Backends com I/O de rede marcam `blocking`; no event loop (ASGI) as
+    variantes `*_async` rodam as operações deles em uma thread.
+    """
+
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[ConversationSession]:
+        """Busca a sessão e renova o TTL de inatividade"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, session: ConversationSession):
+        """Grava a sessão completa"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove a sessão"""
+        pass
+
+    @abstractmethod
+    def size(self) -> Optional[int]:
+        """Número de sessões ativas (None se o backend não souber barato)"""
+        pass
+
+    async def get_async(self, key: str) -> Optional[ConversationSession]:
+        if self.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def set_async(self, key: str, session: ConversationSession):
+        if self.blocking:
+            await asyncio.to_thread(self.set, key, session)
+        else:
+            self.set(key, session)
+
+    async def delete_async(self, key: str):
+        if self.blocking:
+            await asyncio.to_thread(self.delete, key)
+        else:
+            self.delete(key)
+
+
+class NamespacedSessionStore(SessionStore):
+    """
+    Visão de um store compartilhado com as chaves prefixadas por tenant
+
+    O mesmo cliente pode conversar com dois tenants sem que as sessões se
+    misturem.
+    """
+
+    def __init__(self, store: SessionStore, namespace: str):
+        self.store = store
+        self.prefix = f'{namespace}:'
+        self.blocking = store.blocking
+
+    def get(self, key: str) -> Optional[ConversationSession]:
+        return self.store.get(self.prefix + key)
+
+    def set(self, key: str, session: ConversationSession):
+        self.store.set(self.prefix + key, session)
+
+    def delete(self, key: str):
+        self.store.delete(self.prefix + key)
+
+    async def get_async(self, key: str) -> Optional[ConversationSession]:
+        return await self.store.get_async(self.prefix + key)
+
+    async def set_async(self, key: str, session: ConversationSession):
+        await self.store.set_async(self.prefix + key, session)
+
+    async def delete_async(self, key: str):
+        await self.store.delete_async(self.prefix + key)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class InMemorySessionStore(SessionStore):
+    """Sessões em memória do processo, com LRU + TTL de inatividade"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 1800.0):
+        self.cache = TTLCache(max_size=max_entries, ttl_seconds=ttl_seconds, sliding=True)
+
+    def get(self, key: str) -> Optional[ConversationSession]:
+        session = self.cache.get(key)
+        # Cópia: o handler altera a sessão e decide se grava
+        return session.copy() if session is not None else None
+
+    def set(self, key: str, session: ConversationSession):
+        self.cache.set(key, session)
+
+    def delete(self, key: str):
+        self.cache.pop(key)
+
+    def size(self) -> Optional[int]:
+        # Sessões abandonadas só saem do LRU quando lidas ou empurradas: expirar antes de contar
+        self.cache.purge_expired()
+        return len(self.cache)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessões no Redis, compartilhadas entre workers/containers
+
+    A mensagem custa uma ida ao Redis: a leitura (GETEX, que também renova o
+    TTL). As gravações e remoções vão para um buffer em memória e uma thread
+    as envia em um pipeline, junto com as das outras mensagens, então a
+    resposta não espera por elas. Leituras de uma chave com gravação ainda
+    no buffer são respondidas pelo buffer (o worker sempre vê a própria
+    última gravação).
+
+    Args:
+        client: cliente Redis (decode_responses=True)
+        ttl_seconds: expiração por inatividade
+        prefix: prefixo das chaves
+        retry_seconds: espera antes de reenviar o buffer após erro no Redis
+    """
+
+    blocking = True
+
+    def __init__(self, client, ttl_seconds: float = 1800.0, prefix: str = 'astra:session:',
+                 retry_seconds: float = 1.0):
+        self.client = client
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+        self.retry_seconds = retry_seconds
+        # chave -> sessão codificada (None = remover) ainda não enviada
+        self._pending: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self, key: str) -> Optional[ConversationSession]:
+        name = self.prefix + key
+        with self._lock:
+            buffered = name in self._pending
+            raw = self._pending.get(name)
+        if not buffered:
+            raw = self.client.getex(name, ex=self.ttl_seconds)
+        if raw is None:
+            return None
+        try:
+            return decode_session(raw)
+        except (ValueError, TypeError, KeyError):
+            logger.warning(f"Sessão corrompida descartada: {key}")
+            return None
+
+    def set(self, key: str, session: ConversationSession):
+        self._write(self.prefix + key, encode_session(session))
+
+    def delete(self, key: str):
+        self._write(self.prefix + key, None)
+
+    # Gravações só tocam o buffer: não precisam de thread no event loop
+    async def set_async(self, key: str, session: ConversationSession):
+        self.set(key, session)
+
+    async def delete_async(self, key: str):
+        self.delete(key)
+
+    def _write(self, name: str, raw: Optional[str]):
+        with self._lock:
+            self._pending[name] = raw
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Falha ao gravar sessões no Redis: {str(e)}")
+                time.sleep(self.retry_seconds)
+                self._wake.set()
+
+    def flush(self) -> int:
+        """Envia o buffer em um pipeline; retorna quantas chaves foram gravadas"""
+        with self._lock:
+            batch = dict(self._pending)
+        if not batch:
+            return 0
+        pipe = self.client.pipeline(transaction=False)
+        for name, raw in batch.items():
+            if raw is None:
+                pipe.delete(name)
+            else:
+                pipe.set(name, raw, ex=self.ttl_seconds)
+        pipe.execute()
+        with self._lock:
+            for name, raw in batch.items():
+                # Regravada durante o envio: fica para o próximo pipeline
+                if name in self._pending and self._pending[name] is raw:
+                    del self._pending[name]
+        return len(batch)
+
+    def size(self) -> Optional[int]:
+        # Contar exigiria SCAN nas chaves; não vale o custo
+        return None
@@ -0,0 +1,61 @@
+"""
+Prefetch de horários disponíveis dos próximos dias
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from src.services.api_client import APIClient
+from src.utils.async_runner import resolve
+
+logger = logging.getLogger(__name__)
+
+
+class SlotPrefetcher:
+    """
+    Mantém quente o cache de horários dos próximos N dias
+
+    Roda em thread daemon e recarrega cada data com intervalo menor que o
+    TTL do cache, para que a etapa "escolha a data" responda da memória.
+    """
+
+    def __init__(self, api_client: APIClient, days: int = 7,
+                 interval_seconds: float = 25.0, resource_id: Optional[str] = None):
+        self.api = api_client
+        self.days = days
+        self.interval_seconds = interval_seconds
+        self.resource_id = resource_id
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Inicia o loop de prefetch"""
+        if self._thread is not None or self.days <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='slot-prefetcher', daemon=True)
+        self._thread.start()
+        logger.info(f"Prefetch de horários ativo para os próximos {self.days} dias")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def refresh(self):
+        """Recarrega os horários de hoje até hoje + days - 1"""
+        today = datetime.now().date()
+        for offset in range(self.days):
+            if self._stop.is_set():
+                return
+            day = today + timedelta(days=offset)
+            try:
+                resolve(self.api.get_available_slots(day, self.resource_id, refresh=True))
+            except Exception as e:
+                logger.warning(f"Falha no prefetch de horários de {day.isoformat()}: {str(e)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval_seconds)
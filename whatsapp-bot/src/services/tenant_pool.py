@@ -0,0 +1,163 @@
+"""
+Pool de clientes por tenant (instância Evolution ou número Twilio)
+"""
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from src.utils import metrics
+from src.utils.async_runner import background_loop
+
+logger = logging.getLogger(__name__)
+
+TENANT_BUILDS = metrics.counter(
+    'whatsapp_tenant_builds_total',
+    'Conjuntos de clientes de tenant construídos'
+)
+TENANT_EVICTIONS = metrics.counter(
+    'whatsapp_tenant_evictions_total',
+    'Clientes de tenant fechados, por motivo (idle ou lru)',
+    ('reason',)
+)
+
+
+class TenantServices:
+    """Clientes vivos de um tenant: API, provedor, handler e dispatcher"""
+
+    __slots__ = ('tenant_id', 'api_client', 'whatsapp_provider', 'message_handler',
+                 'outbound_dispatcher', 'active', 'last_used')
+
+    def __init__(self, tenant_id: str, api_client, whatsapp_provider, message_handler,
+                 outbound_dispatcher):
+        self.tenant_id = tenant_id
+        self.api_client = api_client
+        self.whatsapp_provider = whatsapp_provider
+        self.message_handler = message_handler
+        self.outbound_dispatcher = outbound_dispatcher
+        self.active = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Fecha os clientes HTTP (os async no loop compartilhado, sem aguardar)"""
+        for client in (self.api_client, self.whatsapp_provider):
+            close = getattr(client, 'close', None)
+            if close is None:
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    background_loop.submit(result)
+            except Exception as e:
+                logger.warning(f"Erro ao fechar clientes do tenant {self.tenant_id}: {str(e)}")
+
+
+class TenantPool:
+    """
+    LRU limitado de TenantServices, construídos no primeiro webhook do tenant
+
+    Um tenant em uso (`acquire` sem `release` correspondente) nunca é
+    fechado; se todos estiverem em uso o pool passa temporariamente de
+    `max_live`. A expiração por inatividade é verificada a cada `acquire`.
+
+    Args:
+        tenant_ids: tenants configurados
+        factory: constrói os TenantServices de um tenant
+        max_live: máximo de tenants com clientes abertos
+        idle_seconds: fecha clientes sem uso há mais tempo que isso
+    """
+
+    def __init__(self, tenant_ids: List[str], factory: Callable[[str], TenantServices],
+                 max_live: int = 50, idle_seconds: float = 900.0):
+        self.tenant_ids = set(tenant_ids)
+        self.factory = factory
+        self.max_live = max(1, max_live)
+        self.idle_seconds = idle_seconds
+        self._live: "OrderedDict[str, TenantServices]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, tenant_id: str) -> TenantServices:
+        """
+        Clientes do tenant, construídos se necessário (devolver com `release`)
+
+        Raises:
+            KeyError: tenant não configurado
+        """
+        if tenant_id not in self.tenant_ids:
+            raise KeyError(tenant_id)
+        with self._lock:
+            services = self._checkout(tenant_id)
+        if services is None:
+            # Construção fora do lock: criar clientes HTTP (SSL) não trava outros tenants
+            built = self.factory(tenant_id)
+            TENANT_BUILDS.inc()
+            with self._lock:
+                services = self._checkout(tenant_id)
+                if services is None:
+                    services = self._live[tenant_id] = built
+                    services.active += 1
+                    built = None
+            if built is not None:
+                built.close()
+        self._close(self._evict())
+        return services
+
+    def release(self, services: TenantServices):
+        with self._lock:
+            services.active -= 1
+            services.last_used = time.monotonic()
+
+    def _checkout(self, tenant_id: str) -> Optional[TenantServices]:
+        services = self._live.get(tenant_id)
+        if services is not None:
+            services.active += 1
+            services.last_used = time.monotonic()
+            self._live.move_to_end(tenant_id)
+        return services
+
+    def _evict(self) -> List[TenantServices]:
+        """Remove do pool os ociosos e os excedentes (LRU) fora de uso"""
+        now = time.monotonic()
+        evicted: List[TenantServices] = []
+        with self._lock:
+            for tenant_id, services in list(self._live.items()):
+                if services.active == 0 and now - services.last_used > self.idle_seconds:
+                    del self._live[tenant_id]
+                    evicted.append(services)
+                    TENANT_EVICTIONS.labels('idle').inc()
+            for tenant_id, services in list(self._live.items()):
+                if len(self._live) <= self.max_live:
+                    break
+                if services.active == 0:
+                    del self._live[tenant_id]
+                    evicted.append(services)
+                    TENANT_EVICTIONS.labels('lru').inc()
+        return evicted
+
+    @staticmethod
+    def _close(evicted: List[TenantServices]):
+        for services in evicted:
+            logger.info(f"Fechando clientes do tenant {services.tenant_id}")
+            services.close()
+
+    def close_all(self):
+        """Fecha os clientes de todos os tenants (desligamento)"""
+        with self._lock:
+            evicted = list(self._live.values())
+            self._live.clear()
+        self._close(evicted)
+
+    def live(self) -> int:
+        return len(self._live)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            in_use = sum(1 for services in self._live.values() if services.active)
+        return {
+            'tenants': len(self.tenant_ids),
+            'live': len(self._live),
+            'in_use': in_use,
+            'max_live': self.max_live
+        }
@@ -2,23 +2,75 @@
 Provedor Twilio para WhatsApp
 """
 import logging
+import httpx
 from typing import Optional, Dict, Any
-from twilio.rest import Client
 from twilio.request_validator import RequestValidator
 from .whatsapp_provider import WhatsAppProvider
+from src.utils.logging_setup import get_logger
 
 logger = logging.getLogger(__name__)
+log = get_logger(__name__)
+
+TWILIO_API_URL = 'https://api.twilio.com'
 
 
 class TwilioProvider(WhatsAppProvider):
-    """Implementação Twilio para WhatsApp"""
+    """
+    Implementação Twilio para WhatsApp
+    
+    Envia pela API REST do Twilio com um httpx.AsyncClient (keep-alive e
+    pool de conexões próprios), sem bloquear o event loop como o
+    `twilio.rest.Client` síncrono.
+    """
     
-    def __init__(self, account_sid: str, auth_token: str, whatsapp_number: str):
+    name = 'twilio'
+    
+    def __init__(self, account_sid: str, auth_token: str, whatsapp_number: str,
+                 api_base_url: Optional[str] = None, pool_size: int = 100,
+                 connect_timeout: float = 5.0, timeout: float = 30.0):
         self.account_sid = account_sid
         self.auth_token = auth_token
         self.whatsapp_number = whatsapp_number
-        self.client = Client(account_sid, auth_token)
+        self.base_url = (api_base_url or TWILIO_API_URL).rstrip('/')
+        self.messages_url = f"{self.base_url}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.client = httpx.AsyncClient(
+            auth=(account_sid, auth_token),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            )
+        )
         self.validator = RequestValidator(auth_token)
+    
+    async def _create_message(self, to: str, body: str, media_url: Optional[str] = None) -> Dict[str, Any]:
+        """POST /Messages.json; retorna o resultado no formato do provedor"""
+        # Garantir formato WhatsApp
+        if not to.startswith('whatsapp:'):
+            to = f'whatsapp:{to}'
+        
+        form = {'From': self.whatsapp_number, 'To': to, 'Body': body}
+        if media_url:
+            form['MediaUrl'] = media_url
+        
+        response = await self.client.post(self.messages_url, data=form)
+        if response.status_code >= 400:
+            try:
+                error = response.json()
+                detail = f"{error.get('code', '')} {error.get('message', '')}".strip()
+            except ValueError:
+                detail = response.text
+            raise httpx.HTTPStatusError(
+                f"HTTP {response.status_code}: {detail}", request=response.request, response=response
+            )
+        
+        data = response.json()
+        return {
+            'success': True,
+            'message_id': data.get('sid', ''),
+            'status': data.get('status', ''),
+            'provider': 'twilio'
+        }
         
     async def send_message(self, to: str, message: str) -> Dict[str, Any]:
         """
@@ -32,24 +84,9 @@ class TwilioProvider(WhatsAppProvider):
             Dict com informações da mensagem enviada
         """
         try:
-            # Garantir formato WhatsApp
-            if not to.startswith('whatsapp:'):
-                to = f'whatsapp:{to}'
-            
-            msg = self.client.messages.create(
-                body=message,
-                from_=self.whatsapp_number,
-                to=to
-            )
-            
-            logger.info(f"Twilio message sent: {msg.sid}")
-            
-            return {
-                'success': True,
-                'message_id': msg.sid,
-                'status': msg.status,
-                'provider': 'twilio'
-            }
+            result = await self._create_message(to, message)
+            log.info("message_sent", provider="twilio", message_sid=result['message_id'])
+            return result
             
         except Exception as e:
             logger.error(f"Error sending Twilio message: {str(e)}")
@@ -62,24 +99,9 @@ class TwilioProvider(WhatsAppProvider):
     async def send_media(self, to: str, media_url: str, caption: Optional[str] = None) -> Dict[str, Any]:
         """Envia mídia via Twilio"""
         try:
-            if not to.startswith('whatsapp:'):
-                to = f'whatsapp:{to}'
-            
-            msg = self.client.messages.create(
-                body=caption or '',
-                from_=self.whatsapp_number,
-                to=to,
-                media_url=[media_url]
-            )
-            
-            logger.info(f"Twilio media sent: {msg.sid}")
-            
-            return {
-                'success': True,
-                'message_id': msg.sid,
-                'status': msg.status,
-                'provider': 'twilio'
-            }
+            result = await self._create_message(to, caption or '', media_url)
+            log.info("media_sent", provider="twilio", message_sid=result['message_id'])
+            return result
             
         except Exception as e:
             logger.error(f"Error sending Twilio media: {str(e)}")
@@ -89,6 +111,27 @@ class TwilioProvider(WhatsAppProvider):
                 'provider': 'twilio'
             }
     
+    async def warm_up(self) -> bool:
+        """Abre a conexão (TLS + keep-alive) consultando a própria conta"""
+        try:
+            response = await self.client.get(f"{self.base_url}/2010-04-01/Accounts/{self.account_sid}.json")
+            return response.status_code < 400
+        except httpx.HTTPError as e:
+            logger.warning(f"Twilio warm-up failed: {str(e)}")
+            return False
+    
+    async def health_check(self) -> bool:
+        """Conta Twilio acessível e ativa"""
+        response = await self.client.get(f"{self.base_url}/2010-04-01/Accounts/{self.account_sid}.json")
+        if response.status_code >= 400:
+            return False
+        return response.json().get('status', 'active') == 'active'
+    
+    @classmethod
+    def tenant_key(cls, request_data: Dict) -> str:
+        """Número WhatsApp de destino (só dígitos), um por tenant"""
+        return ''.join(c for c in request_data.get('To', '') if c.isdigit())
+    
     def validate_webhook(self, request_data: Dict) -> bool:
         """
         Valida webhook do Twilio
@@ -126,5 +169,10 @@ class TwilioProvider(WhatsAppProvider):
             'message': request_data.get('Body', '').strip(),
             'media_url': request_data.get('MediaUrl0', ''),
             'message_sid': request_data.get('MessageSid', ''),
+            'message_id': request_data.get('MessageSid', ''),
             'profile_name': request_data.get('ProfileName', '')
         }
+    
+    async def close(self):
+        """Fecha conexões HTTP"""
+        await self.client.aclose()
@@ -0,0 +1,81 @@
+"""
+Filtro de eventos dos webhooks da Evolution API
+
+A Evolution envia para o mesmo webhook eventos que não são mensagens
+(`messages.update`, `presence.update`, `connection.update`...). Eventos não
+assinados são respondidos lendo só o header `apikey` e o início do corpo,
+sem decodificar o JSON nem passar pelo parse da mensagem.
+"""
+import re
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from src.utils import metrics
+
+WEBHOOK_EVENTS = metrics.counter(
+    'whatsapp_webhook_events_total',
+    'Eventos de webhook da Evolution por tipo e decisão (accepted ou ignored)',
+    ('event', 'action')
+)
+
+# "event" e "instance" vêm no topo do payload, antes de "data"
+HEAD_BYTES = 512
+_EVENT = re.compile(rb'"event"\s*:\s*"([^"\\]{1,64})"')
+_INSTANCE = re.compile(rb'"instance"\s*:\s*"([^"\\]{1,128})"')
+# Nomes fora deste formato viram "other" na métrica (cardinalidade limitada)
+_EVENT_LABEL = re.compile(r'^[a-z0-9.]{1,40}$')
+
+
+def normalize_event(name: str) -> str:
+    """MESSAGES_UPSERT (webhook por evento) e messages.upsert -> messages.upsert"""
+    return name.strip().lower().replace('_', '.')
+
+
+class EvolutionEventFilter:
+    """
+    Responde eventos não assinados antes de decodificar o corpo
+
+    Args:
+        events: eventos processados (os demais recebem 200 "ignored")
+        resolve_tenant: tenant a partir de {'instance': ...}
+        api_key: chave esperada no header `apikey` para um tenant
+    """
+
+    def __init__(self, events: Iterable[str], resolve_tenant: Callable[[Dict], Optional[str]],
+                 api_key: Callable[[str], str]):
+        self.events = frozenset(normalize_event(event) for event in events)
+        self.resolve_tenant = resolve_tenant
+        self.api_key = api_key
+
+    @staticmethod
+    def peek(raw: bytes) -> Tuple[str, str]:
+        """(evento, instância) do início do corpo; '' quando não encontrados"""
+        head = raw[:HEAD_BYTES]
+        event = _EVENT.search(head)
+        instance = _INSTANCE.search(head)
+        return (normalize_event(event.group(1).decode('utf-8', 'replace')) if event else '',
+                instance.group(1).decode('utf-8', 'replace') if instance else '')
+
+    def screen(self, raw: bytes, headers) -> Optional[Tuple[int, Dict, str]]:
+        """
+        Resposta imediata para eventos não assinados
+
+        Returns:
+            (status, corpo JSON, resultado para whatsapp_webhooks_total) ou
+            None para seguir com a decodificação completa (evento assinado
+            ou não identificado no início do corpo)
+        """
+        event, instance = self.peek(raw)
+        if not event:
+            return None
+        if event in self.events:
+            WEBHOOK_EVENTS.labels(event, 'accepted').inc()
+            return None
+
+        tenant_id = self.resolve_tenant({'instance': instance})
+        if tenant_id is None:
+            return 404, {'error': 'Unknown tenant'}, 'unknown_tenant'
+        if headers.get('apikey', '') != self.api_key(tenant_id):
+            return 401, {'error': 'Unauthorized'}, 'unauthorized'
+
+        WEBHOOK_EVENTS.labels(event if _EVENT_LABEL.match(event) else 'other', 'ignored').inc()
+        return 200, {'status': 'ignored'}, 'ignored'
@@ -8,6 +8,8 @@ from typing import Optional, Dict, Any
 class WhatsAppProvider(ABC):
     """Interface para provedores de WhatsApp"""
     
+    name: str = 'unknown'  # Identificador do provedor (logs, métricas)
+    
     @abstractmethod
     async def send_message(self, to: str, message: str) -> Dict[str, Any]:
         """Envia mensagem de texto"""
@@ -18,6 +20,19 @@ class WhatsAppProvider(ABC):
         """Envia mídia (imagem, vídeo, documento)"""
         pass
     
+    async def warm_up(self) -> bool:
+        """Abre a conexão keep-alive com a API do provedor antes do primeiro envio"""
+        return True
+    
+    async def health_check(self) -> bool:
+        """Provedor pronto para enviar (usado pela verificação de prontidão)"""
+        return await self.warm_up()
+    
+    @classmethod
+    def tenant_key(cls, request_data: Dict) -> str:
+        """Chave de roteamento do webhook para o tenant (instância ou número de destino)"""
+        return ''
+    
     @abstractmethod
     def validate_webhook(self, request_data: Dict) -> bool:
         """Valida webhook recebido"""
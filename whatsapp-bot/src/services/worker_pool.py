@@ -0,0 +1,371 @@
+"""
+Pool de workers para processar mensagens fora do ciclo do webhook
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+import zlib
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from src.utils import tracing
+from src.utils.async_runner import run_coroutine
+from src.utils.logging_setup import bind_request
+
+logger = logging.getLogger(__name__)
+
+ERROR_REPLY = "❌ Desculpe, ocorreu um erro. Tente novamente mais tarde."
+
+
+class SenderLocks:
+    """
+    Exclusão por remetente no modo inline (o webhook processa e responde)
+
+    Mensagens seguidas do mesmo número esperam a anterior terminar, como nas
+    faixas do modo background, e nunca concorrem pela mesma sessão;
+    remetentes diferentes não se bloqueiam. O lock de um remetente só existe
+    enquanto houver mensagem dele em voo.
+
+    Args:
+        asynchronous: asyncio.Lock (event loop do ASGI) em vez de
+            threading.Lock (threads do gunicorn)
+    """
+
+    def __init__(self, asynchronous: bool = False):
+        self.asynchronous = asynchronous
+        # remetente -> [lock, mensagens do remetente em voo]
+        self._senders: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def hold(self, sender: str) -> AsyncIterator[None]:
+        with self._lock:
+            entry = self._senders.get(sender)
+            if entry is None:
+                lock = asyncio.Lock() if self.asynchronous else threading.Lock()
+                entry = self._senders[sender] = [lock, 0]
+            entry[1] += 1
+        try:
+            if self.asynchronous:
+                async with entry[0]:
+                    yield
+            else:
+                with entry[0]:
+                    yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._senders[sender]
+
+    def senders(self) -> int:
+        """Remetentes com mensagem em voo"""
+        return len(self._senders)
+
+
+class _PoolBase:
+    """Escolha do handler/dispatcher pelo tenant da mensagem"""
+
+    handler = None
+    dispatcher = None
+    tenants = None
+    admission = None
+    outbox = None
+
+    def _acquire(self, msg_data: Dict[str, str]):
+        """(serviços do tenant ou None, handler, dispatcher)"""
+        tenant_id = msg_data.get('tenant')
+        if tenant_id is None or self.tenants is None:
+            return None, self.handler, self.dispatcher
+        services = self.tenants.acquire_tenant(tenant_id)
+        return services, services.message_handler, services.outbound_dispatcher
+
+    def _release(self, services):
+        if services is not None:
+            self.tenants.release_tenant(services)
+
+    def _enqueue_reply(self, msg_data: Dict[str, str], reply: str) -> bool:
+        """
+        Grava a resposta no outbox (entrega em background, com retries)
+
+        A chave de idempotência é o ID da mensagem recebida: uma resposta
+        por mensagem. False se o outbox falhar (o chamador envia direto).
+        """
+        tenant = msg_data.get('tenant')
+        message_id = msg_data.get('message_id')
+        try:
+            self.outbox.enqueue(msg_data['from_number'], reply,
+                                key=f"{tenant}:reply:{message_id}" if message_id else None,
+                                tenant=tenant)
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao gravar resposta no outbox: {str(e)}")
+            return False
+
+    def _done(self):
+        """Mensagem concluída (ou descartada): devolve a vaga da admissão"""
+        if self.admission is not None:
+            self.admission.release()
+
+
+class MessageWorkerPool(_PoolBase):
+    """
+    Filas limitadas + workers que executam o MessageHandler
+
+    O webhook apenas enfileira a mensagem e responde imediatamente;
+    a resposta é enviada pelo worker via OutboundDispatcher (provedor
+    configurado + rate limit). Com `tenants` (o ServiceContainer), mensagens
+    marcadas com `tenant` usam o handler e o dispatcher daquele tenant. Com
+    `admission`, cada mensagem aceita devolve sua vaga ao terminar; com
+    `outbox`, a resposta é gravada no outbox em vez de enviada pelo worker.
+
+    Cada worker é uma "faixa" serial com fila própria. O remetente é
+    mapeado para uma faixa fixa por hash, então mensagens do mesmo número
+    são processadas em ordem e nunca concorrem pela mesma sessão, enquanto
+    remetentes diferentes rodam em paralelo.
+    """
+
+    def __init__(self, message_handler, dispatcher,
+                 num_workers: int = 4, queue_size: int = 1000,
+                 deadline_seconds: float = 30.0, send_timeout: float = 15.0, tenants=None,
+                 admission=None, outbox=None):
+        self.handler = message_handler
+        self.dispatcher = dispatcher
+        self.num_workers = max(1, num_workers)
+        self.deadline_seconds = deadline_seconds
+        self.send_timeout = send_timeout
+        self.tenants = tenants
+        self.admission = admission
+        self.outbox = outbox
+        lane_size = max(1, queue_size // self.num_workers)
+        self.lanes: List[queue.Queue] = [
+            queue.Queue(maxsize=lane_size) for _ in range(self.num_workers)
+        ]
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Inicia as threads de worker"""
+        if self._threads:
+            return
+        for i, lane in enumerate(self.lanes):
+            thread = threading.Thread(
+                target=self._worker, args=(lane,), name=f'message-lane-{i}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Pool de mensagens iniciado com {self.num_workers} workers")
+
+    def stop(self, timeout: float = 5.0):
+        """Sinaliza parada e aguarda os workers esvaziarem as faixas"""
+        for lane in self.lanes:
+            try:
+                lane.put_nowait(None)
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def lane_for(self, from_number: str) -> int:
+        """Faixa fixa do remetente (crc32 é estável entre processos)"""
+        return zlib.crc32(from_number.encode('utf-8')) % self.num_workers
+
+    def submit(self, msg_data: Dict[str, str]) -> bool:
+        """
+        Enfileira mensagem na faixa do remetente
+
+        Returns:
+            False se a faixa estiver cheia
+        """
+        lane = self.lane_for(msg_data['from_number'])
+        try:
+            # O span do webhook vai junto: contextvars não atravessam para a thread do worker
+            self.lanes[lane].put_nowait((time.monotonic(), msg_data, tracing.current()))
+            return True
+        except queue.Full:
+            logger.warning(f"Faixa {lane} cheia, mensagem rejeitada")
+            return False
+
+    def _worker(self, lane: queue.Queue):
+        while True:
+            item = lane.get()
+            try:
+                if item is None:
+                    return
+                enqueued_at, msg_data, parent = item
+                try:
+                    with tracing.span('worker.process', parent=parent,
+                                      queued_ms=round((time.monotonic() - enqueued_at) * 1000, 3)):
+                        self._process(enqueued_at, msg_data)
+                finally:
+                    self._done()
+            except Exception as e:
+                logger.error(f"Erro inesperado no worker: {str(e)}", exc_info=True)
+            finally:
+                lane.task_done()
+
+    def _process(self, enqueued_at: float, msg_data: Dict[str, str]):
+        from_number = msg_data['from_number']
+        bind_request(from_number, msg_data.get('message_id'))
+        waited = time.monotonic() - enqueued_at
+        if waited > self.deadline_seconds:
+            logger.warning(
+                f"Mensagem de {from_number} descartada após {waited:.1f}s na fila"
+            )
+            return
+
+        services, handler, dispatcher = self._acquire(msg_data)
+        try:
+            try:
+                reply = handler.process_message(msg_data['message'], from_number)
+            except Exception as e:
+                logger.error(f"Erro ao processar mensagem: {str(e)}", exc_info=True)
+                reply = ERROR_REPLY
+
+            if self.outbox is None or not self._enqueue_reply(msg_data, reply):
+                self._send_reply(dispatcher, from_number, reply)
+        finally:
+            self._release(services)
+
+    def _send_reply(self, dispatcher, to: str, reply: str) -> Optional[Dict]:
+        try:
+            result = run_coroutine(
+                dispatcher.send(to, reply),
+                timeout=self.send_timeout
+            )
+        except Exception as e:
+            logger.error(f"Erro ao enviar resposta para {to}: {str(e)}")
+            return None
+
+        if not result.get('success'):
+            logger.error(f"Falha ao enviar resposta para {to}: {result.get('error')}")
+        return result
+
+    def queue_depth(self) -> int:
+        """Total de mensagens aguardando em todas as faixas"""
+        return sum(lane.qsize() for lane in self.lanes)
+
+    def stats(self) -> Dict:
+        """Profundidade de cada faixa"""
+        return {
+            'lanes': self.num_workers,
+            'lane_capacity': self.lanes[0].maxsize,
+            'queue_depth': self.queue_depth(),
+            'lane_depths': [lane.qsize() for lane in self.lanes]
+        }
+
+
+class AsyncMessagePool(_PoolBase):
+    """
+    Equivalente do MessageWorkerPool para o modo ASGI
+
+    Cada mensagem vira uma task no event loop do servidor; um lock por
+    remetente mantém a ordem e a exclusão na sessão. O limite é de
+    mensagens pendentes (em processamento ou aguardando o lock), não de
+    threads, então milhares de conversas podem estar em voo ao mesmo tempo.
+    """
+
+    def __init__(self, message_handler, dispatcher, max_pending: int = 1000,
+                 deadline_seconds: float = 30.0, send_timeout: float = 15.0, tenants=None,
+                 admission=None, outbox=None):
+        self.handler = message_handler
+        self.dispatcher = dispatcher
+        self.max_pending = max(1, max_pending)
+        self.deadline_seconds = deadline_seconds
+        self.send_timeout = send_timeout
+        self.tenants = tenants
+        self.admission = admission
+        self.outbox = outbox
+        self.pending = 0
+        # remetente -> [lock, mensagens pendentes do remetente]
+        self._senders: Dict[str, list] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def start(self):
+        pass
+
+    def stop(self, timeout: float = 5.0):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def submit(self, msg_data: Dict[str, str]) -> bool:
+        """
+        Agenda o processamento (deve ser chamado no event loop)
+
+        Returns:
+            False se o limite de mensagens pendentes foi atingido
+        """
+        if self.pending >= self.max_pending:
+            logger.warning("Limite de mensagens pendentes atingido, mensagem rejeitada")
+            return False
+        self.pending += 1
+        task = asyncio.get_running_loop().create_task(self._run(time.monotonic(), msg_data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, enqueued_at: float, msg_data: Dict[str, str]):
+        from_number = msg_data['from_number']
+        entry = self._senders.get(from_number)
+        if entry is None:
+            entry = self._senders[from_number] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # A task herda o contexto do webhook: o span é filho do trace dele
+                with tracing.span('worker.process',
+                                  queued_ms=round((time.monotonic() - enqueued_at) * 1000, 3)):
+                    await self._process(enqueued_at, msg_data)
+        except Exception as e:
+            logger.error(f"Erro inesperado no processamento: {str(e)}", exc_info=True)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._senders[from_number]
+            self.pending -= 1
+            self._done()
+
+    async def _process(self, enqueued_at: float, msg_data: Dict[str, str]):
+        from_number = msg_data['from_number']
+        bind_request(from_number, msg_data.get('message_id'))
+        waited = time.monotonic() - enqueued_at
+        if waited > self.deadline_seconds:
+            logger.warning(
+                f"Mensagem de {from_number} descartada após {waited:.1f}s na fila"
+            )
+            return
+
+        services, handler, dispatcher = self._acquire(msg_data)
+        try:
+            try:
+                reply = await handler.process_message_async(msg_data['message'], from_number)
+            except Exception as e:
+                logger.error(f"Erro ao processar mensagem: {str(e)}", exc_info=True)
+                reply = ERROR_REPLY
+
+            # INSERT no SQLite/Redis em uma thread, fora do event loop
+            if self.outbox is not None and await asyncio.to_thread(self._enqueue_reply, msg_data, reply):
+                return
+            try:
+                result = await asyncio.wait_for(dispatcher.send(from_number, reply),
+                                                timeout=self.send_timeout)
+            except Exception as e:
+                logger.error(f"Erro ao enviar resposta para {from_number}: {str(e)}")
+                return
+            if not result.get('success'):
+                logger.error(f"Falha ao enviar resposta para {from_number}: {result.get('error')}")
+        finally:
+            self._release(services)
+
+    def queue_depth(self) -> int:
+        """Mensagens pendentes (em processamento ou aguardando a vez do remetente)"""
+        return self.pending
+
+    def stats(self) -> Dict:
+        return {
+            'max_pending': self.max_pending,
+            'queue_depth': self.pending,
+            'senders': len(self._senders)
+        }
@@ -0,0 +1,3 @@
+"""
+Pacote de utilitários
+"""
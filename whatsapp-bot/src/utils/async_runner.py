@@ -0,0 +1,123 @@
+"""
+Event loop em background para executar corrotinas a partir de código síncrono
+"""
+import asyncio
+import inspect
+import logging
+import threading
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLoop:
+    """Event loop dedicado rodando em uma thread daemon"""
+
+    def __init__(self, name: str = 'async-runner'):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Retorna o loop, iniciando a thread na primeira chamada"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(
+                        target=self._run, args=(loop,), name=self.name, daemon=True
+                    )
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def _run(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """
+        Usa um loop já em execução (ex: o do servidor ASGI) em vez da thread própria
+
+        Deve ser chamado antes do primeiro uso; assim clientes async usados
+        pelas threads (lembretes, prefetch) e pelas requisições ficam no mesmo loop.
+        """
+        with self._lock:
+            if self._loop is not None and self._loop is not loop:
+                raise RuntimeError("Loop em background já iniciado")
+            self._loop = loop
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Executa a corrotina no loop e bloqueia até o resultado
+
+        Raises:
+            concurrent.futures.TimeoutError: se o timeout expirar
+        """
+        loop = self.loop
+        if _running_loop() is loop:
+            raise RuntimeError("run() chamado de dentro do próprio loop; use await")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def submit(self, coro: Awaitable):
+        """Agenda a corrotina sem aguardar (retorna concurrent.futures.Future)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+# Loop compartilhado do processo (clientes async como httpx.AsyncClient
+# ficam presos ao loop em que foram usados pela primeira vez)
+background_loop = BackgroundLoop()
+
+
+def run_coroutine(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Executa uma corrotina no loop compartilhado do processo"""
+    return background_loop.run(coro, timeout)
+
+
+def resolve(value: Any, timeout: Optional[float] = None) -> Any:
+    """
+    Resultado de uma chamada que pode ser síncrona ou assíncrona
+
+    Permite que código em threads (lembretes, prefetch) use tanto o
+    APIClient quanto o AsyncAPIClient.
+    """
+    if inspect.isawaitable(value):
+        return background_loop.run(value, timeout)
+    return value
+
+
+def run_inline(coro: Awaitable) -> Any:
+    """
+    Executa uma corrotina que não suspende, na thread atual e sem event loop
+
+    Código escrito como corrotina (fluxo do handler, webhook) roda assim no
+    modo síncrono: com o APIClient nenhum `await` suspende, então a
+    corrotina termina no primeiro `send`.
+    """
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("Corrotina suspendeu em modo síncrono; use o event loop (AsyncAPIClient)")
+
+
+async def maybe_await(value: Any) -> Any:
+    """Aguarda o valor se for awaitable (AsyncAPIClient); senão o devolve (APIClient)"""
+    if inspect.isawaitable(value):
+        return await value
+    return value
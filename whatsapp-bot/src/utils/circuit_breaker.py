@@ -0,0 +1,83 @@
+"""
+Circuit breaker simples (fechado -> aberto -> meio-aberto)
+"""
+import threading
+import time
+from typing import Dict
+
+
+class CircuitBreaker:
+    """
+    Abre após `failure_threshold` falhas consecutivas e rejeita chamadas
+    por `recovery_timeout` segundos; depois libera uma chamada de teste
+    (meio-aberto) que fecha o circuito se tiver sucesso.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.rejections = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Indica se a chamada pode prosseguir"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    self.rejections += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            # Meio-aberto: apenas uma chamada de teste por vez
+            if self._trial_in_flight:
+                self.rejections += 1
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opens += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Libera a chamada de teste sem registrar resultado (chamada interrompida/cancelada)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'opens': self.opens,
+            'rejections': self.rejections
+        }
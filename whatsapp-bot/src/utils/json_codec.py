@@ -0,0 +1,24 @@
+"""
+JSON dos webhooks e dos spans (orjson, com fallback para o json padrão)
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # orjson está no requirements.txt, mas é opcional
+    orjson = None
+
+
+def loads(raw: Union[bytes, str]) -> Any:
+    """Decodifica JSON de bytes sem passar por str (ValueError se inválido)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps(value: Any) -> bytes:
+    """Codifica em JSON UTF-8 (tipos desconhecidos viram str)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')
@@ -0,0 +1,212 @@
+"""
+Logs estruturados (structlog) com escrita em thread de background
+
+O webhook só monta o dicionário do evento e o coloca em uma fila; a
+renderização (texto ou JSON), os tracebacks e a escrita no stdout acontecem
+na thread do QueueListener. Eventos abaixo do nível configurado são descartados antes
+de qualquer formatação.
+
+Uso no hot path:
+
+    log = get_logger(__name__)
+    log.info("webhook_received", provider="twilio", size=lambda: len(body))
+
+Campos com valor chamável são avaliados só se o evento for emitido.
+"""
+import atexit
+import hashlib
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import structlog
+
+from src.utils import metrics, tracing
+
+LOGS_DROPPED = metrics.counter(
+    'whatsapp_logs_dropped_total',
+    'Eventos de log descartados com a fila de logs cheia'
+)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira o registro como está, sem bloquear
+
+    A formatação fica para o listener (o `prepare` padrão formata na thread
+    que loga). O contexto do structlog (ids de correlação) é copiado aqui,
+    porque contextvars não atravessam para a thread do listener. Com a fila
+    cheia o evento é descartado e contado.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not isinstance(record.msg, dict):
+            record.context = structlog.contextvars.get_contextvars()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.inc()
+
+
+def _sample_info(rate: float):
+    """Registra só uma fração dos eventos INFO do structlog (WARNING+ sempre)"""
+
+    def processor(logger, method_name, event_dict):
+        if method_name == 'info' and rate < 1.0:
+            if random.random() >= rate:
+                raise structlog.DropEvent
+            event_dict['sample_rate'] = rate
+        return event_dict
+
+    return processor
+
+
+def _evaluate_lazy_fields(logger, method_name, event_dict):
+    for key, value in event_dict.items():
+        if callable(value):
+            event_dict[key] = value()
+    return event_dict
+
+
+def _capture_exc_info(logger, method_name, event_dict):
+    """Resolve `exc_info=True` na thread do erro; o traceback é formatado no listener"""
+    if event_dict.get('exc_info') is True:
+        event_dict['exc_info'] = sys.exc_info()
+    return event_dict
+
+
+def _format_time(created: float, text: bool) -> str:
+    """Hora local como o `asctime` do logging (texto) ou ISO 8601 em UTC (JSON)"""
+    if text:
+        moment = datetime.fromtimestamp(created)
+        return f"{moment:%Y-%m-%d %H:%M:%S},{moment.microsecond // 1000:03d}"
+    return datetime.fromtimestamp(created, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _timestamper(text: bool):
+    def processor(logger, method_name, event_dict):
+        event_dict['timestamp'] = _format_time(time.time(), text)
+        return event_dict
+
+    return processor
+
+
+def _foreign_context(text: bool):
+    """Timestamp e contexto dos registros do logging padrão (copiados no enqueue)"""
+
+    def processor(logger, method_name, event_dict):
+        record = event_dict['_record']
+        event_dict.setdefault('timestamp', _format_time(record.created, text))
+        for key, value in (getattr(record, 'context', None) or {}).items():
+            event_dict.setdefault(key, value)
+        return event_dict
+
+    return processor
+
+
+def _render_text(logger, method_name, event_dict) -> str:
+    """Linha "data - logger - NÍVEL - mensagem" do logging padrão, com os campos em chave=valor"""
+    timestamp = event_dict.pop('timestamp', '')
+    name = event_dict.pop('logger', '')
+    level = str(event_dict.pop('level', method_name)).upper()
+    message = event_dict.pop('event', '')
+    exception = event_dict.pop('exception', None)
+    line = f"{timestamp} - {name} - {level} - {message}"
+    if event_dict:
+        line += ' ' + ' '.join(f"{key}={value}" for key, value in event_dict.items())
+    return f"{line}\n{exception}" if exception else line
+
+
+def configure_logging(level: str = 'INFO', log_format: str = 'text',
+                      info_sample_rate: float = 1.0, queue_size: int = 10000):
+    """
+    Configura structlog e o logging padrão com fila + listener em background
+
+    `text` mantém o formato de sempre ("data - logger - NÍVEL - mensagem",
+    com os campos dos eventos structlog em chave=valor); `json` gera uma
+    linha JSON por evento. Os logs f-string existentes (logging.getLogger)
+    passam pelo mesmo pipeline e saem no mesmo formato. Chamadas repetidas
+    não fazem nada.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    text = log_format != 'json'
+    renderer = _render_text if text else structlog.processors.JSONRenderer(ensure_ascii=False)
+    formatter = structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=[
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.add_logger_name,
+            _foreign_context(text),
+        ],
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            renderer,
+        ]
+    )
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_NonBlockingQueueHandler(log_queue))
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            _sample_info(info_sample_rate),
+            structlog.contextvars.merge_contextvars,
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.add_logger_name,
+            _timestamper(text),
+            _evaluate_lazy_fields,
+            _capture_exc_info,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str):
+    return structlog.stdlib.get_logger(name)
+
+
+def conversation_id(from_number: str) -> str:
+    """Id estável da conversa sem expor o telefone nos logs"""
+    return hashlib.sha256(from_number.encode('utf-8')).hexdigest()[:12]
+
+
+def bind_request(from_number: str = '', message_id: Optional[str] = None):
+    """Ids de correlação do webhook/mensagem atual (substitui os anteriores)"""
+    structlog.contextvars.clear_contextvars()
+    context = {}
+    if from_number:
+        context['conversation_id'] = conversation_id(from_number)
+    if message_id:
+        context['message_id'] = message_id
+    span = tracing.current()
+    if span is not None:
+        context['trace_id'] = span.trace_id
+    if context:
+        structlog.contextvars.bind_contextvars(**context)
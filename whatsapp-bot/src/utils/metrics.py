@@ -0,0 +1,182 @@
+"""
+Métricas Prometheus (prometheus_client), agregadas entre workers
+
+Com `PROMETHEUS_MULTIPROC_DIR` definido, cada worker grava counters e
+histogramas em arquivos mmap nesse diretório (modo multiprocess do
+prometheus_client) e o /metrics soma os arquivos de todos os workers. Sem
+a variável, só o processo atual é exposto.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import disable_created_metrics, generate_latest, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Latências de 1 ms a 30 s (segundos)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Séries *_created não são somáveis entre workers
+disable_created_metrics()
+
+
+class FunctionGauge:
+    """
+    Valor lido de uma função (tamanho de fila, sessões...)
+
+    A função retorna um número ou None (métrica indisponível no worker,
+    ex: sessões no Redis, que já são compartilhadas). Com `labelnames`,
+    retorna um dict {valores dos labels (tupla): número}. O valor é copiado
+    para o Gauge do prometheus_client em `refresh` (a cada flush do worker e
+    antes de cada /metrics); o Gauge só é criado no primeiro valor, então um
+    worker que nunca tem o valor não aparece na soma.
+    """
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], object],
+                 labelnames: Sequence[str] = (), multiprocess_mode: str = 'livesum'):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labelnames = tuple(labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self._gauge: Optional[Gauge] = None
+        self._series: Set[Tuple[str, ...]] = set()
+
+    def refresh(self):
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning(f"Erro ao ler gauge {self.name}: {str(e)}")
+            value = None
+        if value is None:
+            if self._gauge is not None and not self.labelnames:
+                self._gauge.set(0)
+            return
+        if self._gauge is None:
+            self._gauge = Gauge(self.name, self.documentation, self.labelnames,
+                                multiprocess_mode=self.multiprocess_mode)
+        if not self.labelnames:
+            self._gauge.set(float(value))
+            return
+        series = {tuple(str(v) for v in values): float(v) for values, v in value.items()}
+        # Séries que sumiram ficam em zero (o arquivo mmap não remove séries)
+        for values in self._series - set(series):
+            self._gauge.labels(*values).set(0)
+        for values, v in series.items():
+            self._gauge.labels(*values).set(v)
+        self._series = set(series)
+
+
+_metrics: Dict[str, object] = {}
+_gauges: Dict[str, FunctionGauge] = {}
+_lock = threading.Lock()
+
+
+def _register(name: str, factory):
+    """Registrar o mesmo nome duas vezes devolve a métrica existente (declaração no import)"""
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = factory()
+        return metric
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(name, lambda: Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(name, lambda: Histogram(name, documentation, labelnames, buckets=buckets))
+
+
+def gauge(name: str, documentation: str, function: Callable[[], object],
+          labelnames: Sequence[str] = (), multiprocess_mode: str = 'livesum') -> FunctionGauge:
+    """
+    Registra (ou substitui a função de) um gauge
+
+    Args:
+        multiprocess_mode: soma entre workers vivos (`livesum`, padrão) ou,
+            para valores já compartilhados entre eles (ex: tamanho do outbox
+            em SQLite), `livemax`/`livemin`
+    """
+    with _lock:
+        existing = _gauges.get(name)
+        if existing is not None:
+            existing.function = function
+            return existing
+        gauge = _gauges[name] = FunctionGauge(name, documentation, function, labelnames, multiprocess_mode)
+        return gauge
+
+
+def refresh_gauges():
+    with _lock:
+        gauges = list(_gauges.values())
+    for function_gauge in gauges:
+        function_gauge.refresh()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsExporter:
+    """
+    /metrics no formato texto do Prometheus
+
+    No modo multiprocess os counters e histogramas já estão nos arquivos
+    mmap de cada worker; aqui ficam só os gauges (copiados a cada
+    `flush_interval_seconds`) e a coleta. Gauges de workers mortos saem da
+    soma (`mark_process_dead`, também feito no `child_exit` do gunicorn);
+    counters e histogramas deles continuam somados.
+    """
+
+    def __init__(self, directory: str = MULTIPROC_DIR, flush_interval_seconds: float = 5.0):
+        self.directory = directory
+        self.flush_interval_seconds = flush_interval_seconds
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Copia os gauges do worker periodicamente (só no modo multiprocess)"""
+        if not self.directory or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            refresh_gauges()
+            time.sleep(self.flush_interval_seconds)
+
+    def _remove_dead_gauges(self):
+        for name in os.listdir(self.directory):
+            if not name.startswith('gauge_live') or not name.endswith('.db'):
+                continue
+            pid = name[:-3].rsplit('_', 1)[-1]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                multiprocess.mark_process_dead(int(pid), self.directory)
+
+    def render(self) -> str:
+        """Métricas agregadas no formato de exposição texto do Prometheus"""
+        refresh_gauges()
+        if not self.directory:
+            return generate_latest(REGISTRY).decode('utf-8')
+        self._remove_dead_gauges()
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, self.directory)
+        return generate_latest(registry).decode('utf-8')
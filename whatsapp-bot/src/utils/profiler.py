@@ -0,0 +1,293 @@
+"""
+Profiler de amostragem sob demanda para o processamento das mensagens
+
+    with profiler.region():
+        ...  # process_message, APIClient._request
+
+Uma fração das mensagens (`rate`) ou todas durante uma janela (`seconds`)
+marcam a thread enquanto estão dentro de uma região; uma thread amostra as
+pilhas das threads marcadas a cada `interval_ms` (`sys._current_frames`) e
+agrega as pilhas no formato "folded" (`a;b;c 12`), aceito por
+flamegraph.pl, speedscope e inferno.
+
+O controle fica em um arquivo JSON no diretório de saída: o endpoint admin
+grava o arquivo e cada worker o relê (no máximo uma vez por segundo, na
+entrada de uma região), então ligar ou desligar não exige reiniciar os
+workers. Fora de uma sessão a região custa uma comparação de tempo.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+# Profundidade máxima das pilhas (o resto da base é cortado)
+MAX_DEPTH = 128
+
+_profiler: Optional['SamplingProfiler'] = None
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(_SRC_DIR):
+        path = 'src' + filename[len(_SRC_DIR):]
+    elif 'site-packages' in filename:
+        path = filename.split('site-packages' + os.sep, 1)[-1]
+    else:
+        path = os.path.basename(filename)
+    return f"{path}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """
+    Amostragem das threads dentro de `region()` com controle por arquivo
+
+    Args:
+        output_dir: diretório do arquivo de controle e dos perfis
+            (`profile-<sessão>-<pid>.folded` por worker, `profile-<sessão>.folded`
+            combinado em `merge`)
+        sample_rate: fração das regiões amostradas desde o boot (env)
+        seconds: amostra todas as regiões nos primeiros N segundos (env)
+        interval_ms: intervalo entre amostras
+        flush_seconds: intervalo de gravação do perfil do worker
+    """
+
+    def __init__(self, output_dir: str, sample_rate: float = 0.0, seconds: float = 0.0,
+                 interval_ms: float = 5.0, flush_seconds: float = 5.0):
+        self.output_dir = output_dir
+        self.control_path = os.path.join(output_dir, 'control.json')
+        self.interval_ms = interval_ms
+        self.flush_seconds = flush_seconds
+        self.started_at = time.time()
+        self.session = time.strftime('%Y%m%d-%H%M%S') if (sample_rate > 0 or seconds > 0) else ''
+        self.rate = min(max(sample_rate, 0.0), 1.0)
+        self.until = self.started_at + seconds if seconds > 0 else 0.0
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._control_mtime = 0.0
+        self._next_check = 0.0
+
+    # Controle
+    def _refresh(self):
+        """Relê o arquivo de controle se mudou (no máximo a cada segundo)"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + 1.0
+        try:
+            mtime = os.stat(self.control_path).st_mtime
+        except OSError:
+            return
+        # Arquivo de uma execução anterior não sobrescreve o env
+        if mtime == self._control_mtime or mtime < self.started_at:
+            return
+        self._control_mtime = mtime
+        try:
+            with open(self.control_path) as f:
+                control = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Arquivo de controle do profiler inválido: {str(e)}")
+            return
+        self._apply(control)
+
+    def _apply(self, control: Dict):
+        session = str(control.get('session') or '')
+        if session != self.session:
+            # Nova sessão: o perfil da anterior já foi gravado pelo sampler
+            with self._lock:
+                self.counts = Counter()
+                self.samples = 0
+        self.session = session
+        self.rate = float(control.get('rate') or 0.0)
+        self.until = float(control.get('until') or 0.0)
+        self.interval_ms = float(control.get('interval_ms') or self.interval_ms)
+        if self.active():
+            logger.info(f"Profiler ativo (sessão {self.session}): rate={self.rate}, "
+                        f"até {time.strftime('%H:%M:%S', time.localtime(self.until)) if self.until else '-'}")
+
+    def control(self, rate: float = 0.0, seconds: float = 0.0,
+                interval_ms: Optional[float] = None) -> Dict:
+        """
+        Inicia (ou encerra, com rate e seconds 0) uma sessão em todos os workers
+
+        Grava o arquivo de controle e aplica neste worker na hora; os demais
+        aplicam na próxima região.
+        """
+        active = rate > 0 or seconds > 0
+        control = {
+            'session': time.strftime('%Y%m%d-%H%M%S') if active else self.session,
+            'rate': min(max(rate, 0.0), 1.0),
+            'until': time.time() + seconds if seconds > 0 else 0.0,
+            'interval_ms': interval_ms or self.interval_ms,
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp = f"{self.control_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(control, f)
+        os.replace(tmp, self.control_path)
+        self._control_mtime = os.stat(self.control_path).st_mtime
+        self._apply(control)
+        return self.status()
+
+    def active(self) -> bool:
+        return self.rate > 0 or (self.until > 0 and time.time() < self.until)
+
+    # Regiões
+    def _selected(self) -> bool:
+        self._refresh()
+        if self.until > 0 and time.time() < self.until:
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+    @contextmanager
+    def region(self) -> Iterator[None]:
+        """Marca a thread atual para amostragem, se esta região for sorteada"""
+        ident = threading.get_ident()
+        # Só a própria thread inclui/remove seu ident: a leitura sem lock é segura.
+        # Dentro de uma região já marcada (ex: APIClient em process_message) não há novo sorteio.
+        if ident not in self._threads and not self._selected():
+            yield
+            return
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+                self._sampler.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[ident] -= 1
+                if self._threads[ident] == 0:
+                    del self._threads[ident]
+
+    # Amostragem
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while True:
+            time.sleep(self.interval_ms / 1000.0)
+            with self._lock:
+                idents = list(self._threads)
+                if not idents and not self.active():
+                    self._sampler = None
+                    break
+            if idents:
+                self._sample(idents)
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_seconds
+        self.flush()
+
+    def _sample(self, idents):
+        frames = sys._current_frames()
+        stacks = []
+        for ident in idents:
+            frame = frames.get(ident)
+            labels = []
+            ours = False
+            while frame is not None and len(labels) < MAX_DEPTH:
+                code = frame.f_code
+                if code.co_filename != _THIS_FILE and not code.co_filename.endswith('contextlib.py'):
+                    labels.append(_frame_label(code))
+                    ours = ours or code.co_filename.startswith(_SRC_DIR)
+                frame = frame.f_back
+            # Loop de eventos ocioso ou código de terceiros sem frame do bot: ignorado
+            if ours:
+                stacks.append(';'.join(reversed(labels)))
+        with self._lock:
+            self.counts.update(stacks)
+            self.samples += len(stacks)
+
+    def _path(self, session: str, pid: Optional[int] = None) -> str:
+        suffix = f"-{pid}" if pid is not None else ''
+        return os.path.join(self.output_dir, f"profile-{session}{suffix}.folded")
+
+    def flush(self):
+        """Grava o perfil acumulado deste worker (substitui o arquivo anterior)"""
+        with self._lock:
+            if not self.counts or not self.session:
+                return
+            lines = [f"{stack} {count}\n" for stack, count in self.counts.most_common()]
+            path = self._path(self.session, os.getpid())
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, 'w') as f:
+                f.writelines(lines)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Falha ao gravar perfil em {path}: {str(e)}")
+
+    def merge(self, session: Optional[str] = None) -> Optional[Dict]:
+        """
+        Soma os perfis dos workers de uma sessão em `profile-<sessão>.folded`
+
+        Inclui o que cada worker gravou até agora (a cada `flush_seconds`).
+        """
+        session = session or self.session
+        if not session:
+            return None
+        self.flush()
+        totals: Counter = Counter()
+        files = glob.glob(os.path.join(self.output_dir, f"profile-{session}-*.folded"))
+        for path in files:
+            with open(path) as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack and count.isdigit():
+                        totals[stack] += int(count)
+        path = self._path(session)
+        with open(path, 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in totals.most_common())
+        return {'path': path, 'workers': len(files), 'samples': sum(totals.values()),
+                'stacks': len(totals)}
+
+    def status(self) -> Dict:
+        return {
+            'session': self.session or None,
+            'active': self.active(),
+            'rate': self.rate,
+            'until': self.until or None,
+            'interval_ms': self.interval_ms,
+            'worker': {'pid': os.getpid(), 'samples': self.samples,
+                       'threads_profiled': len(self._threads)},
+        }
+
+
+def configure_profiler(output_dir: str, sample_rate: float = 0.0, seconds: float = 0.0,
+                       interval_ms: float = 5.0) -> Optional[SamplingProfiler]:
+    """Cria o profiler do processo (sem diretório de saída fica desativado)"""
+    global _profiler
+    if _profiler is None and output_dir:
+        _profiler = SamplingProfiler(output_dir, sample_rate, seconds, interval_ms)
+        # O sampler é daemon: grava o que faltou ao encerrar o worker
+        atexit.register(_profiler.flush)
+    return _profiler
+
+
+def get() -> Optional[SamplingProfiler]:
+    return _profiler
+
+
+@contextmanager
+def region() -> Iterator[None]:
+    """Região amostrável (nada se o profiler não estiver configurado)"""
+    if _profiler is None:
+        yield
+        return
+    with _profiler.region():
+        yield
@@ -0,0 +1,66 @@
+"""
+Rate limiting por token bucket
+"""
+import threading
+import time
+from typing import Dict, Hashable
+
+from src.utils.ttl_cache import TTLCache
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe com reserva
+
+    `reserve()` sempre consome um token e retorna quanto tempo o chamador
+    deve esperar até que ele exista (0 se havia saldo). Assim chamadas
+    concorrentes são espaçadas em fila, sem laço de polling.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Consome um token; retorna segundos de espera necessários"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self):
+        """Devolve um token reservado e não usado"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class KeyedTokenBuckets:
+    """Um TokenBucket por chave (ex: destinatário), com LRU e expiração por inatividade"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000, idle_seconds: float = 600.0):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(max_size=max_keys, ttl_seconds=idle_seconds, sliding=True)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = TokenBucket(self.rate, self.burst)
+                    self._buckets.set(key, bucket)
+        return bucket
+
+    def stats(self) -> Dict[str, int]:
+        return {'keys': len(self._buckets)}
@@ -0,0 +1,48 @@
+"""
+Medição das fases de inicialização (imports, construção, warm-up)
+"""
+import time
+from typing import Dict, Optional
+
+from src.utils import metrics
+
+
+class StartupTimer:
+    """
+    Cronômetro de fases do cold start
+
+    Cada `mark(fase)` registra o tempo desde a marca anterior; o relatório
+    vai para o log, para o /stats e para o gauge `whatsapp_startup_seconds`.
+    """
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self._last = self.started_at
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+        self._last = now
+        return elapsed
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started_at
+
+    def report(self) -> Dict:
+        return {
+            'phases': {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+            'total': round(self.total, 4)
+        }
+
+    def register_gauge(self):
+        """Exporta as fases no /metrics (um conjunto de séries por worker, label `pid` no multiprocess)"""
+        metrics.gauge(
+            'whatsapp_startup_seconds',
+            'Duração das fases de inicialização do worker',
+            lambda: {(phase,): seconds for phase, seconds in self.phases.items()},
+            ('phase',),
+            multiprocess_mode='liveall'
+        )
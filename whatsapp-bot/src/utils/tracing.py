@@ -0,0 +1,323 @@
+"""
+Tracing leve: um trace por webhook, com spans das chamadas à API e ao provedor
+
+Uso:
+
+    root = tracing.start('webhook', traceparent=headers.get('traceparent'), provider='twilio')
+    try:
+        with tracing.span('api.get_customer_by_phone', method='GET'):
+            ...
+    finally:
+        tracing.finish(root)
+
+A decisão de amostragem é tomada na raiz (`TRACING_SAMPLE_RATE`, ou o flag
+do `traceparent` recebido). Fora de um trace amostrado `span()` não cria
+nada, então o custo para as demais mensagens é uma leitura de contextvar.
+Os spans terminados vão para uma fila e são escritos por uma thread
+(arquivo JSONL ou POST em lote para um coletor), nunca no caminho do webhook.
+O trace id segue para o backend no header W3C `traceparent`.
+"""
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from src.utils import json_codec, metrics
+
+logger = logging.getLogger(__name__)
+
+SPANS_DROPPED = metrics.counter(
+    'whatsapp_trace_spans_dropped_total',
+    'Spans descartados com a fila do exportador cheia ou erro na escrita'
+)
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('trace_span', default=None)
+_tracer: Optional['Tracer'] = None
+
+
+class Span:
+    """Operação com início, duração e atributos; `error` quando termina com exceção"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_time', '_started',
+                 'duration_ms', 'attributes', 'error', '_token')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, **attributes):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {str(error)}"[:300]
+        if _tracer is not None:
+            _tracer.export(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start_time,
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class SpanExporter:
+    """
+    Fila + thread que escreve os spans em lote
+
+    Com a fila cheia o span é descartado e contado (o webhook nunca espera
+    pela escrita). Subclasses implementam `write`.
+    """
+
+    def __init__(self, queue_size: int = 10000, batch_size: int = 200, flush_seconds: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            SPANS_DROPPED.inc()
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            try:
+                item = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                continue
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(batch)
+            if item is None:
+                return
+
+    def _write(self, batch: List[Span]):
+        if not batch:
+            return
+        process = {'service': 'whatsapp-bot', 'pid': os.getpid()}
+        try:
+            self.write([dict(span.to_dict(), **process) for span in batch])
+        except Exception as e:
+            SPANS_DROPPED.inc(len(batch))
+            logger.warning(f"Falha ao exportar {len(batch)} spans: {str(e)}")
+
+    def write(self, spans: List[Dict]):
+        raise NotImplementedError
+
+    def close(self):
+        """Escreve o que estiver na fila e encerra a thread"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            return
+        self._thread.join(timeout=5)
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Um span por linha (JSONL) em um arquivo local
+
+    O arquivo é aberto em modo append e cada lote sai em uma única escrita,
+    então vários workers podem compartilhar o mesmo caminho.
+    """
+
+    def __init__(self, path: str, **options):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(**options)
+
+    def write(self, spans: List[Dict]):
+        data = b''.join(json_codec.dumps(span) + b'\n' for span in spans)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+
+class HttpSpanExporter(SpanExporter):
+    """POST de {"spans": [...]} para um coletor HTTP"""
+
+    def __init__(self, url: str, timeout: float = 5.0, **options):
+        import requests
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        super().__init__(**options)
+
+    def write(self, spans: List[Dict]):
+        response = self.session.post(self.url, data=json_codec.dumps({'spans': spans}),
+                                     headers={'Content-Type': 'application/json'},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Tracer:
+    """Amostragem na raiz e envio dos spans terminados ao exportador"""
+
+    def __init__(self, exporter: SpanExporter, sample_rate: float = 0.01):
+        self.exporter = exporter
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def export(self, span: Span):
+        self.exporter.put(span)
+
+
+def configure_tracing(sample_rate: float, exporter: str = 'file', file_path: str = '',
+                      collector_url: str = '', queue_size: int = 10000):
+    """
+    Ativa o tracing no processo (sample_rate 0 mantém desativado)
+
+    Chamadas repetidas não fazem nada.
+    """
+    global _tracer
+    if _tracer is not None or sample_rate <= 0:
+        return
+    if exporter == 'http':
+        if not collector_url:
+            raise ValueError("TRACING_COLLECTOR_URL é obrigatório com TRACING_EXPORTER=http")
+        span_exporter: SpanExporter = HttpSpanExporter(collector_url, queue_size=queue_size)
+    else:
+        span_exporter = FileSpanExporter(file_path, queue_size=queue_size)
+    _tracer = Tracer(span_exporter, sample_rate)
+    logger.info(f"Tracing ativo: {sample_rate:.1%} dos webhooks, exportador {exporter}")
+
+
+def current() -> Optional[Span]:
+    """Span ativo no contexto (None fora de um trace amostrado)"""
+    return _current.get()
+
+
+def start(name: str, traceparent: Optional[str] = None, **attributes) -> Optional[Span]:
+    """
+    Abre o span raiz de um trace e o torna o span ativo (fechar com `finish`)
+
+    Um `traceparent` recebido com o flag de amostragem continua aquele
+    trace; sem ele, a amostragem segue `TRACING_SAMPLE_RATE`.
+
+    Returns:
+        o span ou None se o trace não for amostrado (ou o tracing estiver desativado)
+    """
+    if _tracer is None:
+        return None
+    parent = _TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+    if parent is not None:
+        if not int(parent.group(3), 16) & 1:
+            return None
+        span = Span(name, parent.group(1), parent.group(2), **attributes)
+    elif _tracer.sampled():
+        span = Span(name, os.urandom(16).hex(), **attributes)
+    else:
+        return None
+    span._token = _current.set(span)
+    return span
+
+
+def finish(span: Optional[Span], error: Optional[BaseException] = None):
+    """Fecha o span de `start` e restaura o span ativo anterior"""
+    if span is None:
+        return
+    span.end(error)
+    if span._token is not None:
+        try:
+            _current.reset(span._token)
+        except ValueError:
+            # Fechado em outro contexto (ex: outra task): só limpa este
+            _current.set(None)
+        span._token = None
+
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Span filho do span ativo (ou de `parent`, quando ele vem de outra thread)
+
+    Sem trace amostrado, não cria nada e devolve None.
+    """
+    parent = parent or _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, **attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def child(name: str, **attributes) -> Optional[Span]:
+    """
+    Span filho do span ativo sem torná-lo ativo (fechar com `span.end()`)
+
+    Para operações folha (uma requisição HTTP) dentro de um try/finally já
+    existente. None fora de um trace amostrado.
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, **attributes)
+
+
+def annotate(**attributes):
+    """Acrescenta atributos ao span ativo (nada fora de um trace)"""
+    active = _current.get()
+    if active is not None:
+        active.attributes.update(attributes)
+
+
+def traceparent() -> Optional[str]:
+    """Header W3C `traceparent` do span ativo, para propagar ao backend"""
+    active = _current.get()
+    return active.traceparent() if active is not None else None
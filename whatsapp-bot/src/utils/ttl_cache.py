@@ -0,0 +1,93 @@
+"""
+Cache LRU em memória com expiração por TTL
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class TTLCache:
+    """
+    Cache LRU thread-safe com TTL por entrada
+
+    Args:
+        max_size: número máximo de entradas (a menos usada é descartada)
+        ttl_seconds: tempo de vida padrão das entradas
+        sliding: se True, cada leitura renova o TTL (expiração por inatividade)
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 60.0, sliding: bool = False):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.sliding = sliding
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retorna o valor ou `default` se ausente/expirado"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, ttl = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            if self.sliding:
+                self._data[key] = (value, now + ttl, ttl)
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Insere/atualiza entrada (ttl opcional sobrescreve o padrão)"""
+        ttl = self.ttl_seconds if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl, ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove e retorna a entrada"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def keys(self) -> List[Hashable]:
+        """Snapshot das chaves (inclui entradas ainda não removidas por expiração)"""
+        with self._lock:
+            return list(self._data.keys())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def purge_expired(self) -> int:
+        """Remove entradas expiradas; retorna quantas foram removidas"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, expires_at, _) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de uso do cache"""
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
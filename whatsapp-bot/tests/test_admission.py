@@ -0,0 +1,133 @@
+"""
+Controle de admissão: vagas reservadas a conversas em andamento e reuso
+da sessão lida na admissão
+"""
+import asyncio
+import json
+
+import pytest
+
+from src.config import Settings
+from src.container import ServiceContainer
+from src.pipeline import BotPipeline
+from src.services.admission import HIGH_DEMAND_REPLY, AdmissionController
+from src.services.session_store import ConversationSession, InMemorySessionStore
+
+
+def never_called():
+    raise AssertionError('a sessão não deveria ser consultada')
+
+
+def test_open_slots_do_not_look_up_the_session():
+    admission = AdmissionController(max_in_flight=3, reserved_for_active=1)
+    assert admission.admit(never_called)
+    assert admission.admit(never_called)
+    assert admission.stats()['in_flight'] == 2
+
+
+def test_reserved_slots_go_only_to_active_sessions():
+    admission = AdmissionController(max_in_flight=2, reserved_for_active=1)
+    assert admission.admit(never_called)
+    # Vagas livres esgotadas: remetente novo é recusado, conversa em andamento entra
+    assert not admission.admit(lambda: None)
+    assert admission.admit(lambda: ConversationSession(state='awaiting_date'))
+    # Orçamento todo em uso: recusa também a conversa em andamento
+    assert not admission.admit(lambda: ConversationSession(state='awaiting_date'))
+    assert admission.stats()['shed'] == {'active': 1, 'new': 1}
+
+
+def test_release_returns_the_slot():
+    admission = AdmissionController(max_in_flight=1, reserved_for_active=0)
+    assert admission.admit(never_called)
+    assert not admission.admit(lambda: None)
+    admission.release()
+    assert admission.admit(never_called)
+
+
+def test_session_lookup_error_counts_as_a_new_sender():
+    def broken():
+        raise ConnectionError('Redis fora')
+
+    admission = AdmissionController(max_in_flight=1, reserved_for_active=1)
+    assert not admission.admit(broken)
+    assert admission.stats()['shed'] == {'active': 0, 'new': 1}
+
+
+def test_async_admission_awaits_the_session_lookup():
+    async def active():
+        return ConversationSession(state='awaiting_date')
+
+    admission = AdmissionController(max_in_flight=1, reserved_for_active=1)
+    assert asyncio.run(admission.admit_async(active))
+    assert not asyncio.run(admission.admit_async(active))
+
+
+def test_zero_disables_the_limit():
+    admission = AdmissionController(max_in_flight=0)
+    assert all(admission.admit(never_called) for _ in range(1000))
+    assert AdmissionController().max_in_flight == 0
+
+
+# Pipeline: a sessão lida na admissão segue para o handler
+
+class CountingSessions(InMemorySessionStore):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, key):
+        self.reads += 1
+        return super().get(key)
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.sessions = CountingSessions()
+        self.received = []
+
+    async def process_message_async(self, message, from_number, offload=True, session=None):
+        self.received.append(session)
+        return f'eco {message}'
+
+
+@pytest.fixture
+def handler():
+    return RecordingHandler()
+
+
+@pytest.fixture
+def pipeline(handler):
+    # Nenhuma vaga livre: toda mensagem passa pela consulta da sessão
+    settings = Settings(whatsapp_provider='evolution', evolution_api_key='chave',
+                        evolution_instance_name='loja', startup_mode='lazy',
+                        admission_max_in_flight=1, admission_reserved_for_active=1)
+    services = ServiceContainer(settings)
+    services.message_handler = handler
+    return BotPipeline(services)
+
+
+def webhook(pipeline, number, message_id):
+    body = json.dumps({
+        'event': 'messages.upsert', 'instance': 'loja',
+        'data': {'key': {'remoteJid': f'{number}@s.whatsapp.net', 'id': message_id},
+                 'message': {'conversation': 'oi'}}
+    }).encode()
+    return asyncio.run(pipeline.webhook(body, {'apikey': 'chave'}, form=dict))
+
+
+def test_active_conversation_is_processed_with_the_admission_session(pipeline, handler):
+    handler.sessions.set('whatsapp:+5511999990000', ConversationSession(state='awaiting_date'))
+
+    reply = webhook(pipeline, '5511999990000', 'MSG1')
+    assert reply.body == {'reply': 'eco oi'}
+    assert handler.received[0].state == 'awaiting_date'
+    # Uma única leitura: a da admissão
+    assert handler.sessions.reads == 1
+    assert pipeline.services.admission.stats()['in_flight'] == 0
+
+
+def test_new_sender_is_shed_without_reaching_the_handler(pipeline, handler):
+    reply = webhook(pipeline, '5511988880000', 'MSG1')
+    assert reply.body == {'reply': HIGH_DEMAND_REPLY}
+    assert handler.received == []
+    assert pipeline.services.admission.stats()['shed'] == {'active': 0, 'new': 1}
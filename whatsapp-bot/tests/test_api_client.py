@@ -0,0 +1,221 @@
+"""
+APIClient: caches de clientes, horários e páginas de agendamentos
+"""
+import json
+from datetime import date, datetime
+
+import pytest
+import requests
+
+from src.services.api_client import APIClient
+
+
+class FakeTransport:
+    """Camada HTTP do APIClient com respostas por (método, caminho)"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.routes = {}
+        self.calls = []
+
+    def reply(self, method, path, body=None, status=200):
+        self.routes[(method, path)] = (status, body)
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        path = url.split('/api', 1)[1]
+        self.calls.append((method, path, kwargs.get('params')))
+        status, body = self.routes.get((method, path), (404, {'error': 'not found'}))
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response._content = json.dumps(body).encode()
+        return response
+
+    def count(self, method, path):
+        return sum(1 for call in self.calls if call[:2] == (method, path))
+
+
+@pytest.fixture
+def transport():
+    return FakeTransport()
+
+
+@pytest.fixture
+def client(transport):
+    return APIClient('http://backend/api', 'key', transport=transport)
+
+
+CUSTOMER = {'id': 'c1', 'name': 'Ana', 'phone': '+5511999990001'}
+
+
+# Clientes por telefone
+def test_customer_lookup_is_cached(client, transport):
+    transport.reply('GET', '/customers/phone/+5511999990001', CUSTOMER)
+    assert client.get_customer_by_phone('+5511999990001') == CUSTOMER
+    assert client.get_customer_by_phone('+5511999990001') == CUSTOMER
+    assert transport.count('GET', '/customers/phone/+5511999990001') == 1
+
+
+def test_not_found_is_cached_briefly(transport):
+    client = APIClient('http://backend/api', 'key', transport=transport, customer_negative_ttl=30)
+    assert client.get_customer_by_phone('+5511999990002') is None
+    assert client.get_customer_by_phone('+5511999990002') is None
+    assert transport.count('GET', '/customers/phone/+5511999990002') == 1
+
+
+def test_negative_cache_can_be_disabled(transport):
+    client = APIClient('http://backend/api', 'key', transport=transport, customer_negative_ttl=0)
+    client.get_customer_by_phone('+5511999990002')
+    client.get_customer_by_phone('+5511999990002')
+    assert transport.count('GET', '/customers/phone/+5511999990002') == 2
+
+
+def test_create_customer_replaces_negative_entry(client, transport):
+    assert client.get_customer_by_phone('+5511999990001') is None
+    transport.reply('POST', '/customers', CUSTOMER, status=201)
+    client.create_customer('Ana', '+5511999990001')
+    assert client.get_customer_by_phone('+5511999990001') == CUSTOMER
+    assert transport.count('GET', '/customers/phone/+5511999990001') == 1
+
+
+def test_failed_create_forgets_negative_entry(client, transport):
+    assert client.get_customer_by_phone('+5511999990001') is None
+    transport.reply('POST', '/customers', {'error': 'boom'}, status=500)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.create_customer('Ana', '+5511999990001')
+    # Estado desconhecido: a próxima busca vai à API
+    transport.reply('GET', '/customers/phone/+5511999990001', CUSTOMER)
+    assert client.get_customer_by_phone('+5511999990001') == CUSTOMER
+
+
+def test_server_errors_are_not_cached(client, transport):
+    transport.reply('GET', '/customers/phone/+5511999990001', {'error': 'boom'}, status=500)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.get_customer_by_phone('+5511999990001')
+    transport.reply('GET', '/customers/phone/+5511999990001', CUSTOMER)
+    assert client.get_customer_by_phone('+5511999990001') == CUSTOMER
+
+
+# Horários disponíveis
+SLOTS_10 = [{'startTime': '2030-05-10T09:00:00', 'endTime': '2030-05-10T10:00:00'}]
+SLOTS_11 = [{'startTime': '2030-05-11T09:00:00', 'endTime': '2030-05-11T10:00:00'}]
+
+
+@pytest.fixture
+def slots(transport):
+    transport.reply('GET', '/appointments/available', SLOTS_10)
+    return transport
+
+
+def slot_calls(transport, day):
+    return sum(1 for method, path, params in transport.calls
+               if path == '/appointments/available' and params['date'] == day)
+
+
+def test_slots_are_cached_per_date_and_resource(client, slots):
+    day = date(2030, 5, 10)
+    client.get_available_slots(day)
+    client.get_available_slots(day)
+    client.get_available_slots(day, resource_id='r1')
+    assert slot_calls(slots, '2030-05-10') == 2
+
+
+def test_refresh_bypasses_the_cache(client, slots):
+    day = date(2030, 5, 10)
+    client.get_available_slots(day)
+    client.get_available_slots(day, refresh=True)
+    assert slot_calls(slots, '2030-05-10') == 2
+
+
+def test_create_appointment_invalidates_only_its_date(client, slots):
+    client.get_available_slots(date(2030, 5, 10))
+    client.get_available_slots(date(2030, 5, 11))
+    slots.reply('POST', '/appointments', {'id': 'a1'}, status=201)
+    client.create_appointment('c1', datetime(2030, 5, 10, 9), datetime(2030, 5, 10, 10), 'Corte')
+    client.get_available_slots(date(2030, 5, 10))
+    client.get_available_slots(date(2030, 5, 11))
+    assert slot_calls(slots, '2030-05-10') == 2
+    assert slot_calls(slots, '2030-05-11') == 1
+
+
+def test_cancel_invalidates_the_date_of_a_backend_appointment(client, slots):
+    client.get_available_slots(date(2030, 5, 10))
+    client.get_available_slots(date(2030, 5, 11))
+    # Formato do AppointmentDto: scheduledAt/endsAt e status pelo nome do enum
+    slots.reply('DELETE', '/appointments/a1', {
+        'id': 'a1', 'customerId': 'c1', 'scheduledAt': '2030-05-11T09:00:00',
+        'endsAt': '2030-05-11T10:00:00', 'status': 'Cancelled'
+    })
+    client.cancel_appointment('a1')
+    client.get_available_slots(date(2030, 5, 10))
+    client.get_available_slots(date(2030, 5, 11))
+    assert slot_calls(slots, '2030-05-10') == 1
+    assert slot_calls(slots, '2030-05-11') == 2
+
+
+def test_cancel_without_body_invalidates_every_date(client, slots):
+    client.get_available_slots(date(2030, 5, 10))
+    slots.reply('DELETE', '/appointments/a1', None, status=200)
+    client.cancel_appointment('a1')
+    client.get_available_slots(date(2030, 5, 10))
+    assert slot_calls(slots, '2030-05-10') == 2
+
+
+def test_status_change_to_cancelled_is_case_insensitive(client, slots):
+    client.get_available_slots(date(2030, 5, 10))
+    client.get_available_slots(date(2030, 5, 11))
+    slots.reply('PATCH', '/appointments/a1/status',
+                {'id': 'a1', 'scheduledAt': '2030-05-10T09:00:00', 'status': 'Cancelled'})
+    client.update_appointment_status('a1', 'Cancelled')
+    client.get_available_slots(date(2030, 5, 10))
+    client.get_available_slots(date(2030, 5, 11))
+    assert slot_calls(slots, '2030-05-10') == 2
+    assert slot_calls(slots, '2030-05-11') == 1
+
+
+# Próximos agendamentos (paginação local)
+def backend_appointment(appointment_id, day, hour):
+    """AppointmentDto como a API serializa (UTC)"""
+    return {'id': appointment_id, 'customerId': 'c1', 'title': 'Corte',
+            'scheduledAt': f'2030-01-{day:02d}T{hour:02d}:00:00Z', 'status': 'Scheduled'}
+
+
+PAST = {'id': 'old', 'customerId': 'c1', 'scheduledAt': '2020-01-01T10:00:00Z', 'status': 'Completed'}
+
+
+def test_upcoming_sends_only_the_customer_filter(client, transport):
+    transport.reply('GET', '/appointments', [])
+    client.get_upcoming_appointments('c1', limit=2)
+    # Sem limit/startDate: a API não pagina e ignora startDate sem endDate
+    assert transport.calls[-1][2] == {'customerId': 'c1'}
+
+
+def test_upcoming_pages_locally_from_now_by_start(client, transport):
+    # Fora de ordem, com um passado e um no formato antigo (startTime)
+    transport.reply('GET', '/appointments', [
+        backend_appointment('b', 3, 9), PAST, backend_appointment('a', 2, 15),
+        {'id': 'c', 'customerId': 'c1', 'startTime': '2030-01-04T08:00:00+00:00'},
+    ])
+    first = client.get_upcoming_appointments('c1', limit=2)
+    assert [apt['id'] for apt in first['items']] == ['a', 'b']
+    assert first['next_cursor'] == '2030-01-03T09:00:00Z|b'
+
+    second = client.get_upcoming_appointments('c1', limit=2, cursor=first['next_cursor'])
+    assert [apt['id'] for apt in second['items']] == ['c']
+    assert second['next_cursor'] is None
+
+
+def test_upcoming_compares_instants_not_text(client, transport):
+    # 12:00-03:00 é 15:00Z: depois de 14:00Z, embora o texto seja "menor"
+    transport.reply('GET', '/appointments', [
+        {'id': 'late', 'customerId': 'c1', 'scheduledAt': '2030-01-02T12:00:00-03:00'},
+        backend_appointment('early', 2, 14),
+    ])
+    page = client.get_upcoming_appointments('c1', limit=5)
+    assert [apt['id'] for apt in page['items']] == ['early', 'late']
+
+
+def test_upcoming_first_page_skips_the_past():
+    page = APIClient._upcoming_page([PAST, backend_appointment('a', 2, 15)], limit=5, cursor=None,
+                                    now=datetime(2025, 1, 1))
+    assert [apt['id'] for apt in page['items']] == ['a']
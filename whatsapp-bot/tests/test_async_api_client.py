@@ -0,0 +1,135 @@
+"""
+AsyncAPIClient: GETs unificados (single-flight) e cancelamento dos chamadores
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from src.services.async_api_client import AsyncAPIClient
+from src.utils.circuit_breaker import CircuitBreaker
+
+CUSTOMER = {'id': 'c1', 'name': 'Ana', 'phone': '+5511999990001'}
+
+
+class Backend:
+    """Handler do httpx.MockTransport que segura as respostas até `release`"""
+
+    def __init__(self, status=200, body=None):
+        self.status = status
+        self.body = body if body is not None else CUSTOMER
+        self.requests = 0
+        self.cancelled = 0
+        self.gate = asyncio.Event()
+
+    async def __call__(self, request):
+        self.requests += 1
+        try:
+            await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return httpx.Response(self.status, json=self.body)
+
+    def release(self):
+        self.gate.set()
+
+
+def client_for(backend, **options):
+    client = AsyncAPIClient('http://backend/api', 'key', customer_cache_ttl=0, backoff_base=0,
+                            **options)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(backend))
+    return client
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_gets_share_one_request():
+    async def scenario():
+        backend = Backend()
+        client = client_for(backend)
+        calls = [asyncio.create_task(client.get_customer('c1')) for _ in range(3)]
+        await settle()
+        backend.release()
+        assert await asyncio.gather(*calls) == [CUSTOMER] * 3
+        assert backend.requests == 1
+        assert client.counters['coalesced'] == 2
+        # Terminada, a próxima chamada faz uma nova requisição
+        assert await client.get_customer('c1') == CUSTOMER
+        assert backend.requests == 2
+
+    run(scenario())
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        backend = Backend()
+        client = client_for(backend)
+        leader = asyncio.create_task(client.get_customer('c1'))
+        await settle()
+        followers = [asyncio.create_task(client.get_customer('c1')) for _ in range(2)]
+        await settle()
+        leader.cancel()
+        await settle()
+        backend.release()
+        assert await asyncio.gather(*followers) == [CUSTOMER] * 2
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert backend.requests == 1
+        assert backend.cancelled == 0
+
+    run(scenario())
+
+
+def test_request_is_cancelled_when_every_caller_gives_up():
+    async def scenario():
+        backend = Backend()
+        client = client_for(backend)
+        calls = [asyncio.create_task(client.get_customer('c1')) for _ in range(2)]
+        await settle()
+        for call in calls:
+            call.cancel()
+        await settle()
+        assert backend.cancelled == 1
+        assert not client._inflight
+
+    run(scenario())
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        backend = Backend(status=500, body={'error': 'boom'})
+        client = client_for(backend)
+        calls = [asyncio.create_task(client.get_customer('c1')) for _ in range(2)]
+        await settle()
+        backend.release()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        assert all(isinstance(result, httpx.HTTPStatusError) for result in results)
+        assert backend.requests == 1
+
+    run(scenario())
+
+
+def test_cancelled_trial_releases_the_half_open_breaker():
+    async def scenario():
+        backend = Backend()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        client = client_for(backend, breaker=breaker)
+        trial = asyncio.create_task(client.get_customer('c1'))
+        await settle()
+        trial.cancel()
+        await settle()
+        # Outra chamada pode ser a chamada de teste
+        backend.release()
+        assert await client.get_customer('c1') == CUSTOMER
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    run(scenario())
@@ -0,0 +1,134 @@
+"""
+IntervalSet: fusão, diferença e horários alinhados; AvailabilityEngine com
+agendamentos no formato da API
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from src.services.availability import AvailabilityEngine, IntervalSet
+
+DAY = datetime(2024, 5, 10)
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return DAY.replace(hour=hour, minute=minute)
+
+
+def test_merges_overlapping_and_adjacent_intervals():
+    intervals = IntervalSet([(at(13), at(15)), (at(8), at(10)), (at(9), at(11)),
+                             (at(11), at(12)), (at(16), at(16))])
+    assert list(intervals) == [(at(8), at(12)), (at(13), at(15))]
+
+
+def test_contains():
+    intervals = IntervalSet([(at(8), at(12)), (at(13), at(18))])
+    assert intervals.contains(at(8), at(9))
+    assert intervals.contains(at(11), at(12))
+    assert not intervals.contains(at(11, 30), at(13, 30))
+    assert not intervals.contains(at(7), at(8))
+
+
+def test_subtract_splits_and_trims():
+    working = IntervalSet([(at(8), at(12)), (at(13), at(18))])
+    busy = IntervalSet([(at(7), at(9)), (at(10), at(10, 30)), (at(11, 30), at(13, 30)),
+                        (at(17), at(19))])
+    assert list(working.subtract(busy)) == [
+        (at(9), at(10)), (at(10, 30), at(11, 30)), (at(13, 30), at(17))
+    ]
+
+
+def test_subtract_without_overlap_keeps_everything():
+    working = IntervalSet([(at(8), at(12))])
+    busy = IntervalSet([(at(6), at(8)), (at(12), at(14))])
+    assert list(working.subtract(busy)) == [(at(8), at(12))]
+    assert list(working.subtract(IntervalSet())) == [(at(8), at(12))]
+
+
+def test_subtract_everything():
+    working = IntervalSet([(at(8), at(10)), (at(11), at(12))])
+    assert len(working.subtract(IntervalSet([(at(0), at(23))]))) == 0
+
+
+def test_slots_are_aligned_to_duration():
+    free = IntervalSet([(at(8, 15), at(11)), (at(13), at(14, 30))])
+    assert free.slots(timedelta(minutes=60)) == [at(9), at(10), at(13)]
+    assert free.slots(timedelta(minutes=30)) == [
+        at(8, 30), at(9), at(9, 30), at(10), at(10, 30), at(13), at(13, 30), at(14)
+    ]
+
+
+def test_slots_limit_and_short_gaps():
+    free = IntervalSet([(at(8), at(12)), (at(14, 10), at(14, 50))])
+    assert free.slots(timedelta(hours=1), limit=2) == [at(8), at(9)]
+    # 40 minutos não cabem em um horário de 1 hora
+    assert free.slots(timedelta(hours=1)) == [at(8), at(9), at(10), at(11)]
+
+
+# AvailabilityEngine
+
+class FakeAPI:
+    def __init__(self, appointments):
+        self.appointments = appointments
+
+    def get_appointments(self, start, end, status=None):
+        return self.appointments
+
+
+def backend_appointment(appointment_id, scheduled_at, ends_at=None, status='Scheduled', **fields):
+    """AppointmentDto como a API serializa (enum pelo nome, horários em UTC)"""
+    appointment = {'id': appointment_id, 'scheduledAt': scheduled_at, 'status': status, **fields}
+    if ends_at:
+        appointment['endsAt'] = ends_at
+    return appointment
+
+
+def engine(appointments, **options):
+    # Sexta-feira, 08:00-12:00, horários de 1 hora, horário de Brasília
+    return AvailabilityEngine(FakeAPI(appointments), hours=['08:00-12:00'], slot_minutes=60,
+                              timezone='America/Sao_Paulo', **options)
+
+
+def free(availability, **kwargs):
+    return asyncio.run(availability.free_slots(at(0), at(23), **kwargs))
+
+
+def test_backend_appointments_occupy_their_local_time():
+    # 12:00Z-13:00Z = 09:00-10:00 em Brasília
+    availability = engine([backend_appointment('1', '2024-05-10T12:00:00Z', '2024-05-10T13:00:00Z')])
+    assert free(availability) == [at(8), at(10), at(11)]
+
+
+def test_cancelled_status_is_compared_case_insensitively():
+    availability = engine([
+        backend_appointment('1', '2024-05-10T12:00:00Z', '2024-05-10T13:00:00Z', status='Cancelled'),
+        backend_appointment('2', '2024-05-10T13:00:00Z', '2024-05-10T14:00:00Z', status='Confirmed'),
+    ])
+    assert free(availability) == [at(8), at(9), at(11)]
+
+
+def test_duration_is_used_without_ends_at():
+    availability = engine([backend_appointment('1', '2024-05-10T11:00:00Z', durationMinutes=120)])
+    assert free(availability) == [at(10), at(11)]
+
+
+def test_legacy_start_time_payload_is_still_read():
+    availability = engine([{'id': '1', 'startTime': '2024-05-10T10:00:00', 'endTime': '2024-05-10T11:00:00',
+                            'status': 'scheduled'}])
+    assert free(availability) == [at(8), at(9), at(11)]
+
+
+def test_resource_filter_is_applied_locally():
+    appointments = [
+        backend_appointment('1', '2024-05-10T11:00:00Z', '2024-05-10T12:00:00Z', resourceId='r1'),
+        backend_appointment('2', '2024-05-10T12:00:00Z', '2024-05-10T13:00:00Z', resourceId='r2'),
+    ]
+    assert free(engine(appointments), resource_id='r1') == [at(9), at(10), at(11)]
+    assert free(engine(appointments)) == [at(10), at(11)]
+
+
+def test_next_free_skips_busy_and_closed_days():
+    # Sexta 08:00-12:00 toda ocupada; sábado e domingo sem expediente
+    availability = engine([backend_appointment('1', '2024-05-10T11:00:00Z', '2024-05-10T15:00:00Z')],
+                          weekdays=[0, 1, 2, 3, 4])
+    slots = asyncio.run(availability.next_free(2, now=at(7)))
+    assert slots == [datetime(2024, 5, 13, 8), datetime(2024, 5, 13, 9)]
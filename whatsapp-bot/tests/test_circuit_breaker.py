@@ -0,0 +1,127 @@
+"""
+Circuit breaker e HttpTransport: o que abre o circuito e a chamada de teste do meio-aberto
+"""
+import pytest
+import requests
+
+from src.services.http_transport import BackendUnavailableError, HttpTransport
+from src.utils.circuit_breaker import CircuitBreaker
+
+
+def opened(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    opened(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['opens'] == 1
+
+
+def test_half_open_allows_one_trial():
+    breaker = opened(CircuitBreaker(failure_threshold=2, recovery_timeout=0))
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = opened(CircuitBreaker(failure_threshold=2, recovery_timeout=0))
+    assert breaker.allow()
+    breaker.recovery_timeout = 60
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_release_frees_the_trial():
+    breaker = opened(CircuitBreaker(failure_threshold=2, recovery_timeout=0))
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+class FakeSession:
+    """Sessão requests que devolve (ou levanta) uma sequência de resultados"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        return response
+
+
+def transport(*outcomes, threshold=2, retries=0):
+    http = HttpTransport(max_retries=retries, backoff_base=0,
+                         breaker=CircuitBreaker(failure_threshold=threshold, recovery_timeout=60))
+    http.session = FakeSession(*outcomes)
+    return http
+
+
+def test_application_500_does_not_open_the_circuit():
+    http = transport(500, 500, 500)
+    for _ in range(3):
+        assert http.request('GET', 'http://api/x').status_code == 500
+    assert http.breaker.state == CircuitBreaker.CLOSED
+    # Não é retentado
+    assert http.session.calls == 3
+
+
+@pytest.mark.parametrize('outcome', [503, requests.exceptions.ConnectionError('recusada'),
+                                     requests.exceptions.ReadTimeout('lenta')])
+def test_unavailability_opens_the_circuit(outcome):
+    http = transport(outcome, outcome)
+    for _ in range(2):
+        try:
+            http.request('POST', 'http://api/x')
+        except requests.exceptions.RequestException:
+            pass
+    assert http.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(BackendUnavailableError):
+        http.request('GET', 'http://api/x')
+    assert http.stats()['short_circuited'] == 1
+
+
+def test_idempotent_requests_retry_unavailability_only():
+    http = transport(503, 502, 200, threshold=5, retries=2)
+    assert http.request('GET', 'http://api/x').status_code == 200
+    assert http.stats()['retries'] == 2
+    assert http.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_non_network_errors_release_the_trial():
+    http = transport(503, requests.exceptions.TooManyRedirects('loop'), 200, threshold=1)
+    http.request('GET', 'http://api/x')
+    http.breaker.recovery_timeout = 0
+    with pytest.raises(requests.exceptions.TooManyRedirects):
+        http.request('GET', 'http://api/x')
+    # A chamada de teste foi liberada sem fechar nem reabrir o circuito
+    assert http.breaker.state == CircuitBreaker.HALF_OPEN
+    assert http.request('GET', 'http://api/x').status_code == 200
+    assert http.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_interrupted_trial_is_released():
+    http = transport(503, KeyboardInterrupt(), 200, threshold=1)
+    http.request('GET', 'http://api/x')
+    http.breaker.recovery_timeout = 0
+    with pytest.raises(KeyboardInterrupt):
+        http.request('GET', 'http://api/x')
+    assert http.request('GET', 'http://api/x').status_code == 200
@@ -0,0 +1,147 @@
+"""
+Deduplicação de webhooks: janela, `forget` e liberação do ID em erros
+"""
+import asyncio
+import json
+
+import pytest
+
+from src.config import Settings
+from src.container import ServiceContainer
+from src.pipeline import BotPipeline
+from src.services import deduplicator as deduplicator_module
+from src.services.deduplicator import MessageDeduplicator
+from src.services.session_store import InMemorySessionStore
+from src.utils import ttl_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_repeat_inside_the_window_is_a_duplicate(clock):
+    dedup = MessageDeduplicator(window_seconds=60)
+    assert not dedup.is_duplicate('MSG1')
+    assert dedup.is_duplicate('MSG1')
+    assert not dedup.is_duplicate('MSG2')
+    assert dedup.stats() == {'tracked': 2, 'duplicates': 1}
+
+
+def test_id_is_accepted_again_after_the_window(clock):
+    dedup = MessageDeduplicator(window_seconds=60)
+    assert not dedup.is_duplicate('MSG1')
+    clock[0] += 61
+    assert not dedup.is_duplicate('MSG1')
+
+
+def test_missing_id_or_disabled_window_never_deduplicates(clock):
+    assert not MessageDeduplicator().is_duplicate(None)
+    assert not MessageDeduplicator().is_duplicate('')
+    disabled = MessageDeduplicator(window_seconds=0)
+    assert not disabled.is_duplicate('MSG1')
+    assert not disabled.is_duplicate('MSG1')
+
+
+def test_forget_lets_the_retry_through(clock):
+    dedup = MessageDeduplicator(window_seconds=60)
+    dedup.is_duplicate('MSG1')
+    dedup.forget('MSG1')
+    assert not dedup.is_duplicate('MSG1')
+    assert asyncio.run(dedup.is_duplicate_async('MSG1'))
+    asyncio.run(dedup.forget_async('MSG1'))
+    assert not dedup.is_duplicate('MSG1')
+
+
+def test_redis_covers_other_workers_and_forget_clears_it(clock):
+    redis = FakeRedis()
+    first = MessageDeduplicator(window_seconds=60, redis_client=redis)
+    second = MessageDeduplicator(window_seconds=60, redis_client=redis)
+    assert not first.is_duplicate('MSG1')
+    assert second.is_duplicate('MSG1')
+
+    first.forget('MSG1')
+    assert redis.data == {}
+    assert not MessageDeduplicator(window_seconds=60, redis_client=redis).is_duplicate('MSG1')
+
+
+def test_redis_outage_falls_back_to_the_local_window(clock, monkeypatch):
+    class DownRedis:
+        def set(self, *args, **kwargs):
+            raise ConnectionError('down')
+
+    monkeypatch.setattr(deduplicator_module.logger, 'warning', lambda *args, **kwargs: None)
+    dedup = MessageDeduplicator(window_seconds=60, redis_client=DownRedis())
+    assert not dedup.is_duplicate('MSG1')
+    assert dedup.is_duplicate('MSG1')
+
+
+# Pipeline: o ID é liberado quando a resposta ao provedor é um erro
+
+class FlakyHandler:
+    def __init__(self, failures=1):
+        self.failures = failures
+        self.sessions = InMemorySessionStore()
+        self.calls = 0
+
+    async def process_message_async(self, message, from_number, offload=True, session=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError('API fora')
+        return f'eco {message}'
+
+
+def evolution_pipeline(handler):
+    settings = Settings(whatsapp_provider='evolution', evolution_api_key='chave',
+                        evolution_instance_name='loja', startup_mode='lazy')
+    services = ServiceContainer(settings)
+    services.message_handler = handler
+    return BotPipeline(services)
+
+
+def webhook(pipeline, message_id):
+    body = json.dumps({
+        'event': 'messages.upsert', 'instance': 'loja',
+        'data': {'key': {'remoteJid': '5511999990000@s.whatsapp.net', 'id': message_id},
+                 'message': {'conversation': 'oi'}}
+    }).encode()
+    return asyncio.run(pipeline.webhook(body, {'apikey': 'chave'}, form=dict))
+
+
+def test_provider_retry_after_an_error_is_processed(monkeypatch):
+    from src import pipeline as pipeline_module
+    monkeypatch.setattr(pipeline_module.logger, 'error', lambda *args, **kwargs: None)
+    handler = FlakyHandler(failures=1)
+    pipeline = evolution_pipeline(handler)
+
+    assert webhook(pipeline, 'MSG1').status == 500
+    # O reenvio do provedor não é descartado como duplicado
+    reply = webhook(pipeline, 'MSG1')
+    assert reply.status == 200
+    assert reply.body == {'reply': 'eco oi'}
+    assert handler.calls == 2
+
+
+def test_provider_retry_after_success_is_a_duplicate():
+    handler = FlakyHandler(failures=0)
+    pipeline = evolution_pipeline(handler)
+
+    assert webhook(pipeline, 'MSG1').body == {'reply': 'eco oi'}
+    assert webhook(pipeline, 'MSG1').body == {'status': 'duplicate'}
+    assert handler.calls == 1
@@ -0,0 +1,78 @@
+"""
+Métricas: registro idempotente, gauges por função e soma entre workers
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+from src.utils import metrics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = textwrap.dedent('''
+    import sys
+    from src.utils import metrics
+    amount = int(sys.argv[1])
+    metrics.counter('rollup_messages_total', 'Mensagens', ('outcome',)).labels('ok').inc(amount)
+    metrics.histogram('rollup_latency_seconds', 'Latência').observe(0.2)
+    metrics.gauge('rollup_queue_depth', 'Fila', lambda: amount)
+    metrics.refresh_gauges()
+    print('ready', flush=True)
+    if len(sys.argv) > 2:
+        sys.stdin.readline()
+''')
+
+SCRAPE = textwrap.dedent('''
+    from src.utils import metrics
+    print(metrics.MetricsExporter().render())
+''')
+
+
+def run_python(code, directory, *args, **kwargs):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+    return subprocess.Popen([sys.executable, '-c', code, *args], cwd=ROOT, env=env, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, **kwargs)
+
+
+def test_scrape_sums_counters_of_all_workers_and_gauges_of_live_ones(tmp_path):
+    directory = str(tmp_path)
+    finished = run_python(WORKER, directory, '2')
+    assert finished.communicate(timeout=30)[0].strip() == 'ready'
+    alive = run_python(WORKER, directory, '3', 'wait')
+    try:
+        assert alive.stdout.readline().strip() == 'ready'
+        output = run_python(SCRAPE, directory).communicate(timeout=30)[0]
+    finally:
+        alive.communicate('\n', timeout=30)
+
+    lines = set(output.splitlines())
+    # Counters e histogramas continuam somados depois que o worker sai
+    assert 'rollup_messages_total{outcome="ok"} 5.0' in lines
+    assert 'rollup_latency_seconds_count 2.0' in lines
+    # Gauges: só o worker vivo
+    assert 'rollup_queue_depth 3.0' in lines
+
+
+def test_registering_twice_returns_the_same_metric():
+    first = metrics.counter('test_registry_total', 'Teste', ('kind',))
+    assert metrics.counter('test_registry_total', 'Teste', ('kind',)) is first
+    first.labels('a').inc()
+    assert 'test_registry_total{kind="a"} 1.0' in metrics.MetricsExporter(directory='').render()
+
+
+def test_function_gauge_reports_labels_and_skips_unavailable_values():
+    depth = {'a': 2}
+    metrics.gauge('test_depth', 'Fila', lambda: {(k,): v for k, v in depth.items()}, ('lane',))
+    metrics.gauge('test_unavailable', 'Sem valor', lambda: None)
+
+    output = metrics.MetricsExporter(directory='').render()
+    assert 'test_depth{lane="a"} 2.0' in output
+    assert 'test_unavailable' not in output
+
+    # Série que some vai a zero
+    depth = {'b': 1}
+    metrics.gauge('test_depth', 'Fila', lambda: {(k,): v for k, v in depth.items()}, ('lane',))
+    output = metrics.MetricsExporter(directory='').render()
+    assert 'test_depth{lane="a"} 0.0' in output
+    assert 'test_depth{lane="b"} 1.0' in output
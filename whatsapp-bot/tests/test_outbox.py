@@ -0,0 +1,109 @@
+"""
+Outbox: reserva por destino, lease e retries (SQLiteOutboxStore)
+"""
+import time
+
+import pytest
+
+from src.services.outbox import FAILED, PENDING, SENT, Outbox, SQLiteOutboxStore
+
+LEASE = 60.0
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteOutboxStore(str(tmp_path / 'outbox.db'))
+
+
+def add(store, key, to='+5511999990001', tenant=None):
+    return store.add({'key': key, 'tenant': tenant, 'to': to, 'message': f'msg {key}'})
+
+
+def claim(store, now=None, limit=50):
+    return [item['key'] for item in store.claim(now or time.time() + 1, LEASE, limit)]
+
+
+def test_add_is_idempotent(store):
+    assert add(store, 'a')
+    assert not add(store, 'a')
+    assert store.pending() == 1
+
+
+def test_claims_one_message_per_destination_in_order(store):
+    add(store, 'a1', to='+551100000001')
+    add(store, 'b1', to='+551100000002')
+    add(store, 'a2', to='+551100000001')
+    add(store, 'a1-other-tenant', to='+551100000001', tenant='acme')
+    assert sorted(claim(store)) == ['a1', 'a1-other-tenant', 'b1']
+    # Reservadas e seguradas pela reserva: nada novo até o resultado
+    assert claim(store) == []
+
+
+def test_next_message_after_sent_or_failed(store):
+    add(store, 'a1')
+    add(store, 'a2')
+    add(store, 'a3')
+    assert claim(store) == ['a1']
+    store.mark_sent('a1', 'SM1', 'queued')
+    assert claim(store) == ['a2']
+    store.mark_failed('a2', 'invalid number')
+    assert claim(store) == ['a3']
+    assert store.get('a1')['status'] == SENT
+    assert store.get('a2')['status'] == FAILED
+
+
+def test_retry_holds_later_messages(store):
+    add(store, 'a1')
+    add(store, 'a2')
+    now = time.time() + 1
+    assert claim(store, now) == ['a1']
+    store.mark_retry('a1', now + 30, 'timeout')
+    # a2 está vencida, mas a1 ainda é a mais antiga pendente do destino
+    assert claim(store, now + 1) == []
+    assert claim(store, now + 31) == ['a1']
+
+
+def test_lease_expiry_makes_message_claimable_again(store):
+    add(store, 'a1')
+    now = time.time() + 1
+    first = store.claim(now, LEASE, 10)
+    assert [item['attempts'] for item in first] == [1]
+    assert claim(store, now + LEASE - 1) == []
+    second = store.claim(now + LEASE + 1, LEASE, 10)
+    assert [(item['key'], item['attempts']) for item in second] == [('a1', 2)]
+
+
+def test_claim_respects_limit(store):
+    for i in range(5):
+        add(store, f'k{i}', to=f'+55110000000{i}')
+    assert len(claim(store, limit=3)) == 3
+    assert len(claim(store, limit=3)) == 2
+
+
+def test_record_retries_then_fails(store):
+    outbox = Outbox(store, dispatcher=None, max_attempts=2, backoff_seconds=10.0)
+    add(store, 'a1')
+    now = time.time() + 1
+    item = store.claim(now, LEASE, 1)[0]
+    outbox._record(item, {'success': False, 'error': 'timeout'})
+    row = store.get('a1')
+    assert row['status'] == PENDING
+    assert row['last_error'] == 'timeout'
+    assert row['next_attempt_at'] >= now + 9
+    assert outbox.counters['retried'] == 1
+
+    item = store.claim(row['next_attempt_at'], LEASE, 1)[0]
+    assert item['attempts'] == 2
+    outbox._record(item, {'success': False, 'error': 'timeout'})
+    assert store.get('a1')['status'] == FAILED
+    assert outbox.counters['failed'] == 1
+
+
+def test_record_sent(store):
+    outbox = Outbox(store, dispatcher=None)
+    add(store, 'a1')
+    item = store.claim(time.time() + 1, LEASE, 1)[0]
+    outbox._record(item, {'success': True, 'message_id': 'SM1', 'status': 'queued'})
+    row = store.get('a1')
+    assert (row['status'], row['provider_message_id'], row['provider_status']) == (SENT, 'SM1', 'queued')
+    assert store.pending() == 0
@@ -0,0 +1,104 @@
+"""
+Token buckets (reserva e devolução) e limites do OutboundDispatcher
+"""
+import asyncio
+
+import pytest
+
+from src.services.outbound_dispatcher import OutboundDispatcher
+from src.utils import rate_limiter
+from src.utils.rate_limiter import KeyedTokenBuckets, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_burst_is_free_then_reservations_queue(clock):
+    bucket = TokenBucket(rate=2.0, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # Cada reserva seguinte espera meio segundo a mais
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_tokens_refill_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2.0, burst=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock[0] += 10
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_refund_returns_an_unused_reservation(clock):
+    bucket = TokenBucket(rate=1.0, burst=1)
+    bucket.reserve()
+    assert bucket.reserve() == pytest.approx(1.0)
+    bucket.refund()
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_refund_never_exceeds_capacity(clock):
+    bucket = TokenBucket(rate=1.0, burst=1)
+    bucket.refund()
+    bucket.refund()
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_zero_rate_is_unlimited(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.reserve() == 0 for _ in range(100))
+
+
+def test_keyed_buckets_are_independent(clock):
+    buckets = KeyedTokenBuckets(rate=1.0, burst=1)
+    assert buckets.get('a').reserve() == 0
+    assert buckets.get('b').reserve() == 0
+    assert buckets.get('a').reserve() == pytest.approx(1.0)
+    assert buckets.get('a') is buckets.get('a')
+
+
+class RecordingProvider:
+    name = 'fake'
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, to, message):
+        self.sent.append((to, message))
+        return {'success': True, 'message_id': f'm{len(self.sent)}'}
+
+
+def test_dispatcher_refunds_both_buckets_when_the_wait_is_too_long():
+    provider = RecordingProvider()
+    dispatcher = OutboundDispatcher(provider, provider_rate=100, provider_burst=100,
+                                    destination_rate=0.01, destination_burst=1,
+                                    max_wait_seconds=1)
+
+    async def scenario():
+        first = await dispatcher.send('+55', 'a')
+        second = await dispatcher.send('+55', 'b')
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first['success']
+    assert second == {'success': False, 'to': '+55', 'error': 'rate_limited', 'provider': 'fake'}
+    assert dispatcher.counters['rate_limited'] == 1
+    # O token global reservado para a mensagem descartada voltou
+    assert dispatcher.provider_bucket._tokens == pytest.approx(99, abs=0.1)
+    assert provider.sent == [('+55', 'a')]
+
+
+def test_dispatcher_batch_keeps_order():
+    provider = RecordingProvider()
+    dispatcher = OutboundDispatcher(provider, provider_rate=0, destination_rate=0)
+    results = asyncio.run(dispatcher.send_batch([{'to': f'+55{i}', 'message': str(i)} for i in range(5)]))
+    assert [result['to'] for result in results] == [f'+55{i}' for i in range(5)]
+    assert dispatcher.counters['sent'] == 5
@@ -0,0 +1,225 @@
+"""
+Lembretes: filtro de status, claim com lease e eleição de um único líder
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from src.services.reminder_engine import ReminderEngine, SQLiteReminderStore
+
+TZ = pytz.timezone('America/Sao_Paulo')
+
+
+class FakeAPI:
+    def __init__(self, appointments):
+        self.appointments = appointments
+        self.calls = []
+
+    def get_appointments(self, start, end, **filters):
+        self.calls.append(filters)
+        return list(self.appointments)
+
+    def get_customer(self, customer_id):
+        return {'id': customer_id, 'phone': f'+55{customer_id}'}
+
+
+class FakeDispatcher:
+    def __init__(self, success=True):
+        self.success = success
+        self.batches = []
+
+    async def send_batch(self, messages):
+        self.batches.append(messages)
+        return [{'success': self.success} for _ in messages]
+
+
+def appointment(appointment_id, minutes, status='Scheduled'):
+    """AppointmentDto como a API serializa"""
+    start = datetime.now(TZ) + timedelta(minutes=minutes)
+    return {'id': appointment_id, 'customerId': appointment_id, 'title': 'Corte',
+            'scheduledAt': start.isoformat(), 'endsAt': (start + timedelta(minutes=30)).isoformat(),
+            'status': status}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteReminderStore(str(tmp_path / 'reminders.db'))
+
+
+def engine_for(api, dispatcher, store):
+    # Antecedência maior que o início: todos os lembretes já estão vencidos
+    return ReminderEngine(api, dispatcher, store, lead_minutes=120, lookahead_minutes=180)
+
+
+def test_only_scheduled_and_confirmed_backend_appointments_are_reminded(store):
+    api = FakeAPI([appointment('1', 30), appointment('2', 40, 'Confirmed'),
+                   appointment('3', 50, 'Cancelled'), appointment('4', 60, 'Completed')])
+    dispatcher = FakeDispatcher()
+    engine = engine_for(api, dispatcher, store)
+    engine.elect()
+    engine.fetch()
+    engine.dispatch_due()
+
+    # O filtro de status é local: a busca por intervalo da API o ignora
+    assert all('status' not in call for call in api.calls)
+    sent = sorted(message['to'] for batch in dispatcher.batches for message in batch)
+    assert sent == ['+551', '+552']
+    assert all('Corte' in message['message'] for message in dispatcher.batches[0])
+
+
+def test_sent_reminder_is_completed_and_not_sent_again(store):
+    api = FakeAPI([appointment('1', 30)])
+    dispatcher = FakeDispatcher()
+    engine = engine_for(api, dispatcher, store)
+    engine.elect()
+    engine.fetch()
+    engine.dispatch_due()
+    engine.fetch()
+    engine.dispatch_due()
+
+    assert len(dispatcher.batches) == 1
+    assert engine.stats()['sent'] == 1
+
+
+def test_failed_send_releases_the_claim(store):
+    api = FakeAPI([appointment('1', 30)])
+    engine = engine_for(api, FakeDispatcher(success=False), store)
+    engine.elect()
+    engine.fetch()
+    engine.dispatch_due()
+
+    assert engine.stats()['failed'] == 1
+    key = next(iter(engine._pending))
+    assert not store.is_claimed(key)
+
+
+def test_claim_left_by_a_crash_is_retaken_after_the_lease(store):
+    assert store.claim('a:1', lease_seconds=0.05)
+    # Lease ativo: ninguém mais reserva
+    assert not store.claim('a:1', lease_seconds=60)
+    assert store.is_claimed('a:1')
+    time.sleep(0.1)
+    # O processo caiu antes de concluir: o lembrete volta
+    assert not store.is_claimed('a:1')
+    assert store.claim('a:1', lease_seconds=60)
+
+
+def test_completed_claim_is_never_retaken(store):
+    assert store.claim('a:1', lease_seconds=0.05)
+    store.complete('a:1', time.time() + 3600)
+    time.sleep(0.1)
+    assert store.is_claimed('a:1')
+    assert not store.claim('a:1', lease_seconds=60)
+
+
+def test_only_one_engine_leads(store):
+    api = FakeAPI([appointment('1', 30)])
+    first = engine_for(api, FakeDispatcher(), store)
+    second_dispatcher = FakeDispatcher()
+    second = engine_for(api, second_dispatcher, store)
+
+    assert first.elect()
+    assert not second.elect()
+    # Renovação pelo líder atual
+    assert first.elect()
+
+    second.fetch()
+    second.dispatch_due()
+    assert second_dispatcher.batches == []
+    assert second.stats()['leading'] is False
+
+
+def test_leadership_moves_when_the_lease_expires(store):
+    first = engine_for(FakeAPI([]), FakeDispatcher(), store)
+    second = engine_for(FakeAPI([]), FakeDispatcher(), store)
+    first.leader_ttl_seconds = 0.05
+
+    assert first.elect()
+    time.sleep(0.1)
+    assert second.elect()
+    # O antigo líder descobre na renovação e descarta o heap
+    assert not first.elect()
+    assert first.stats()['pending'] == 0
+
+
+class FakeTenant:
+    def __init__(self, api, dispatcher):
+        self.api_client = api
+        self.outbound_dispatcher = dispatcher
+
+
+class FakeTenants:
+    """ServiceContainer: tenant padrão e um tenant extra"""
+
+    def __init__(self, tenants):
+        self.tenants = tenants
+        self.active = 0
+
+    def tenant_ids(self):
+        return list(self.tenants)
+
+    def acquire_tenant(self, tenant_id):
+        self.active += 1
+        return self.tenants[tenant_id]
+
+    def release_tenant(self, services):
+        self.active -= 1
+
+
+def test_each_tenant_gets_reminders_through_its_own_clients(store):
+    default = FakeTenant(FakeAPI([appointment('1', 30)]), FakeDispatcher())
+    extra = FakeTenant(FakeAPI([appointment('1', 30), appointment('2', 40)]), FakeDispatcher())
+    tenants = FakeTenants({'default': default, 'loja': extra})
+    engine = ReminderEngine(None, None, store, lead_minutes=120, lookahead_minutes=180, tenants=tenants)
+    engine.elect()
+    engine.fetch()
+    engine.dispatch_due()
+
+    assert [m['to'] for batch in default.outbound_dispatcher.batches for m in batch] == ['+551']
+    assert sorted(m['to'] for batch in extra.outbound_dispatcher.batches for m in batch) == ['+551', '+552']
+    # Mesmo ID em tenants diferentes: lembretes distintos
+    assert engine.stats()['sent'] == 3
+    assert tenants.active == 0
+
+
+def test_tenant_fetch_error_keeps_its_scheduled_reminders(store):
+    class DownAPI(FakeAPI):
+        def get_appointments(self, start, end, **filters):
+            raise ConnectionError('API fora')
+
+    extra = FakeTenant(FakeAPI([appointment('1', 30)]), FakeDispatcher())
+    tenants = FakeTenants({'default': FakeTenant(FakeAPI([]), FakeDispatcher()), 'loja': extra})
+    # Lembrete ainda não vencido: fica no heap entre as buscas
+    engine = ReminderEngine(None, None, store, lead_minutes=10, lookahead_minutes=180, tenants=tenants)
+    engine.elect()
+    engine.fetch()
+    assert engine.stats()['pending'] == 1
+
+    extra.api_client = DownAPI([])
+    engine.fetch()
+    assert engine.stats()['pending'] == 1
+
+
+def test_outbox_reminders_carry_their_tenant(store):
+    class RecordingOutbox:
+        def __init__(self):
+            self.items = []
+
+        def enqueue(self, to, message, key=None, tenant=None):
+            self.items.append((tenant, key))
+
+    outbox = RecordingOutbox()
+    tenants = FakeTenants({'default': FakeTenant(FakeAPI([appointment('1', 30)]), FakeDispatcher()),
+                           'loja': FakeTenant(FakeAPI([appointment('1', 30)]), FakeDispatcher())})
+    engine = ReminderEngine(None, None, store, lead_minutes=120, lookahead_minutes=180,
+                            outbox=outbox, tenants=tenants)
+    engine.elect()
+    engine.fetch()
+    engine.dispatch_due()
+
+    keys = {tenant: key for tenant, key in outbox.items}
+    assert set(keys) == {'default', 'loja'}
+    assert keys['loja'].startswith('reminder:loja:')
+    assert not keys['default'].startswith('reminder:default:')
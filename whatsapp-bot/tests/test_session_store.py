@@ -0,0 +1,166 @@
+"""
+Sessões: codec versionado, store em memória e buffer de gravação do Redis
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from src.services.session_store import (
+    ConversationSession, InMemorySessionStore, NamespacedSessionStore, RedisSessionStore,
+    decode_session, encode_session
+)
+
+
+class FakeRedis:
+    """Comandos usados pelo RedisSessionStore, contando as idas ao servidor"""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+        self.fail = False
+        self.executed = threading.Event()
+
+    def getex(self, name, ex=None):
+        self.round_trips += 1
+        return self.data.get(name)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, name, value, ex=None):
+        self.commands.append((name, value))
+
+    def delete(self, name):
+        self.commands.append((name, None))
+
+    def execute(self):
+        self.redis.round_trips += 1
+        if self.redis.fail:
+            raise ConnectionError('redis fora')
+        for name, value in self.commands:
+            if value is None:
+                self.redis.data.pop(name, None)
+            else:
+                self.redis.data[name] = value
+        self.redis.executed.set()
+
+
+def wait_flushed(redis, store):
+    deadline = time.monotonic() + 2
+    while store._pending and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert not store._pending
+
+
+# Codec
+def test_round_trip_keeps_every_field():
+    session = ConversationSession(
+        state='aguardando_horario', customer_id='c1', customer_name='Ana Luísa',
+        date='2024-05-10', slot_times=('2024-05-10T09:00:00', '2024-05-10T10:00:00'),
+        slot_time='2024-05-10T09:00:00', updated_at=1715000000.5, cursor='page-2'
+    )
+    decoded = decode_session(encode_session(session))
+    assert decoded == session
+    assert isinstance(decoded.slot_times, tuple)
+
+
+def test_encoding_is_a_versioned_compact_array():
+    raw = encode_session(ConversationSession(state='aguardando_nome', customer_name='José',
+                                             updated_at=1.0))
+    assert raw == '[1,"aguardando_nome",null,"José",null,[],null,1.0,null]'
+
+
+def test_decodes_unversioned_payload_without_trailing_fields():
+    # Gravada antes do número de versão e antes de `cursor`
+    raw = json.dumps(['listando_agendamentos', 'c1', 'Ana', None, [], None, 1.0])
+    session = decode_session(raw)
+    assert session.state == 'listando_agendamentos'
+    assert session.customer_name == 'Ana'
+    assert session.slot_times == ()
+    assert session.cursor is None
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(ValueError):
+        decode_session('[99,"aguardando_nome"]')
+
+
+def test_empty_session_is_falsy_and_clear_resets_flow():
+    session = ConversationSession(state='aguardando_data', customer_id='c1',
+                                  slot_times=('2024-05-10T09:00:00',), cursor='x')
+    assert session
+    updated_at = session.updated_at
+    session.clear()
+    assert not session
+    assert session == ConversationSession(updated_at=updated_at)
+
+
+# Memória
+def test_memory_store_returns_copies():
+    store = InMemorySessionStore()
+    store.set('+55', ConversationSession(state='aguardando_nome'))
+    session = store.get('+55')
+    session.state = 'aguardando_data'
+    assert store.get('+55').state == 'aguardando_nome'
+
+
+def test_memory_store_size_ignores_expired_sessions():
+    store = InMemorySessionStore(ttl_seconds=0.05)
+    store.set('a', ConversationSession(state='aguardando_nome'))
+    store.set('b', ConversationSession(state='aguardando_nome'))
+    assert store.size() == 2
+    time.sleep(0.06)
+    store.set('c', ConversationSession(state='aguardando_nome'))
+    assert store.size() == 1
+
+
+# Redis
+def test_redis_message_costs_one_round_trip_on_the_request_path():
+    redis = FakeRedis()
+    store = RedisSessionStore(redis)
+    assert store.get('+55') is None
+    store.set('+55', ConversationSession(state='aguardando_nome'))
+    # A gravação não espera o Redis e a leitura seguinte vê o buffer
+    assert store.get('+55').state == 'aguardando_nome'
+    assert redis.executed.wait(2)
+    wait_flushed(redis, store)
+    assert decode_session(redis.data['astra:session:+55']).state == 'aguardando_nome'
+
+
+def test_redis_writes_are_coalesced_and_deletes_buffered():
+    redis = FakeRedis()
+    store = RedisSessionStore(redis)
+    redis.data['astra:session:+55'] = encode_session(ConversationSession(state='aguardando_data'))
+    store.delete('+55')
+    assert store.get('+55') is None
+    wait_flushed(redis, store)
+    assert 'astra:session:+55' not in redis.data
+
+
+def test_redis_buffer_is_kept_until_the_pipeline_succeeds():
+    redis = FakeRedis()
+    redis.fail = True
+    store = RedisSessionStore(redis, retry_seconds=0.01)
+    store.set('+55', ConversationSession(state='aguardando_nome'))
+    time.sleep(0.05)
+    assert store.get('+55').state == 'aguardando_nome'
+    redis.fail = False
+    wait_flushed(redis, store)
+    assert 'astra:session:+55' in redis.data
+
+
+def test_namespaced_store_prefixes_keys():
+    redis = FakeRedis()
+    store = NamespacedSessionStore(RedisSessionStore(redis), 'loja-a')
+    store.set('+55', ConversationSession(state='aguardando_nome'))
+    wait_flushed(redis, store.store)
+    assert list(redis.data) == ['astra:session:loja-a:+55']
+    assert store.get('+55').state == 'aguardando_nome'
@@ -0,0 +1,81 @@
+"""
+Resolução do fluxo de conversa (ConversationFlow e o FLOW do MessageHandler)
+"""
+import pytest
+
+from src.handlers.message_handler import (
+    AGUARDANDO_DATA, AGUARDANDO_HORARIO, AGUARDANDO_NOME, FLOW, LISTANDO_AGENDAMENTOS
+)
+from src.handlers.state_machine import IDLE, ConversationFlow, normalize
+
+
+def resolve(state, text):
+    return FLOW.resolve(state, normalize(text))
+
+
+def test_normalize_lowercases_and_collapses_spaces():
+    assert normalize('  Meus   AGENDAMENTOS \n') == 'meus agendamentos'
+
+
+@pytest.mark.parametrize('text, action', [('1', 'agendar'), ('2', 'listar'), ('3', 'cancelar')])
+def test_numeric_shortcuts_when_idle(text, action):
+    assert resolve(IDLE, text) == action
+    assert resolve(LISTANDO_AGENDAMENTOS, text) == action
+
+
+def test_numeric_shortcuts_are_options_inside_a_flow():
+    # Na escolha de horário, "1" é o primeiro horário da lista
+    assert resolve(AGUARDANDO_HORARIO, '1') == 'processar_horario'
+    assert resolve(AGUARDANDO_NOME, '2') == 'processar_nome'
+    assert resolve(AGUARDANDO_DATA, '3') == 'processar_data'
+
+
+def test_global_commands_win_over_state_default():
+    assert resolve(AGUARDANDO_NOME, 'menu') == 'menu'
+    assert resolve(AGUARDANDO_HORARIO, 'Ajuda') == 'ajuda'
+
+
+def test_state_scoped_inputs():
+    assert resolve(AGUARDANDO_DATA, 'próximos horários') == 'proximos_horarios'
+    assert resolve(AGUARDANDO_DATA, 'essa semana') == 'horarios_semana'
+    assert resolve(LISTANDO_AGENDAMENTOS, 'ver mais') == 'mais_agendamentos'
+    # Fora do estado, "mais" não é comando
+    assert resolve(IDLE, 'mais') is None
+
+
+def test_keyword_inside_sentence():
+    assert resolve(IDLE, 'quero agendar um horário') == 'agendar'
+    assert resolve(IDLE, 'quero ver meus agendamentos por favor') == 'listar'
+    assert resolve(AGUARDANDO_NOME, 'preciso cancelar') == 'cancelar'
+
+
+def test_keyword_matches_whole_words_only():
+    assert resolve(IDLE, 'reagendarx amanhã') is None
+    assert resolve(IDLE, 'agendamento') is None
+    # Par de palavras: "meus" sozinho não dispara
+    assert resolve(IDLE, 'meus dados') is None
+    # Sem palavra-chave, a entrada livre vai para a ação do estado
+    assert resolve(AGUARDANDO_NOME, 'Maria Reagendar') == 'processar_nome'
+
+
+def test_unknown_text_when_idle_has_no_action():
+    assert resolve(IDLE, 'bom dia') is None
+
+
+def test_exact_state_input_wins_over_global():
+    flow = (ConversationFlow()
+            .on('sim', action='global')
+            .on('sim', action='confirmar', states=('confirmando',)))
+    assert flow.resolve('confirmando', 'sim') == 'confirmar'
+    assert flow.resolve(IDLE, 'sim') == 'global'
+
+
+def test_scoped_keyword_only_in_its_state():
+    flow = ConversationFlow().on_keyword('trocar', action='trocar', states=('escolhendo',))
+    assert flow.resolve('escolhendo', 'quero trocar') == 'trocar'
+    assert flow.resolve(IDLE, 'quero trocar') is None
+
+
+def test_actions_lists_every_registered_action():
+    flow = ConversationFlow().on('a', action='x').on_keyword('b', action='y').state('s', 'z')
+    assert flow.actions() == {'x', 'y', 'z'}
@@ -0,0 +1,60 @@
+"""
+Filtro de eventos da Evolution: resposta sem decodificar o corpo
+"""
+import json
+
+import pytest
+
+from src.services.webhook_filter import HEAD_BYTES, EvolutionEventFilter, normalize_event
+
+KEYS = {'default': 'chave', 'loja': 'chave-loja'}
+INSTANCES = {'principal': 'default', 'loja-centro': 'loja'}
+
+
+@pytest.fixture
+def event_filter():
+    return EvolutionEventFilter(['MESSAGES_UPSERT'], lambda payload: INSTANCES.get(payload.get('instance')),
+                                KEYS.get)
+
+
+def body(event, instance='principal', data=None):
+    return json.dumps({'event': event, 'instance': instance, 'data': data or {}}).encode()
+
+
+def test_event_names_are_normalized():
+    assert normalize_event('MESSAGES_UPSERT') == 'messages.upsert'
+    assert normalize_event(' messages.update ') == 'messages.update'
+
+
+def test_subscribed_event_goes_on_to_the_full_parse(event_filter):
+    assert event_filter.screen(body('messages.upsert'), {'apikey': 'chave'}) is None
+    # Webhook por evento da Evolution usa o nome em maiúsculas
+    assert event_filter.screen(body('MESSAGES_UPSERT'), {}) is None
+
+
+def test_unsubscribed_event_is_ignored_with_the_tenant_key(event_filter):
+    assert event_filter.screen(body('presence.update'), {'apikey': 'chave'}) == (
+        200, {'status': 'ignored'}, 'ignored'
+    )
+    assert event_filter.screen(body('connection.update', 'loja-centro'), {'apikey': 'chave-loja'})[0] == 200
+
+
+def test_unsubscribed_event_still_checks_tenant_and_key(event_filter):
+    assert event_filter.screen(body('presence.update'), {'apikey': 'errada'})[0] == 401
+    # Chave de outro tenant não vale
+    assert event_filter.screen(body('presence.update', 'loja-centro'), {'apikey': 'chave'})[0] == 401
+    assert event_filter.screen(body('presence.update', 'desconhecida'), {'apikey': 'chave'})[0] == 404
+
+
+def test_body_without_event_in_the_head_goes_on_to_the_full_parse(event_filter):
+    assert event_filter.screen(b'', {}) is None
+    assert event_filter.screen(b'not json', {}) is None
+    # "event" depois dos primeiros bytes: decisão fica com o parse completo
+    late = b'{"data": "' + b'x' * HEAD_BYTES + b'", "event": "presence.update"}'
+    assert event_filter.screen(late, {'apikey': 'chave'}) is None
+
+
+def test_only_the_head_is_read(event_filter):
+    raw = body('presence.update', data={'payload': 'x' * 100000})
+    assert EvolutionEventFilter.peek(raw) == ('presence.update', 'principal')
+    assert event_filter.screen(raw, {'apikey': 'chave'})[2] == 'ignored'
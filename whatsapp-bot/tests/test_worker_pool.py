@@ -0,0 +1,141 @@
+"""
+Ordem por remetente: faixas do modo background e locks do modo inline
+"""
+import asyncio
+import random
+import threading
+import time
+
+from src.services.worker_pool import AsyncMessagePool, MessageWorkerPool, SenderLocks
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.processed = []
+        self.active = {}
+        self.overlaps = 0
+        self._lock = threading.Lock()
+
+    def _enter(self, from_number):
+        with self._lock:
+            self.active[from_number] = self.active.get(from_number, 0) + 1
+            if self.active[from_number] > 1:
+                self.overlaps += 1
+
+    def _leave(self, from_number, message):
+        with self._lock:
+            self.active[from_number] -= 1
+            self.processed.append((from_number, message))
+
+    def process_message(self, message, from_number):
+        self._enter(from_number)
+        time.sleep(random.uniform(0, 0.003))
+        self._leave(from_number, message)
+        return f'eco {message}'
+
+    async def process_message_async(self, message, from_number, offload=True):
+        self._enter(from_number)
+        await asyncio.sleep(random.uniform(0, 0.003))
+        self._leave(from_number, message)
+        return f'eco {message}'
+
+
+class RecordingOutbox:
+    def __init__(self):
+        self.replies = []
+
+    def enqueue(self, to, message, key=None, tenant=None):
+        self.replies.append((to, message))
+
+
+def messages(senders, count):
+    return [{'from_number': sender, 'message': str(i), 'message_id': f'{sender}-{i}'}
+            for i in range(count) for sender in senders]
+
+
+def per_sender(processed):
+    order = {}
+    for sender, message in processed:
+        order.setdefault(sender, []).append(message)
+    return order
+
+
+def test_lane_is_stable_per_sender():
+    pool = MessageWorkerPool(None, None, num_workers=4)
+    lanes = {pool.lane_for(f'+55119999900{i}') for i in range(50)}
+    assert lanes <= set(range(4))
+    assert pool.lane_for('+5511999990001') == pool.lane_for('+5511999990001')
+
+
+def test_worker_lanes_keep_sender_order():
+    handler, outbox = RecordingHandler(), RecordingOutbox()
+    pool = MessageWorkerPool(handler, None, num_workers=3, queue_size=300, outbox=outbox)
+    pool.start()
+    senders = [f'+55110000000{i}' for i in range(6)]
+    for msg in messages(senders, 10):
+        assert pool.submit(msg)
+    pool.stop()
+    assert handler.overlaps == 0
+    assert per_sender(handler.processed) == {sender: [str(i) for i in range(10)] for sender in senders}
+    assert len(outbox.replies) == 60
+
+
+def test_full_lane_rejects():
+    pool = MessageWorkerPool(RecordingHandler(), None, num_workers=1, queue_size=2)
+    assert pool.submit({'from_number': 'a', 'message': '1'})
+    assert pool.submit({'from_number': 'a', 'message': '2'})
+    assert not pool.submit({'from_number': 'a', 'message': '3'})
+    assert pool.stats()['lane_depths'] == [2]
+
+
+def test_async_pool_keeps_sender_order():
+    handler, outbox = RecordingHandler(), RecordingOutbox()
+
+    async def run():
+        pool = AsyncMessagePool(handler, None, max_pending=100, outbox=outbox)
+        for msg in messages(['a', 'b', 'c'], 8):
+            assert pool.submit(msg)
+        while pool.pending:
+            await asyncio.sleep(0.005)
+        assert pool.stats()['senders'] == 0
+
+    asyncio.run(run())
+    assert handler.overlaps == 0
+    assert per_sender(handler.processed) == {s: [str(i) for i in range(8)] for s in 'abc'}
+
+
+def test_sender_locks_serialize_one_sender_only():
+    locks = SenderLocks()
+    handler = RecordingHandler()
+
+    async def handle(sender, message):
+        async with locks.hold(sender):
+            handler.process_message(message, sender)
+
+    threads = [threading.Thread(target=lambda s=s, m=m: asyncio.run(handle(s, m)))
+               for m in range(5) for s in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert handler.overlaps == 0
+    assert len(handler.processed) == 10
+    assert locks.senders() == 0
+
+
+def test_async_sender_locks_let_other_senders_through():
+    locks = SenderLocks(asynchronous=True)
+    order = []
+
+    async def slow(sender, tag, delay):
+        async with locks.hold(sender):
+            await asyncio.sleep(delay)
+            order.append(tag)
+
+    async def run():
+        await asyncio.gather(slow('a', 'a1', 0.03), slow('a', 'a2', 0), slow('b', 'b1', 0))
+
+    asyncio.run(run())
+    # a2 espera a1; b1 não espera ninguém
+    assert order == ['b1', 'a1', 'a2']
+    assert locks.senders() == 0